@@ -0,0 +1,93 @@
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, List, Optional
+
+
+def content_hash(text: str) -> str:
+    """Return a stable hash for a piece of text"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def stream_hash(blocks: Iterable[str]) -> str:
+    """Hash text given as consecutive blocks; equals content_hash of their concatenation"""
+    digest = hashlib.sha256()
+    for block in blocks:
+        digest.update(block.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def chunk_hash(source: str, chunk: str) -> str:
+    """Return the vector store id for a chunk of a given source"""
+    return content_hash(f"{source}\x00{chunk}")
+
+
+class ChunkManifest:
+    """Record of which sources and chunks are currently in the vector store.
+
+    Each source is stored with the hash of its full content and the ordered
+    list of chunk ids (content hashes) that were embedded for it, so a rebuild
+    only has to touch sources whose content actually changed.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: str):
+        self.path = path
+        self.sources: Dict[str, Dict] = {}
+        # Bumped whenever the stored chunks change, so caches can tell stale results apart
+        self.revision = 0
+        self.loaded = self._load()
+
+    def _load(self) -> bool:
+        """Load the manifest from disk, returning False if none was found"""
+        if not os.path.exists(self.path):
+            return False
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable chunk manifest: {e}")
+            return False
+
+        if data.get('version') != self.VERSION:
+            return False
+
+        self.sources = data.get('sources', {})
+        self.revision = data.get('revision', 0)
+        return True
+
+    def save(self):
+        """Atomically write the manifest to disk"""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': self.VERSION, 'revision': self.revision, 'sources': self.sources}, f)
+        os.replace(tmp_path, self.path)
+
+    def source_hash(self, source: str) -> Optional[str]:
+        entry = self.sources.get(source)
+        return entry['hash'] if entry else None
+
+    def chunk_ids(self, source: str) -> List[str]:
+        entry = self.sources.get(source)
+        return list(entry['chunks']) if entry else []
+
+    def set_source(self, source: str, source_hash: str, chunk_ids: List[str]):
+        self.sources[source] = {'hash': source_hash, 'chunks': list(chunk_ids)}
+
+    def add_chunk(self, source: str, chunk_id: str):
+        """Record a chunk that was stored for a source still being synced"""
+        self.sources.setdefault(source, {'hash': None, 'chunks': []})['chunks'].append(chunk_id)
+
+    def remove_source(self, source: str) -> List[str]:
+        """Forget a source and return the chunk ids it owned"""
+        entry = self.sources.pop(source, None)
+        return list(entry['chunks']) if entry else []
+
+    def num_chunks(self) -> int:
+        return sum(len(entry['chunks']) for entry in self.sources.values())
+
+    def clear(self):
+        self.sources = {}
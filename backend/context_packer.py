@@ -0,0 +1,170 @@
+import math
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.lexical_index import tokenize
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate LLM token count (about four characters per token for English)"""
+    return math.ceil(len(text) / 4)
+
+
+def overlap_length(left: str, right: str, max_overlap: int, min_overlap: int) -> int:
+    """Length of the longest suffix of left that is also a prefix of right"""
+    limit = min(len(left), len(right), max_overlap)
+    for size in range(limit, min_overlap - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+class ContextPacker:
+    """Turns ranked retrieval results into a compact, token-budgeted prompt context.
+
+    Candidates are ordered by maximal marginal relevance (lexical similarity
+    between chunks stands in for embedding similarity, so packing needs no
+    model calls), then added greedily while the rendered context fits the
+    budget. Selected chunks that are adjacent in the same source are merged
+    with the text the splitter duplicated between them removed, and chunks
+    already contained in another selected chunk are dropped.
+    """
+
+    def __init__(self, mmr_lambda: float = 0.7, max_overlap: int = 400, min_overlap: int = 20):
+        self.mmr_lambda = mmr_lambda
+        self.max_overlap = max_overlap
+        self.min_overlap = min_overlap
+
+        self.requests = 0
+        self.tokens_before = 0
+        self.tokens_saved = 0
+        self.tokens_truncated = 0
+        self.tokens_after = 0
+        self._lock = threading.Lock()
+
+    def _mmr_order(self, results: List[Dict[str, Any]]) -> List[int]:
+        """Indices of results in maximal marginal relevance order"""
+        top_score = max((result.get('score') or 0.0 for result in results), default=0.0)
+        if top_score > 0:
+            relevance = [(result.get('score') or 0.0) / top_score for result in results]
+        else:
+            relevance = [1.0 / (rank + 1) for rank in range(len(results))]
+        terms = [set(tokenize(result['content'])) for result in results]
+
+        def similarity(i: int, j: int) -> float:
+            union = len(terms[i] | terms[j])
+            return len(terms[i] & terms[j]) / union if union else 0.0
+
+        order = []
+        max_similarity = [0.0] * len(results)
+        remaining = list(range(len(results)))
+        while remaining:
+            best = max(
+                remaining,
+                key=lambda i: self.mmr_lambda * relevance[i] - (1 - self.mmr_lambda) * max_similarity[i]
+            )
+            remaining.remove(best)
+            order.append(best)
+            for i in remaining:
+                max_similarity[i] = max(max_similarity[i], similarity(i, best))
+        return order
+
+    def _merge(self, chosen: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Merge adjacent chunks of a source and drop duplicated text, keeping selection order"""
+        by_source: Dict[str, List[Dict[str, Any]]] = {}
+        for position, result in enumerate(chosen):
+            chunk_id = result.get('chunk_id')
+            neighbours = by_source.setdefault(result['source'], [])
+            section = {
+                'source': result['source'],
+                'content': result['content'],
+                'first': chunk_id,
+                'last': chunk_id,
+                'position': position
+            }
+            neighbours.append(section)
+
+        merged = []
+        for neighbours in by_source.values():
+            neighbours.sort(key=lambda s: (s['first'] is None, s['first'] or 0))
+            current = None
+            for section in neighbours:
+                if (current is not None and current['last'] is not None and section['first'] is not None
+                        and section['first'] == current['last'] + 1):
+                    size = overlap_length(current['content'], section['content'], self.max_overlap, self.min_overlap)
+                    joiner = "" if size else "\n"
+                    current['content'] += joiner + section['content'][size:]
+                    current['last'] = section['last']
+                    current['position'] = min(current['position'], section['position'])
+                    continue
+                current = section
+                merged.append(current)
+
+        merged.sort(key=lambda s: s['position'])
+
+        # Drop sections whose text is already part of another one (e.g. the same file uploaded twice)
+        unique = []
+        for section in merged:
+            if any(section['content'] in other['content'] for other in unique):
+                continue
+            unique = [other for other in unique if other['content'] not in section['content']]
+            unique.append(section)
+        return sorted(unique, key=lambda s: s['position'])
+
+    @staticmethod
+    def _render(sections: List[Dict[str, Any]], header: str, separator: str) -> str:
+        return separator.join(header.format(source=s['source']) + s['content'] for s in sections)
+
+    def pack(self, results: List[Dict[str, Any]], token_budget: int,
+             header: str = "", separator: str = "\n\n") -> Tuple[str, Dict[str, Any]]:
+        """Return (context string, stats) for the ranked results within token_budget"""
+        naive = self._render(
+            [{'source': r['source'], 'content': r['content']} for r in results], header, separator
+        )
+        # Every candidate after merging and deduplication, before the budget applies
+        deduplicated = self._render(self._merge(results), header, separator)
+
+        chosen: List[Dict[str, Any]] = []
+        context = ""
+        for index in self._mmr_order(results):
+            trial = chosen + [results[index]]
+            rendered = self._render(self._merge(trial), header, separator)
+            if estimate_tokens(rendered) <= token_budget:
+                chosen = trial
+                context = rendered
+
+        if not chosen and results:
+            # Even the best chunk alone is over budget: keep its beginning
+            best = results[0]
+            prefix = header.format(source=best['source'])
+            context = prefix + best['content'][:max(0, token_budget * 4 - len(prefix))]
+
+        stats = {
+            'candidates': len(results),
+            'chunks_used': len(chosen) if chosen else min(1, len(results)),
+            'token_budget': token_budget,
+            'tokens_before': estimate_tokens(naive),
+            'tokens_after': estimate_tokens(context)
+        }
+        # Text removed by merging and deduplication, and text left out to fit the budget
+        tokens_deduplicated = min(estimate_tokens(deduplicated), stats['tokens_before'])
+        stats['tokens_saved'] = stats['tokens_before'] - tokens_deduplicated
+        stats['tokens_truncated'] = max(0, tokens_deduplicated - stats['tokens_after'])
+
+        with self._lock:
+            self.requests += 1
+            self.tokens_before += stats['tokens_before']
+            self.tokens_saved += stats['tokens_saved']
+            self.tokens_truncated += stats['tokens_truncated']
+            self.tokens_after += stats['tokens_after']
+        return context, stats
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        return {
+            'requests': self.requests,
+            'tokens_before': self.tokens_before,
+            'tokens_after': self.tokens_after,
+            'tokens_saved': self.tokens_saved,
+            'tokens_truncated': self.tokens_truncated,
+            'saved_ratio': self.tokens_saved / self.tokens_before if self.tokens_before else None
+        }
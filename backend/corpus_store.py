@@ -0,0 +1,337 @@
+import json
+import mmap
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# One fixed-size record per chunk slot: its source and where its text lies in the data file
+SLOT_DTYPE = np.dtype([('source', '<u4'), ('offset', '<u8'), ('length', '<u4')])
+# Source id of an unused slot
+FREE_SLOT = np.iinfo(np.uint32).max
+
+
+class CorpusStore:
+    """Chunk text kept once, in an append-only memory-mapped file.
+
+    The extracted text of each source is appended to a data file as UTF-8
+    and every chunk is a slot record (source id, byte offset, byte length)
+    pointing into it, so overlapping chunks share their bytes and only the
+    slot table is held in memory. Text is decoded from the memory map when
+    a search returns it; worker processes opening the same knowledge base
+    share those pages through the OS page cache.
+
+    Appends become visible to other processes at save(). Removing chunks
+    only frees their slots; save() rewrites the data file without the
+    unreferenced bytes once they make up most of it.
+    """
+
+    COMPACT_RATIO = 0.5
+    COMPACT_MIN_BYTES = 1024 * 1024
+
+    def __init__(self, directory: str, name: str = "corpus"):
+        self.directory = directory
+        self.name = name
+        self.meta_path = os.path.join(directory, f"{name}.json")
+
+        self.sources: List[str] = []
+        self._source_ids: Dict[str, int] = {}
+        self._chunk_ids: List[Optional[str]] = []
+        self._slots: Dict[str, int] = {}
+        self._records = np.zeros(0, dtype=SLOT_DTYPE)
+        self._free: List[int] = []
+        self._generation = 0
+        self._size = 0
+        # Every save writes a new slot file; the metadata names the current one
+        self._saves = 0
+        self._slots_file: Optional[str] = None
+        # Data files of earlier generations, deleted once the metadata no longer points at them
+        self._retired: List[str] = []
+
+        self._appender = None
+        self._map = None
+        self._mapped_size = 0
+        self._dirty = False
+        # Builds append and remove while requests read
+        self._lock = threading.RLock()
+        self.loaded = self._load()
+
+    @property
+    def data_path(self) -> str:
+        return os.path.join(self.directory, f"{self.name}.{self._generation}.dat")
+
+    @property
+    def slots_path(self) -> str:
+        return os.path.join(self.directory, f"{self.name}.slots.{self._saves}.npy")
+
+    def _load(self) -> bool:
+        if not os.path.exists(self.meta_path):
+            return False
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            # Stores saved before slot files were numbered have a single one
+            slots_file = meta.get('slots', f"{self.name}.slots.npy")
+            records = np.load(os.path.join(self.directory, slots_file))
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable corpus store: {e}")
+            return False
+
+        self._generation = meta['generation']
+        if records.dtype != SLOT_DTYPE or len(records) != len(meta['chunk_ids']) \
+                or not os.path.exists(self.data_path) or os.path.getsize(self.data_path) < meta['size']:
+            print("Ignoring corpus store whose slots and data file disagree")
+            self._generation = 0
+            return False
+
+        self.sources = meta['sources']
+        self._source_ids = {source: i for i, source in enumerate(self.sources)}
+        self._chunk_ids = meta['chunk_ids']
+        self._slots = {chunk_id: slot for slot, chunk_id in enumerate(self._chunk_ids) if chunk_id is not None}
+        self._free = [slot for slot, chunk_id in enumerate(self._chunk_ids) if chunk_id is None]
+        self._records = records
+        self._size = meta['size']
+        self._saves = meta.get('saves', 0)
+        self._slots_file = slots_file
+        # Map the data file right away, so reads keep working if another process compacts it
+        self._view()
+        return True
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self._slots
+
+    def ids(self) -> List[str]:
+        with self._lock:
+            return list(self._slots)
+
+    def _writer(self):
+        if self._appender is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._unmap()
+            self._appender = open(self.data_path, 'a+b')
+            # Drop anything appended after the last save, e.g. by an aborted build
+            self._appender.truncate(self._size)
+        return self._appender
+
+    def _view(self) -> Optional[mmap.mmap]:
+        """Read-only map of the data file, remapped when appends outgrew it"""
+        if self._mapped_size < self._size:
+            if self._appender is not None:
+                self._appender.flush()
+            self._unmap()
+            with open(self.data_path, 'rb') as f:
+                self._map = mmap.mmap(f.fileno(), self._size, access=mmap.ACCESS_READ)
+            self._mapped_size = self._size
+        return self._map
+
+    def _unmap(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._mapped_size = 0
+
+    def append_text(self, blocks: Iterable[str]) -> Tuple[int, int]:
+        """Append text given as consecutive blocks; returns its (offset, length) in bytes"""
+        with self._lock:
+            f = self._writer()
+            offset = self._size
+            for block in blocks:
+                data = block.encode('utf-8')
+                f.write(data)
+                self._size += len(data)
+            self._dirty = True
+            return offset, self._size - offset
+
+    def find(self, text: str, start: int, end: int) -> Optional[Tuple[int, int]]:
+        """(offset, length) of the first occurrence of text within bytes [start, end), if any"""
+        data = text.encode('utf-8')
+        with self._lock:
+            view = self._view()
+            offset = view.find(data, start, end) if view is not None else -1
+        return (offset, len(data)) if offset >= 0 else None
+
+    def put(self, chunk_id: str, source: str, offset: int, length: int):
+        """Point a chunk at bytes already in the data file"""
+        with self._lock:
+            source_id = self._source_ids.get(source)
+            if source_id is None:
+                source_id = self._source_ids[source] = len(self.sources)
+                self.sources.append(source)
+
+            slot = self._slots.get(chunk_id)
+            if slot is None:
+                slot = self._free.pop() if self._free else self._new_slot()
+                self._slots[chunk_id] = slot
+                self._chunk_ids[slot] = chunk_id
+            self._records[slot] = (source_id, offset, length)
+            self._dirty = True
+
+    def _new_slot(self) -> int:
+        slot = len(self._chunk_ids)
+        if slot >= len(self._records):
+            records = np.zeros(max(64, 2 * len(self._records)), dtype=SLOT_DTYPE)
+            records[:slot] = self._records[:slot]
+            self._records = records
+        self._chunk_ids.append(None)
+        return slot
+
+    def add(self, chunk_id: str, source: str, text: str):
+        """Store a chunk's text on its own, for chunks not found in their source's text"""
+        with self._lock:
+            self.put(chunk_id, source, *self.append_text([text]))
+
+    def remove(self, chunk_id: str):
+        with self._lock:
+            slot = self._slots.pop(chunk_id, None)
+            if slot is None:
+                return
+            self._chunk_ids[slot] = None
+            self._records[slot] = (FREE_SLOT, 0, 0)
+            self._free.append(slot)
+            self._dirty = True
+
+    def text(self, chunk_id: str) -> Optional[str]:
+        with self._lock:
+            slot = self._slots.get(chunk_id)
+            if slot is None:
+                return None
+            offset, length = int(self._records[slot]['offset']), int(self._records[slot]['length'])
+            if not length:
+                return ""
+            return self._view()[offset:offset + length].decode('utf-8', errors='replace')
+
+    def source(self, chunk_id: str) -> Optional[str]:
+        with self._lock:
+            slot = self._slots.get(chunk_id)
+            return self.sources[int(self._records[slot]['source'])] if slot is not None else None
+
+    def clear(self):
+        """Drop every chunk; the data file is replaced by an empty one at the next save"""
+        with self._lock:
+            self._retire()
+            self.sources = []
+            self._source_ids = {}
+            self._chunk_ids = []
+            self._slots = {}
+            self._records = np.zeros(0, dtype=SLOT_DTYPE)
+            self._free = []
+            self._size = 0
+            self._dirty = True
+
+    def _retire(self):
+        """Switch to a new data file generation"""
+        self.close()
+        self._retired.append(self.data_path)
+        self._generation += 1
+
+    def _live_ranges(self) -> List[Tuple[int, int]]:
+        """Merged [start, end) byte ranges referenced by some chunk"""
+        records = self._records[:len(self._chunk_ids)]
+        records = records[records['source'] != FREE_SLOT]
+        ranges = []
+        for offset, length in sorted(zip(records['offset'].tolist(), records['length'].tolist())):
+            if ranges and offset <= ranges[-1][1]:
+                ranges[-1][1] = max(ranges[-1][1], offset + length)
+            else:
+                ranges.append([offset, offset + length])
+        return [tuple(r) for r in ranges]
+
+    def _compact(self, ranges: List[Tuple[int, int]]):
+        """Copy the referenced bytes into a new data file and move the slots to match"""
+        view = self._view()
+        # Keep the old map open for copying; _retire would close it
+        self._map = None
+        old_size = self._size
+        self._retire()
+        starts = np.array([start for start, _ in ranges], dtype=np.int64)
+        new_starts = np.zeros(len(ranges), dtype=np.int64)
+        with open(self.data_path, 'wb') as f:
+            for i, (start, end) in enumerate(ranges):
+                new_starts[i] = f.tell()
+                f.write(view[start:end])
+            self._size = f.tell()
+        view.close()
+
+        records = self._records[:len(self._chunk_ids)]
+        used = records['source'] != FREE_SLOT
+        offsets = records['offset'][used].astype(np.int64)
+        index = np.searchsorted(starts, offsets, side='right') - 1
+        records['offset'][used] = new_starts[index] + offsets - starts[index]
+        print(f"Compacted corpus store from {old_size} to {self._size} bytes")
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            ranges = self._live_ranges()
+            live_bytes = sum(end - start for start, end in ranges)
+            if self._size >= self.COMPACT_MIN_BYTES and live_bytes < self._size * self.COMPACT_RATIO:
+                self._compact(ranges)
+
+            os.makedirs(self.directory, exist_ok=True)
+            if self._appender is not None:
+                self._appender.flush()
+            elif not os.path.exists(self.data_path):
+                open(self.data_path, 'wb').close()
+
+            # The slots go to a new file and replacing the metadata commits the save, so a
+            # save interrupted at any point leaves the previous one intact
+            self._saves += 1
+            np.save(self.slots_path, self._records[:len(self._chunk_ids)])
+            tmp_meta = f"{self.meta_path}.tmp"
+            with open(tmp_meta, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'generation': self._generation,
+                    'size': self._size,
+                    'sources': self.sources,
+                    'chunk_ids': self._chunk_ids,
+                    'saves': self._saves,
+                    'slots': os.path.basename(self.slots_path)
+                }, f)
+            os.replace(tmp_meta, self.meta_path)
+            self._dirty = False
+            previous, self._slots_file = self._slots_file, os.path.basename(self.slots_path)
+            self._remove_old_slots(keep={previous, self._slots_file})
+
+            for path in self._retired:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    # Still mapped by another process on Windows; a later save retries
+                    print(f"Could not remove old corpus file {path}: {e}")
+                    continue
+            self._retired = [path for path in self._retired if os.path.exists(path)]
+
+    def _remove_old_slots(self, keep: set):
+        """Delete slot files of earlier saves; the previous one stays for processes still loading it"""
+        for filename in os.listdir(self.directory):
+            if filename.startswith(f"{self.name}.slots.") and filename.endswith(".npy") and filename not in keep:
+                try:
+                    os.remove(os.path.join(self.directory, filename))
+                except OSError:
+                    pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'chunks': len(self._slots),
+                'sources': len(self.sources),
+                'data_bytes': self._size,
+                'live_bytes': sum(end - start for start, end in self._live_ranges()),
+                'resident_bytes': self._records.nbytes,
+                'memory_mapped': self._map is not None
+            }
+
+    def close(self):
+        """Release the memory map and file handle; they are reopened on next use"""
+        with self._lock:
+            self._unmap()
+            if self._appender is not None:
+                self._appender.close()
+                self._appender = None
@@ -1,12 +1,82 @@
+import codecs
+import copy
 import json
-from typing import Dict, List
-from bs4 import BeautifulSoup
-import pymupdf  # PyMuPDF for PDF processing
+import multiprocessing
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Tuple
+
+from backend.dom_index import get_dom_index
+from backend.metrics import span, observe_stage, DOCUMENTS_EXTRACTED
+
+# PyMuPDF is imported on first use to keep startup fast
+
+TEXT_BLOCK_SIZE = 64 * 1024
+
+# PDFs with more pages than this are extracted as parallel page ranges
+PDF_PAGES_PER_TASK = 25
+
+
+def iter_document_text(doc: Dict[str, str], block_size: int = TEXT_BLOCK_SIZE) -> Iterator[str]:
+    """Yield a document's text in blocks, whether it is held in memory or spooled to disk"""
+    if 'content' in doc:
+        text = doc['content']
+        for start in range(0, len(text), block_size):
+            yield text[start:start + block_size]
+        return
+    
+    with open(doc['path'], 'r', encoding='utf-8', errors='replace') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            yield block
+
+
+def _extract_file(storage_dir: str, path: str, filename: str) -> Tuple[str, float]:
+    """Process pool task: extract one spooled upload"""
+    start = time.perf_counter()
+    text_path = DocumentProcessor(storage_dir)._extract_path(path, filename)
+    return text_path, time.perf_counter() - start
+
+
+def _extract_pdf_pages(path: str, first: int, last: int) -> Tuple[str, float]:
+    """Process pool task: extract pages [first, last) of a PDF into their own file"""
+    import pymupdf
+    
+    start = time.perf_counter()
+    part_path = f"{os.path.splitext(path)[0]}.pages-{first}.txt"
+    with pymupdf.open(path) as pdf, open(part_path, 'w', encoding='utf-8') as f:
+        for number in range(first, last):
+            f.write(pdf[number].get_text())
+    return part_path, time.perf_counter() - start
+
 
 class DocumentProcessor:
-    def __init__(self):
+    def __init__(self, storage_dir: str = "./uploads", max_workers: int = None):
         self.documents = []
         self.html_content = ""
+        
+        # Extracted text of large uploads is kept here instead of in memory
+        self.storage_dir = storage_dir
+        
+        # Process pool for parallel extraction, started on first use
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._pool = None
+        # Processor whose pool this one uses (see for_storage)
+        self._owner = None
+    
+    def for_storage(self, storage_dir: str) -> "DocumentProcessor":
+        """Processor with its own documents and storage directory, sharing this one's process pool"""
+        processor = copy.copy(self)
+        processor._owner = self._owner or self
+        processor._pool = None
+        processor.storage_dir = storage_dir
+        processor.documents = []
+        processor.html_content = ""
+        return processor
     
     def process_file(self, content: bytes, filename: str) -> str:
         """Process a file and extract text content"""
@@ -31,22 +101,243 @@ class DocumentProcessor:
                 text = str(content)
         
         # Store document
-        self.documents.append({
+        self._store({
             'filename': filename,
             'content': text
         })
         
         return text
     
-    def set_html_content(self, html: str):
-        """Store HTML content separately"""
+    def new_spool_path(self, filename: str) -> str:
+        """Return a fresh path in the storage directory for an upload"""
+        os.makedirs(self.storage_dir, exist_ok=True)
+        extension = os.path.splitext(filename)[1]
+        return os.path.join(self.storage_dir, f"{uuid.uuid4().hex}{extension}")
+    
+    def process_path(self, path: str, filename: str, store: bool = True) -> Dict[str, str]:
+        """Extract text from an upload spooled to disk, keeping memory bounded.
+        
+        The extracted text is written next to the upload and the document is
+        stored as a reference to that file rather than as an in-memory string.
+        With store=False the document is only returned.
+        """
+        start = time.perf_counter()
+        text_path = self._extract_path(path, filename)
+        return self._register(filename, text_path, time.perf_counter() - start, store)
+    
+    def process_paths(self, uploads: List[Tuple[str, str]], max_workers: int = None,
+                      store: bool = True) -> List[Dict[str, str]]:
+        """Extract many spooled uploads in parallel across a process pool.
+        
+        uploads is a list of (path, filename). Large PDFs are additionally
+        split into page ranges extracted in parallel. Documents are returned
+        (and, unless store=False, stored) in upload order, each with its
+        extraction time.
+        """
+        if not uploads:
+            return []
+        
+        with span("extract_documents", files=len(uploads)):
+            return self._process_paths(uploads, max_workers, store)
+    
+    def _process_paths(self, uploads: List[Tuple[str, str]], max_workers: int = None,
+                       store: bool = True) -> List[Dict[str, str]]:
+        # Fan out: one task per file, or one per page range of a large PDF
+        page_counts = [
+            self._pdf_page_count(path) if filename.endswith('.pdf') else 0
+            for path, filename in uploads
+        ]
+        if len(uploads) == 1 and page_counts[0] <= PDF_PAGES_PER_TASK:
+            # Not worth a round trip through the pool
+            return [self.process_path(*uploads[0], store=store)]
+        
+        pool = self._get_pool(max_workers)
+        tasks = []
+        for (path, filename), page_count in zip(uploads, page_counts):
+            if page_count > PDF_PAGES_PER_TASK:
+                tasks.append([
+                    pool.submit(_extract_pdf_pages, path, first, min(first + PDF_PAGES_PER_TASK, page_count))
+                    for first in range(0, page_count, PDF_PAGES_PER_TASK)
+                ])
+            else:
+                tasks.append(pool.submit(_extract_file, self.storage_dir, path, filename))
+        
+        docs = []
+        for (path, filename), task in zip(uploads, tasks):
+            if isinstance(task, list):
+                text_path, seconds = self._join_pdf_parts(path, task)
+            else:
+                text_path, seconds = task.result()
+            docs.append(self._register(filename, text_path, seconds, store))
+        
+        return docs
+    
+    def _register(self, filename: str, text_path: str, seconds: float, store: bool = True) -> Dict[str, str]:
+        """Describe (and store) an extracted document"""
+        # Extraction itself may have run in a worker process, so record the time it reported
+        observe_stage("extract_document", seconds)
+        DOCUMENTS_EXTRACTED.inc(type=os.path.splitext(filename)[1].lstrip('.').lower() or 'none')
+        
+        doc = {
+            'filename': filename,
+            'path': text_path,
+            'size': os.path.getsize(text_path),
+            'extract_seconds': round(seconds, 4)
+        }
+        if store:
+            self._store(doc)
+        return doc
+    
+    def discard_upload(self, path: str):
+        """Remove a spooled upload and any text already extracted from it"""
+        for leftover in (path, f"{os.path.splitext(path)[0]}.extracted.txt"):
+            try:
+                os.remove(leftover)
+            except FileNotFoundError:
+                pass
+    
+    def _store(self, doc: Dict[str, str]):
+        """Add a document, replacing an earlier upload of the same file"""
+        for i, existing in enumerate(self.documents):
+            if existing['filename'] == doc['filename']:
+                self.documents[i] = doc
+                return
+        self.documents.append(doc)
+    
+    def _get_pool(self, max_workers: int = None) -> ProcessPoolExecutor:
+        if self._owner is not None:
+            return self._owner._get_pool(max_workers)
+        if self._pool is None:
+            # spawn avoids forking a process that is running server threads
+            self._pool = ProcessPoolExecutor(
+                max_workers=max_workers or self.max_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._pool
+    
+    def _pdf_page_count(self, path: str) -> int:
+        try:
+            import pymupdf
+            
+            with pymupdf.open(path) as pdf:
+                return pdf.page_count
+        except Exception:
+            # Let the regular extraction path report the error
+            return 0
+    
+    def _join_pdf_parts(self, path: str, futures: List) -> Tuple[str, float]:
+        """Concatenate page-range extractions in page order"""
+        parts = []
+        error = None
+        for future in futures:
+            try:
+                parts.append(future.result())
+            except Exception as e:
+                error = error or e
+        
+        if error is None:
+            text_path = self._write_text(path, self._iter_files([part for part, _ in parts]))
+        else:
+            print(f"PDF processing error: {error}")
+            text_path = self._write_text(path, [f"PDF content (processing error: {error})"])
+        
+        for part, _ in parts:
+            os.remove(part)
+        
+        os.remove(path)
+        return text_path, sum(seconds for _, seconds in parts)
+    
+    def _iter_files(self, paths: List[str]) -> Iterator[str]:
+        for part in paths:
+            with open(part, 'r', encoding='utf-8') as f:
+                while True:
+                    block = f.read(TEXT_BLOCK_SIZE)
+                    if not block:
+                        break
+                    yield block
+    
+    def _extract_path(self, path: str, filename: str) -> str:
+        """Extract an upload to a text file and remove the upload; returns the text path"""
+        
+        if filename.endswith('.json'):
+            # JSON has to be parsed as a whole to be pretty-printed
+            with open(path, 'rb') as f:
+                text = self._process_json(f.read())
+            text_path = self._write_text(path, [text])
+        
+        elif filename.endswith('.pdf'):
+            try:
+                text_path = self._write_text(path, self.iter_pdf_pages(path))
+            except Exception as e:
+                print(f"PDF processing error: {e}")
+                text_path = self._write_text(path, [f"PDF content (processing error: {e})"])
+        
+        elif filename.endswith('.html'):
+            with open(path, 'rb') as f:
+                text = self._process_html(f.read())
+            text_path = self._write_text(path, [text])
+        
+        else:
+            # Markdown, plain text and anything else: re-encode as valid UTF-8 in blocks
+            text_path = self._write_text(path, self._iter_decoded(path))
+        
+        os.remove(path)
+        return text_path
+    
+    def _iter_decoded(self, path: str) -> Iterator[str]:
+        """Decode a file as UTF-8 in blocks"""
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        with open(path, 'rb') as f:
+            while True:
+                block = f.read(TEXT_BLOCK_SIZE)
+                if not block:
+                    break
+                yield decoder.decode(block)
+        yield decoder.decode(b'', final=True)
+    
+    def _write_text(self, path: str, pieces) -> str:
+        """Stream text pieces into a .txt file beside the upload"""
+        text_path = f"{os.path.splitext(path)[0]}.extracted.txt"
+        with open(text_path, 'w', encoding='utf-8') as f:
+            for piece in pieces:
+                f.write(piece)
+        return text_path
+    
+    def iter_pdf_pages(self, source) -> Iterator[str]:
+        """Yield the text of a PDF page by page; source is a path or bytes"""
+        import pymupdf  # PyMuPDF for PDF processing
+        
+        if isinstance(source, (bytes, bytearray)):
+            pdf = pymupdf.open(stream=source, filetype="pdf")
+        else:
+            pdf = pymupdf.open(source)
+        
+        try:
+            for page in pdf:
+                yield page.get_text()
+        finally:
+            pdf.close()
+    
+    def set_html_content(self, html: str, sha256: str = None) -> Dict[str, str]:
+        """Store HTML content separately; returns the document made of its features"""
         self.html_content = html
         
         # Also add to documents
-        self.documents.append({
-            'filename': 'checkout.html',
-            'content': self._extract_html_features(html)
-        })
+        doc = self.html_document(html, sha256)
+        self._store(doc)
+        return doc
+    
+    def html_document(self, html: str, sha256: str = None) -> Dict[str, str]:
+        """The document made of the HTML's features, without storing anything"""
+        with span("extract_html", chars=len(html)):
+            doc = {
+                'filename': 'checkout.html',
+                'content': self._extract_html_features(html)
+            }
+            if sha256:
+                doc['sha256'] = sha256
+        DOCUMENTS_EXTRACTED.inc(type='html')
+        return doc
     
     def _process_json(self, content: bytes) -> str:
         """Convert JSON to readable text"""
@@ -59,15 +350,8 @@ class DocumentProcessor:
     def _process_pdf(self, content: bytes) -> str:
         """Extract text from PDF"""
         try:
-            # Create a PDF document from bytes
-            pdf = pymupdf.open(stream=content, filetype="pdf")
-            text = ""
-            
-            for page in pdf:
-                text += page.get_text()
-            
-            pdf.close()
-            return text
+            # Join once instead of growing a string page by page
+            return "".join(self.iter_pdf_pages(content))
         
         except Exception as e:
             print(f"PDF processing error: {e}")
@@ -80,59 +364,22 @@ class DocumentProcessor:
     
     def _extract_html_features(self, html: str) -> str:
         """Extract features and structure from HTML"""
-        soup = BeautifulSoup(html, 'html.parser')
-        
-        features = []
-        
-        # Extract title
-        title = soup.find('title')
-        if title:
-            features.append(f"Page Title: {title.get_text()}")
-        
-        # Extract forms
-        forms = soup.find_all('form')
-        for i, form in enumerate(forms):
-            features.append(f"\nForm {i+1}:")
-            
-            # Form inputs
-            inputs = form.find_all('input')
-            for inp in inputs:
-                input_type = inp.get('type', 'text')
-                input_id = inp.get('id', '')
-                input_name = inp.get('name', '')
-                features.append(f"  - Input: type={input_type}, id={input_id}, name={input_name}")
-        
-        # Extract buttons
-        buttons = soup.find_all('button')
-        features.append(f"\nButtons:")
-        for btn in buttons:
-            btn_id = btn.get('id', '')
-            btn_text = btn.get_text().strip()
-            features.append(f"  - Button: id={btn_id}, text='{btn_text}'")
-        
-        # Extract interactive elements
-        selects = soup.find_all('select')
-        if selects:
-            features.append(f"\nSelect Elements:")
-            for sel in selects:
-                sel_id = sel.get('id', '')
-                sel_name = sel.get('name', '')
-                features.append(f"  - Select: id={sel_id}, name={sel_name}")
-        
-        # Extract text content (headers, paragraphs)
-        headers = soup.find_all(['h1', 'h2', 'h3'])
-        if headers:
-            features.append(f"\nPage Headers:")
-            for h in headers:
-                features.append(f"  - {h.name}: {h.get_text().strip()}")
-        
-        return "\n".join(features)
+        return get_dom_index(html).feature_summary()
     
     def get_all_documents(self) -> List[Dict[str, str]]:
         """Return all processed documents"""
         return self.documents
     
+    def close(self):
+        """Shut down the extraction process pool"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+    
     def clear(self):
         """Clear all stored documents"""
+        for doc in self.documents:
+            if 'path' in doc and os.path.exists(doc['path']):
+                os.remove(doc['path'])
         self.documents = []
         self.html_content = ""
\ No newline at end of file
@@ -0,0 +1,189 @@
+import hashlib
+import importlib.util
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+# Tags whose text content is used in summaries; text is only extracted for these
+TEXT_TAGS = ('title', 'button', 'h1', 'h2', 'h3')
+
+
+def _parser_name() -> str:
+    """Prefer the C-based lxml parser, falling back to the stdlib one"""
+    return 'lxml' if importlib.util.find_spec('lxml') is not None else 'html.parser'
+
+
+class DomElement:
+    """One indexed HTML element with precomputed Selenium locators"""
+
+    __slots__ = ('tag', 'id', 'name', 'type', 'text', 'form_index', 'locator', 'css_selector')
+
+    def __init__(self, tag: str, attrs: Dict, text: str = '', form_index: Optional[int] = None):
+        self.tag = tag
+        self.id = attrs.get('id', '') or ''
+        self.name = attrs.get('name', '') or ''
+        self.type = attrs.get('type', '') or ''
+        self.text = text
+        self.form_index = form_index
+
+        if self.id:
+            self.locator = f'By.ID, "{self.id}"'
+            self.css_selector = f'#{self.id}'
+        elif self.name:
+            self.locator = f'By.NAME, "{self.name}"'
+            self.css_selector = f"{tag}[name='{self.name}']"
+        else:
+            self.css_selector = f"{tag}[type='{self.type}']" if self.type else tag
+            self.locator = f'By.CSS_SELECTOR, "{self.css_selector}"'
+
+
+class DomIndex:
+    """Single-pass index of an HTML page, built once per distinct document"""
+
+    def __init__(self, html: str):
+        from bs4 import BeautifulSoup, Tag
+
+        soup = BeautifulSoup(html, _parser_name())
+
+        self.title = ''
+        self.elements: List[DomElement] = []
+        self.by_id: Dict[str, DomElement] = {}
+        self.by_name: Dict[str, List[DomElement]] = {}
+        self.by_tag: Dict[str, List[DomElement]] = {}
+        self.by_type: Dict[str, List[DomElement]] = {}
+        self.forms: List[List[DomElement]] = []
+
+        # Iterative depth-first walk in document order, tracking the enclosing form
+        stack = [(child, None) for child in reversed(soup.contents)]
+        while stack:
+            node, form_index = stack.pop()
+            if not isinstance(node, Tag):
+                continue
+
+            tag = node.name
+            if tag == 'form':
+                self.forms.append([])
+                form_index = len(self.forms) - 1
+
+            text = node.get_text().strip() if tag in TEXT_TAGS else ''
+            if tag == 'title':
+                if not self.title:
+                    self.title = node.get_text()
+            else:
+                self._add(DomElement(tag, node.attrs, text, form_index))
+
+            stack.extend((child, form_index) for child in reversed(node.contents))
+
+        self._feature_summary = None
+        self._element_summary = None
+
+    def _add(self, element: DomElement):
+        self.elements.append(element)
+        self.by_tag.setdefault(element.tag, []).append(element)
+        if element.id and element.id not in self.by_id:
+            self.by_id[element.id] = element
+        if element.name:
+            self.by_name.setdefault(element.name, []).append(element)
+        if element.type:
+            self.by_type.setdefault(element.type, []).append(element)
+        if element.tag == 'input' and element.form_index is not None:
+            self.forms[element.form_index].append(element)
+
+    def tags(self, *names: str) -> List[DomElement]:
+        """Elements with any of the given tag names, in document order"""
+        if len(names) == 1:
+            return self.by_tag.get(names[0], [])
+        wanted = set(names)
+        return [element for element in self.elements if element.tag in wanted]
+
+    def feature_summary(self) -> str:
+        """Readable description of the page, used as a knowledge base document"""
+        if self._feature_summary is not None:
+            return self._feature_summary
+
+        features = []
+
+        # Extract title
+        if self.title:
+            features.append(f"Page Title: {self.title}")
+
+        # Extract forms
+        for i, inputs in enumerate(self.forms):
+            features.append(f"\nForm {i+1}:")
+            for inp in inputs:
+                features.append(f"  - Input: type={inp.type or 'text'}, id={inp.id}, name={inp.name}")
+
+        # Extract buttons
+        features.append(f"\nButtons:")
+        for btn in self.tags('button'):
+            features.append(f"  - Button: id={btn.id}, text='{btn.text}'")
+
+        # Extract interactive elements
+        selects = self.tags('select')
+        if selects:
+            features.append(f"\nSelect Elements:")
+            for sel in selects:
+                features.append(f"  - Select: id={sel.id}, name={sel.name}")
+
+        # Extract text content (headers)
+        headers = self.tags('h1', 'h2', 'h3')
+        if headers:
+            features.append(f"\nPage Headers:")
+            for h in headers:
+                features.append(f"  - {h.tag}: {h.text}")
+
+        self._feature_summary = "\n".join(features)
+        return self._feature_summary
+
+    def element_summary(self) -> str:
+        """Key interactive elements with locators, used in script generation prompts"""
+        if self._element_summary is not None:
+            return self._element_summary
+
+        elements = []
+
+        for inp in self.tags('input')[:30]:
+            if inp.id or inp.name:
+                elements.append(
+                    f"Input: id='{inp.id}', name='{inp.name}', type='{inp.type or 'text'}', locator=({inp.locator})"
+                )
+
+        for button in self.tags('button')[:15]:
+            text = button.text[:50]
+            if button.id or text:
+                elements.append(f"Button: id='{button.id}', text='{text}', locator=({button.locator})")
+
+        for select in self.tags('select')[:10]:
+            if select.id or select.name:
+                elements.append(f"Select: id='{select.id}', name='{select.name}', locator=({select.locator})")
+
+        divs = [div for div in self.tags('div') if div.id][:20]
+        for div in divs:
+            if div.id not in ['root', 'app']:
+                elements.append(f"Div: id='{div.id}', locator=({div.locator})")
+
+        self._element_summary = "\n".join(elements) if elements else "No elements extracted"
+        return self._element_summary
+
+
+_cache: "OrderedDict[str, DomIndex]" = OrderedDict()
+_cache_lock = threading.Lock()
+_CACHE_SIZE = 8
+
+
+def get_dom_index(html: str) -> DomIndex:
+    """Return the DOM index for an HTML document, parsing it only the first time"""
+    key = hashlib.sha256(html.encode('utf-8')).hexdigest()
+    with _cache_lock:
+        index = _cache.get(key)
+        if index is not None:
+            _cache.move_to_end(key)
+            return index
+
+    index = DomIndex(html)
+
+    with _cache_lock:
+        _cache[key] = index
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return index
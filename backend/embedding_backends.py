@@ -0,0 +1,97 @@
+import os
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_BACKENDS = ("huggingface", "sentence-transformers", "onnx")
+
+# Dynamically quantized (uint8) ONNX export shipped with the sentence-transformers models
+DEFAULT_ONNX_FILE = "onnx/model_quint8_avx2.onnx"
+
+
+class SentenceTransformerEmbeddings(Embeddings):
+    """CPU sentence-transformers embeddings with explicit batching and threading.
+
+    With backend="onnx" the model runs on ONNX Runtime, by default using the
+    quantized export that ships with the model, which is considerably faster
+    on CPU than PyTorch. With local_files_only=True the model must already be
+    in the Hugging Face cache (or model_name must be a local directory), so it
+    loads without network access.
+    """
+
+    def __init__(self, model_name: str, backend: str = "torch", batch_size: int = 64,
+                 num_threads: Optional[int] = None, onnx_file: Optional[str] = DEFAULT_ONNX_FILE,
+                 local_files_only: bool = False):
+        from sentence_transformers import SentenceTransformer
+
+        self.model_name = model_name
+        self.backend = backend
+        self.batch_size = batch_size
+        num_threads = num_threads or os.cpu_count() or 1
+
+        model_kwargs = {}
+        if backend == "onnx":
+            import onnxruntime
+
+            session_options = onnxruntime.SessionOptions()
+            session_options.intra_op_num_threads = num_threads
+            model_kwargs = {"provider": "CPUExecutionProvider", "session_options": session_options}
+            if onnx_file:
+                model_kwargs["file_name"] = onnx_file
+        else:
+            import torch
+
+            torch.set_num_threads(num_threads)
+
+        self.model = SentenceTransformer(
+            model_name,
+            device="cpu",
+            backend=backend,
+            model_kwargs=model_kwargs,
+            local_files_only=local_files_only
+        )
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.model.encode(
+            texts,
+            batch_size=self.batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+        return vectors.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return self._encode(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0]
+
+
+def create_embeddings(backend: str, model_name: str, batch_size: int = 64, num_threads: Optional[int] = None,
+                      onnx_file: Optional[str] = DEFAULT_ONNX_FILE, local_files_only: bool = False) -> Embeddings:
+    """Instantiate the configured embedding backend"""
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}', expected one of {EMBEDDING_BACKENDS}")
+
+    if backend == "huggingface":
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+
+        model_kwargs = {'device': 'cpu'}
+        if local_files_only:
+            model_kwargs['local_files_only'] = True
+        return HuggingFaceEmbeddings(
+            model_name=model_name,
+            model_kwargs=model_kwargs
+        )
+
+    return SentenceTransformerEmbeddings(
+        model_name,
+        backend="onnx" if backend == "onnx" else "torch",
+        batch_size=batch_size,
+        num_threads=num_threads,
+        onnx_file=onnx_file,
+        local_files_only=local_files_only
+    )
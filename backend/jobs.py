@@ -0,0 +1,200 @@
+import contextvars
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from backend.state_store import StateStore
+
+# How often a running job writes its progress to the state store
+PERSIST_INTERVAL_SECONDS = 0.5
+# Unfinished jobs not heard of for this long belong to a worker that died
+STALE_JOB_SECONDS = 600
+
+
+class BuildCancelled(Exception):
+    """Raised inside a build when its job has been cancelled"""
+
+
+class BuildJob:
+    """State and progress of one knowledge base build"""
+
+    TERMINAL_STATES = ('succeeded', 'failed', 'cancelled')
+
+    def __init__(self, workspace_id: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.workspace_id = workspace_id
+        self.status = 'queued'
+        self.phase = 'queued'
+        self.chunks_embedded = 0
+        self.chunks_total = 0
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.embedding_started_at: Optional[float] = None
+        self.error: Optional[str] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.future = None
+        self.store: Optional[StateStore] = None
+        self._persisted_at = 0.0
+        self._cancel_event = threading.Event()
+
+    def persist(self, force: bool = False):
+        """Publish the job's state to other workers and pick up their cancel requests"""
+        if self.store is None:
+            return
+        now = time.time()
+        if not force and now - self._persisted_at < PERSIST_INTERVAL_SECONDS:
+            return
+        self._persisted_at = now
+        if self.store.save_job(self.id, self.to_dict()) and self.status not in self.TERMINAL_STATES:
+            self._cancel_event.set()
+
+    def report(self, phase: str, done: int, total: int):
+        """Progress callback passed to the build; doubles as a cancellation point"""
+        self.persist()
+        if self._cancel_event.is_set():
+            raise BuildCancelled()
+
+        self.phase = phase
+        if phase == 'embedding':
+            if self.embedding_started_at is None:
+                self.embedding_started_at = time.time()
+            self.chunks_embedded = done
+            self.chunks_total = total
+
+    def cancel(self) -> bool:
+        """Request cancellation; returns False if the job already finished"""
+        if self.status in self.TERMINAL_STATES:
+            return False
+
+        self._cancel_event.set()
+        if self.future is not None and self.future.cancel():
+            # Never started
+            self._finish('cancelled')
+        return True
+
+    def _finish(self, status: str, error: Optional[str] = None):
+        self.status = status
+        self.phase = 'done'
+        self.error = error
+        self.finished_at = time.time()
+        self.persist(force=True)
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.finished_at or time.time()
+        throughput = None
+        if self.embedding_started_at and self.chunks_embedded:
+            elapsed = max(end - self.embedding_started_at, 1e-6)
+            throughput = round(self.chunks_embedded / elapsed, 2)
+
+        return {
+            'job_id': self.id,
+            'workspace_id': self.workspace_id,
+            'status': self.status,
+            'phase': self.phase,
+            'chunks_embedded': self.chunks_embedded,
+            'chunks_total': self.chunks_total,
+            'chunks_per_second': throughput,
+            'elapsed_seconds': round(end - self.started_at, 3) if self.started_at else 0.0,
+            'error': self.error,
+            'result': self.result
+        }
+
+
+class BuildJobManager:
+    """Runs knowledge base builds in the background, one at a time.
+
+    With a state store, job status is also published there, so any worker
+    process can report on or cancel a job started by another one.
+    """
+
+    def __init__(self, max_history: int = 50, store: Optional[StateStore] = None):
+        self.max_history = max_history
+        self.store = store
+        if store is not None:
+            store.prune_jobs(24 * 3600)
+        self.jobs: "OrderedDict[str, BuildJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        # A single worker serializes builds so they never race on the vector store
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="kb-build")
+
+    def submit(self, build_fn: Callable[..., Dict[str, Any]], *args,
+               workspace_id: Optional[str] = None) -> BuildJob:
+        """Queue a build of a workspace; build_fn receives the job followed by args"""
+        job = BuildJob(workspace_id)
+        job.store = self.store
+        job.persist(force=True)
+        with self._lock:
+            self.jobs[job.id] = job
+            while len(self.jobs) > self.max_history:
+                oldest_id, oldest = next(iter(self.jobs.items()))
+                if oldest.status not in BuildJob.TERMINAL_STATES:
+                    break
+                self.jobs.pop(oldest_id)
+            # Run under the submitting request's context so the build's spans carry its request id
+            context = contextvars.copy_context()
+            job.future = self._executor.submit(context.run, self._run, job, build_fn, args)
+        return job
+
+    def _run(self, job: BuildJob, build_fn: Callable[..., Dict[str, Any]], args):
+        if job.status in BuildJob.TERMINAL_STATES:
+            return job.result
+
+        job.status = 'running'
+        job.phase = 'starting'
+        job.started_at = time.time()
+        job.persist(force=True)
+        try:
+            job.result = build_fn(job, *args)
+            job._finish('succeeded')
+        except BuildCancelled:
+            print(f"Knowledge base build {job.id} cancelled")
+            job._finish('cancelled')
+        except Exception as e:
+            print(f"Knowledge base build {job.id} failed: {e}")
+            job._finish('failed', error=str(e))
+        return job.result
+
+    def get(self, job_id: str) -> Optional[BuildJob]:
+        return self.jobs.get(job_id)
+
+    def lookup(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Status of a job run by this or (with a state store) any other worker"""
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        return self.store.get_job(job_id) if self.store is not None else None
+
+    def cancel(self, job_id: str) -> Optional[bool]:
+        """Cancel a job wherever it runs; None if unknown, False if already finished"""
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job.cancel()
+        state = self.store.get_job(job_id) if self.store is not None else None
+        if state is None:
+            return None
+        if state['status'] in BuildJob.TERMINAL_STATES:
+            return False
+        self.store.request_cancel(job_id)
+        return True
+
+    def active_job(self) -> Optional[BuildJob]:
+        """Return the oldest build that has not finished yet"""
+        for job in self.jobs.values():
+            if job.status not in BuildJob.TERMINAL_STATES:
+                return job
+        return None
+
+    def build_in_progress(self) -> bool:
+        """Whether this or any other live worker is building"""
+        if self.active_job() is not None:
+            return True
+        return bool(self.store is not None and self.store.active_jobs(STALE_JOB_SECONDS))
+
+    def shutdown(self):
+        for job in list(self.jobs.values()):
+            job.cancel()
+        self._executor.shutdown(wait=False)
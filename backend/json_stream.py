@@ -0,0 +1,148 @@
+import json
+import re
+from typing import Any, Dict, List
+
+ARRAY_START = re.compile(r'"test_cases"\s*:\s*\[')
+# Otherwise the first array of objects, e.g. after a preamble or inside a markdown code fence
+BARE_ARRAY_START = re.compile(r'\[(?=\s*\{)')
+
+
+def _strip_trailing_commas(text: str) -> str:
+    """Remove commas directly before a closing brace or bracket, outside of strings"""
+    out = []
+    in_string = False
+    escape = False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == '\\':
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == ',':
+            j = i + 1
+            while j < len(text) and text[j].isspace():
+                j += 1
+            if j < len(text) and text[j] in '}]':
+                continue
+        out.append(ch)
+    return "".join(out)
+
+
+def loads_lenient(raw: str) -> Any:
+    """json.loads that also accepts trailing commas and raw control characters in strings"""
+    try:
+        return json.loads(raw, strict=False)
+    except json.JSONDecodeError:
+        return json.loads(_strip_trailing_commas(raw), strict=False)
+
+
+def salvage_test_cases(text: str) -> List[Any]:
+    """Every complete object of the test case array in a damaged or truncated response.
+
+    Objects cut off by truncation are dropped; the ones before them are kept
+    even though the document as a whole does not parse. Responses without a
+    `test_cases` array are searched for another array of objects, or taken
+    as a single test case.
+    """
+    parser = TestCaseStreamParser()
+    objects = parser.feed(text)
+    if parser.in_array:
+        return objects
+
+    start = text.find('{')
+    end = text.rfind('}') + 1
+    if start == -1 or end <= start:
+        return []
+    try:
+        data = loads_lenient(text[start:end])
+    except json.JSONDecodeError:
+        return []
+
+    if isinstance(data, dict):
+        for value in data.values():
+            if isinstance(value, list) and value and all(isinstance(item, dict) for item in value):
+                return value
+        return [data]
+    return []
+
+
+class TestCaseStreamParser:
+    """Incrementally extract objects from the `test_cases` array of a JSON stream.
+
+    Text is fed in arbitrary pieces (e.g. LLM tokens); each test case object
+    is returned as soon as its closing brace arrives, without waiting for
+    the rest of the document.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.in_array = False
+        self.finished = False
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.obj_start = None
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """Consume more text and return any test cases it completed"""
+        if self.finished:
+            return []
+
+        self.buffer += text
+        completed = []
+
+        if not self.in_array:
+            match = ARRAY_START.search(self.buffer) or BARE_ARRAY_START.search(self.buffer)
+            if not match:
+                return completed
+            self.in_array = True
+            self.buffer = self.buffer[match.end():]
+            self.pos = 0
+
+        while self.pos < len(self.buffer):
+            ch = self.buffer[self.pos]
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == '\\':
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch in '{[':
+                if self.depth == 0 and ch == '{':
+                    self.obj_start = self.pos
+                self.depth += 1
+            elif ch in '}]':
+                self.depth -= 1
+                if self.depth < 0:
+                    # End of the test_cases array
+                    self.finished = True
+                    break
+                if self.depth == 0 and ch == '}' and self.obj_start is not None:
+                    raw = self.buffer[self.obj_start:self.pos + 1]
+                    self.obj_start = None
+                    try:
+                        completed.append(loads_lenient(raw))
+                    except json.JSONDecodeError as e:
+                        print(f"Skipping malformed streamed test case: {e}")
+
+            self.pos += 1
+
+        # Drop text that can no longer be part of an object
+        if self.obj_start is None:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        elif self.obj_start > 0:
+            self.buffer = self.buffer[self.obj_start:]
+            self.pos -= self.obj_start
+            self.obj_start = 0
+
+        return completed
@@ -0,0 +1,180 @@
+import heapq
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# Keeps exact tokens such as SAVE15, customer-email or api/v1/cart together
+TOKEN_PATTERN = re.compile(r"[A-Za-z0-9]+(?:[-_./][A-Za-z0-9]+)*")
+PART_SEPARATORS = re.compile(r"[-_./]")
+# Tokens with a digit or separator are identifiers (codes, element ids, paths) rather than words
+IDENTIFIER = re.compile(r"[0-9]|[-_./]")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased tokens, plus the parts of compound tokens like customer-email"""
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(text):
+        token = match.group().lower()
+        tokens.append(token)
+        parts = PART_SEPARATORS.split(token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part)
+    return tokens
+
+
+def identifier_tokens(text: str) -> List[str]:
+    """Whole identifier tokens of a text, lowercased, e.g. save15 or api/v1/cart"""
+    return [
+        match.group().lower() for match in TOKEN_PATTERN.finditer(text)
+        if IDENTIFIER.search(match.group())
+    ]
+
+
+class BM25Index:
+    """In-memory inverted index with Okapi BM25 scoring.
+
+    Chunks are added and removed individually so the index can follow the
+    incremental knowledge base builds, and the index is persisted as JSON
+    next to the vector store. Only term counts and metadata are kept; the
+    chunk text itself lives in the corpus store.
+    """
+
+    def __init__(self, path: Optional[str] = None, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.total_length = 0
+        # Builds mutate the index while requests search it
+        self._lock = threading.RLock()
+        self.loaded = self._load() if path else False
+
+    def _load(self) -> bool:
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                docs = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable lexical index: {e}")
+            return False
+
+        for chunk_id, doc in docs.items():
+            if 'terms' in doc:
+                self._add_counts(chunk_id, Counter(doc['terms']), doc['metadata'])
+            else:
+                # Saved before term counts were persisted
+                self.add(chunk_id, doc['text'], doc['metadata'])
+        return True
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with self._lock:
+            docs = {
+                chunk_id: {
+                    'terms': {term: self.postings[term][chunk_id] for term in doc['terms']},
+                    'metadata': doc['metadata']
+                }
+                for chunk_id, doc in self.docs.items()
+            }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            # dumps uses the C encoder; dump to a file does not
+            f.write(json.dumps(docs))
+        os.replace(tmp_path, self.path)
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def add(self, chunk_id: str, text: str, metadata: Dict[str, Any]):
+        self._add_counts(chunk_id, Counter(tokenize(text)), metadata)
+
+    def _add_counts(self, chunk_id: str, term_freqs: Counter, metadata: Dict[str, Any]):
+        length = sum(term_freqs.values())
+        with self._lock:
+            if chunk_id in self.docs:
+                self.remove(chunk_id)
+
+            self.docs[chunk_id] = {'metadata': metadata, 'length': length, 'terms': list(term_freqs)}
+            self.total_length += length
+            for term, freq in term_freqs.items():
+                self.postings.setdefault(term, {})[chunk_id] = freq
+
+    def remove(self, chunk_id: str):
+        with self._lock:
+            doc = self.docs.pop(chunk_id, None)
+            if doc is None:
+                return
+            self.total_length -= doc['length']
+            for term in doc['terms']:
+                posting = self.postings.get(term)
+                if posting is not None:
+                    posting.pop(chunk_id, None)
+                    if not posting:
+                        del self.postings[term]
+
+    def update_metadata(self, chunk_id: str, metadata: Dict[str, Any]):
+        with self._lock:
+            if chunk_id in self.docs:
+                self.docs[chunk_id]['metadata'] = metadata
+
+    def clear(self):
+        with self._lock:
+            self.docs = {}
+            self.postings = {}
+            self.total_length = 0
+
+    def _matches(self, metadata: Dict[str, Any], filters: Optional[Dict[str, Any]]) -> bool:
+        if not filters:
+            return True
+        return all(metadata.get(key) == value for key, value in filters.items())
+
+    def search(self, query: str, k: int = 5,
+               filters: Optional[Dict[str, Any]] = None) -> List[Tuple[str, float]]:
+        """Return the top-k (chunk_id, score) pairs for a query"""
+        with self._lock:
+            return self._search(query, k, filters)
+
+    def _search(self, query: str, k: int, filters: Optional[Dict[str, Any]]) -> List[Tuple[str, float]]:
+        if not self.docs:
+            return []
+
+        num_docs = len(self.docs)
+        avg_length = self.total_length / num_docs or 1.0
+        scores: Dict[str, float] = {}
+
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (num_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+            for chunk_id, freq in posting.items():
+                length = self.docs[chunk_id]['length']
+                norm = self.k1 * (1 - self.b + self.b * length / avg_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * freq * (self.k1 + 1) / (freq + norm)
+
+        candidates = scores.items()
+        if filters:
+            candidates = [item for item in candidates if self._matches(self.docs[item[0]]['metadata'], filters)]
+        return heapq.nlargest(k, candidates, key=lambda item: item[1])
+
+    def exact_matches(self, query: str, max_chunks: int) -> Set[str]:
+        """Chunks containing an identifier of the query that occurs in at most max_chunks chunks"""
+        matches = set()
+        with self._lock:
+            for term in identifier_tokens(query):
+                posting = self.postings.get(term)
+                if posting and len(posting) <= max_chunks:
+                    matches.update(posting)
+        return matches
+
+    def get(self, chunk_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self.docs.get(chunk_id)
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import threading
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class LLMError(Exception):
+    """Raised when the LLM server cannot produce a response"""
+
+
+class OllamaClient:
+    """Pooled HTTP client for the Ollama generate API.
+
+    Keeps keep-alive connections open for both the synchronous (requests)
+    and asynchronous (httpx) paths, and bounds the number of generations
+    in flight so a burst of requests cannot overload the Ollama server.
+    """
+
+    def __init__(self, base_url: str = "http://localhost:11434", max_concurrency: int = 4,
+                 timeout: float = 120.0):
+        self.base_url = base_url.rstrip('/')
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+
+        self._session = requests.Session()
+        # pool_block makes extra calls wait for a pooled connection instead of opening more
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency, pool_block=True)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        # Bounds blocking generations the same way _async_semaphore bounds async ones
+        self._semaphore = threading.Semaphore(max_concurrency)
+
+        # Async resources are bound to the running event loop, so create them lazily
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._async_semaphore: Optional[asyncio.Semaphore] = None
+
+    def _payload(self, prompt: str, model: str, options: Dict[str, Any], stream: bool) -> Dict[str, Any]:
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "stream": stream
+        }
+        payload.update(options)
+        return payload
+
+    def generate(self, prompt: str, model: str, options: Optional[Dict[str, Any]] = None) -> str:
+        """Run a blocking, non-streaming generation"""
+        with self._semaphore:
+            try:
+                response = self._session.post(
+                    f"{self.base_url}/api/generate",
+                    json=self._payload(prompt, model, options or {}, stream=False),
+                    timeout=self.timeout
+                )
+            except requests.RequestException as e:
+                raise LLMError(str(e)) from e
+
+        if response.status_code != 200:
+            raise LLMError(f"LLM call failed with status {response.status_code}")
+        try:
+            return self._extract_response(response.json())
+        except ValueError as e:
+            raise LLMError(f"Malformed LLM response: {e}") from e
+
+    def _extract_response(self, data: Dict[str, Any]) -> str:
+        try:
+            return data['response']
+        except (KeyError, TypeError) as e:
+            raise LLMError(f"Malformed LLM response: {e}") from e
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout, connect=10.0),
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency
+                )
+            )
+            self._async_semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._async_client
+
+    async def agenerate(self, prompt: str, model: str, options: Optional[Dict[str, Any]] = None) -> str:
+        """Run a non-streaming generation without blocking the event loop"""
+        client = self._get_async_client()
+        async with self._async_semaphore:
+            try:
+                response = await client.post(
+                    "/api/generate",
+                    json=self._payload(prompt, model, options or {}, stream=False)
+                )
+            except httpx.HTTPError as e:
+                raise LLMError(str(e) or type(e).__name__) from e
+
+        if response.status_code != 200:
+            raise LLMError(f"LLM call failed with status {response.status_code}")
+        try:
+            return self._extract_response(response.json())
+        except ValueError as e:
+            raise LLMError(f"Malformed LLM response: {e}") from e
+
+    async def astream_generate(self, prompt: str, model: str,
+                               options: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+        """Yield response tokens as Ollama produces them"""
+        client = self._get_async_client()
+        async with self._async_semaphore:
+            try:
+                async with client.stream(
+                    "POST",
+                    "/api/generate",
+                    json=self._payload(prompt, model, options or {}, stream=True)
+                ) as response:
+                    if response.status_code != 200:
+                        raise LLMError(f"LLM call failed with status {response.status_code}")
+
+                    async for line in response.aiter_lines():
+                        if not line.strip():
+                            continue
+                        try:
+                            chunk = json.loads(line)
+                        except ValueError as e:
+                            raise LLMError(f"Malformed LLM stream: {e}") from e
+                        if chunk.get('error'):
+                            raise LLMError(chunk['error'])
+                        token = chunk.get('response', '')
+                        if token:
+                            yield token
+                        if chunk.get('done'):
+                            break
+            except httpx.HTTPError as e:
+                raise LLMError(str(e) or type(e).__name__) from e
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+            self._async_semaphore = None
+
+    def close(self):
+        self._session.close()
@@ -1,13 +1,27 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+import time
+
+# Measured from the very first import so slow imports show up in startup timings
+PROCESS_START = time.perf_counter()
+
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Depends, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Optional, Tuple
+import asyncio
+import hashlib
 import json
 import os
+import threading
 from pathlib import Path
 
 from backend.rag_engine import RAGEngine
+from backend.embedding_backends import DEFAULT_ONNX_FILE
 from backend.document_processor import DocumentProcessor
+from backend.jobs import BuildJob, BuildJobManager
+from backend.metrics import REGISTRY, REQUEST_ID, HTTP_REQUEST_SECONDS, UPLOADED_FILES, new_request_id
+from backend.state_store import StateStore
+from backend.workspaces import DEFAULT_WORKSPACE, Workspace, WorkspaceManager
 
 app = FastAPI(title="Autonomous QA Agent API")
 
@@ -21,112 +35,402 @@ app.add_middleware(
 )
 
 # Initialize components
-rag_engine = RAGEngine()
-doc_processor = DocumentProcessor()
+rag_engine = RAGEngine(
+    ollama_url=os.getenv("OLLAMA_URL", "http://localhost:11434"),
+    llm_concurrency=int(os.getenv("OLLAMA_MAX_CONCURRENCY", "4")),
+    worker_threads=int(os.getenv("RAG_WORKER_THREADS", "4")),
+    vector_backend=os.getenv("VECTOR_BACKEND", "chroma"),
+    flat_index_mmap=os.getenv("FLAT_INDEX_MMAP", "false").lower() in ("1", "true", "yes"),
+    vector_quantize=os.getenv("VECTOR_QUANTIZE", "false").lower() in ("1", "true", "yes", "int8"),
+    embedding_backend=os.getenv("EMBEDDING_BACKEND", "huggingface"),
+    embedding_batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", "64")),
+    embedding_threads=int(os.getenv("EMBEDDING_THREADS", "0")) or None,
+    embedding_onnx_file=os.getenv("EMBEDDING_ONNX_FILE", DEFAULT_ONNX_FILE) or None,
+    embedding_local_only=os.getenv("EMBEDDING_LOCAL_ONLY", "false").lower() in ("1", "true", "yes"),
+    llm_cache_ttl=float(os.getenv("LLM_CACHE_TTL_SECONDS", str(24 * 3600))),
+    llm_cache_size=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000")),
+    test_case_shard_size=int(os.getenv("TEST_CASE_SHARD_SIZE", "10")),
+    test_case_context_tokens=int(os.getenv("TEST_CASE_CONTEXT_TOKENS", "1000")),
+    script_context_tokens=int(os.getenv("SCRIPT_CONTEXT_TOKENS", "800"))
+)
+doc_processor = DocumentProcessor(
+    max_workers=int(os.getenv("EXTRACT_WORKERS", "0")) or None
+)
+
+# Each workspace has its own documents, HTML and knowledge base; models, pools
+# and the embedding and LLM caches of rag_engine and doc_processor are shared.
+# Workspace and build job state live in a SQLite store shared by all worker
+# processes, so the API can run under `uvicorn --workers N`
+workspaces_dir = os.getenv("WORKSPACES_DIR", "./workspaces")
+workspaces = WorkspaceManager(
+    rag_engine, doc_processor,
+    root=workspaces_dir,
+    memory_budget_bytes=int(float(os.getenv("WORKSPACE_MEMORY_BUDGET_MB", "1024")) * 1024 * 1024),
+    store=StateStore(os.path.join(workspaces_dir, "state.sqlite3"))
+)
+build_jobs = BuildJobManager(store=workspaces.store)
+
+def _cache_counters(attribute: str):
+    """Read a hit or miss counter of each backend cache at scrape time"""
+    retrieval = getattr(workspaces, f"evicted_retrieval_{attribute}") + sum(
+        getattr(workspace.engine.retrieval_cache, attribute) for workspace in workspaces.loaded()
+    )
+    counters = [
+        (("retrieval",), retrieval),
+        (("llm_responses",), getattr(rag_engine.response_cache, attribute))
+    ]
+    if rag_engine.is_ready:
+        counters.append((("embeddings",), getattr(rag_engine.embeddings, attribute)))
+    return counters
+
+REGISTRY.register_callback(
+    "qa_cache_hits_total", "counter", "Backend cache hits", ("cache",), lambda: _cache_counters("hits")
+)
+REGISTRY.register_callback(
+    "qa_cache_misses_total", "counter", "Backend cache misses", ("cache",), lambda: _cache_counters("misses")
+)
+REGISTRY.register_callback(
+    "qa_knowledge_base_chunks", "gauge", "Chunks in the knowledge base of each loaded workspace", ("workspace",),
+    lambda: [((workspace.id,), workspace.engine.manifest.num_chunks()) for workspace in workspaces.loaded()],
+    aggregate="max"
+)
+REGISTRY.register_callback(
+    "qa_workspaces_loaded", "gauge", "Workspaces held in memory", (),
+    lambda: [((), len(workspaces.loaded()))]
+)
+REGISTRY.register_callback(
+    "qa_workspace_memory_bytes", "gauge", "Estimated memory of the loaded workspaces", (),
+    lambda: [((), workspaces.memory_bytes())]
+)
+REGISTRY.register_callback(
+    "qa_workspace_evictions_total", "counter", "Idle workspaces evicted to disk", (),
+    lambda: [((), workspaces.evictions)]
+)
+REGISTRY.register_callback(
+    "qa_workspace_reloads_total", "counter", "Knowledge bases reopened after another worker rebuilt them", (),
+    lambda: [((), workspaces.reloads)]
+)
+
+@app.middleware("http")
+async def request_context(request: Request, call_next):
+    """Tag each request with an id for its log lines and record its latency.
+
+    Streaming responses are timed until their headers are sent.
+    """
+    request_id = request.headers.get("X-Request-ID") or new_request_id()
+    token = REQUEST_ID.set(request_id)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Request-ID"] = request_id
+        return response
+    finally:
+        elapsed = time.perf_counter() - start
+        # Label by route template so path parameters do not create new series
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.observe(
+            elapsed, method=request.method, route=route.path if route else "unmatched", status=status
+        )
+        if request.url.path != "/metrics":
+            print(f"[request {request_id}] {request.method} {request.url.path} {status} ms={1000 * elapsed:.1f}")
+        REQUEST_ID.reset(token)
 
 # Data models
 class TestCaseRequest(BaseModel):
     query: str
     num_cases: Optional[int] = 5
+    bypass_cache: bool = False
+    # Test cases per parallel shard for large suites; None = server default, 0 = one prompt
+    shard_size: Optional[int] = None
 
 class ScriptGenerationRequest(BaseModel):
     test_case_id: str
     test_case_content: dict
+    bypass_cache: bool = False
+
+class BatchScriptGenerationRequest(BaseModel):
+    test_cases: List[dict]
+    max_concurrency: Optional[int] = None
+    bypass_cache: bool = False
+
+class UploadedFile(BaseModel):
+    filename: str
+    sha256: str
+
+class UploadCheckRequest(BaseModel):
+    files: List[UploadedFile]
 
 class KnowledgeBaseStatus(BaseModel):
     status: str
     num_documents: int
     num_chunks: int
     message: str
+    chunks_added: int = 0
+    chunks_removed: int = 0
 
-# Storage
-uploaded_html = ""
-knowledge_base_built = False
+async def get_workspace(x_workspace_id: str = Header(DEFAULT_WORKSPACE)):
+    """The caller's workspace (X-Workspace-ID header), kept in memory for the request"""
+    try:
+        workspace = await rag_engine.run_in_worker(workspaces.acquire, x_workspace_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        yield workspace
+    finally:
+        # May evict other idle workspaces to disk
+        await rag_engine.run_in_worker(workspaces.release, workspace)
+
+# Startup timings, in seconds since PROCESS_START
+startup_timings = {
+    "app_import": round(time.perf_counter() - PROCESS_START, 3),
+    "live": None,
+    "ready": None
+}
+startup_error = None
+
+def _warm_up():
+    """Load the embedding model in the background so startup is not blocked"""
+    global startup_error
+    try:
+        rag_engine.warm_up()
+        startup_timings["ready"] = round(time.perf_counter() - PROCESS_START, 3)
+        print(f"Backend ready in {startup_timings['ready']:.2f}s")
+    except Exception as e:
+        startup_error = str(e)
+        print(f"Warm-up failed: {e}")
+
+@app.on_event("startup")
+async def startup():
+    startup_timings["live"] = round(time.perf_counter() - PROCESS_START, 3)
+    print(f"Backend live in {startup_timings['live']:.2f}s, loading models in the background...")
+    threading.Thread(target=_warm_up, name="model-warm-up", daemon=True).start()
+    # Workers share their metrics through snapshot files, so /metrics on any worker reports totals
+    REGISTRY.enable_multiprocess(os.path.join(workspaces_dir, "metrics"))
+
+@app.on_event("shutdown")
+async def shutdown():
+    REGISTRY.close()
+    build_jobs.shutdown()
+    workspaces.close()
+    doc_processor.close()
+    await rag_engine.aclose()
 
 @app.get("/")
 async def root():
     return {"message": "Autonomous QA Agent API", "status": "running"}
 
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+async def _spool_upload(file: UploadFile, processor: DocumentProcessor) -> Tuple[str, str]:
+    """Copy an upload to the document storage directory in fixed-size chunks; returns (path, sha256)"""
+    path = processor.new_spool_path(file.filename)
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'wb') as out:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        processor.discard_upload(path)
+        raise
+    return path, digest.hexdigest()
+
+@app.post("/upload_documents/check")
+async def check_uploads(request: UploadCheckRequest, workspace: Workspace = Depends(get_workspace)):
+    """Tell a client which files (by name and SHA-256 of their bytes) it still has to upload"""
+    present = []
+    missing = []
+    for file in request.files:
+        if workspace.has_upload(file.filename, file.sha256.lower()):
+            present.append(file.filename)
+        else:
+            missing.append(file.filename)
+    
+    return {"present": present, "missing": missing}
+
 @app.post("/upload_documents")
-async def upload_documents(files: List[UploadFile] = File(...)):
-    """Upload and process support documents"""
+async def upload_documents(files: List[UploadFile] = File(...), workspace: Workspace = Depends(get_workspace)):
+    """Upload and process support documents.
+    
+    Files already uploaded with the same content are not extracted again, and
+    a new version of a file replaces the earlier one.
+    """
     try:
         processed_docs = []
+        spooled = []
+        hashes = []
+        new_documents = []
+        html = None
+        html_sha256 = None
         
-        for file in files:
-            content = await file.read()
+        # Nothing reaches the workspace until every file is extracted and the upload is recorded
+        try:
+            for file in files:
+                # Process based on file type
+                if file.filename.endswith('.html'):
+                    content = await file.read()
+                    sha256 = hashlib.sha256(content).hexdigest()
+                    if workspace.has_upload(file.filename, sha256):
+                        UPLOADED_FILES.inc(outcome="unchanged")
+                        processed_docs.append({"filename": file.filename, "type": "html", "unchanged": True})
+                        continue
+                    html = content.decode('utf-8')
+                    html_sha256 = sha256
+                    new_documents.append(
+                        await rag_engine.run_in_worker(workspace.doc_processor.html_document, html, sha256)
+                    )
+                    processed_docs.append({
+                        "filename": file.filename,
+                        "type": "html",
+                        "size": len(content)
+                    })
+                else:
+                    # Spool support documents to disk so large files never sit in memory whole
+                    path, sha256 = await _spool_upload(file, workspace.doc_processor)
+                    if workspace.has_upload(file.filename, sha256):
+                        os.remove(path)
+                        UPLOADED_FILES.inc(outcome="unchanged")
+                        processed_docs.append({"filename": file.filename, "type": "support_doc", "unchanged": True})
+                        continue
+                    spooled.append((path, file.filename))
+                    hashes.append(sha256)
             
-            # Process based on file type
-            if file.filename.endswith('.html'):
-                global uploaded_html
-                uploaded_html = content.decode('utf-8')
-                doc_processor.set_html_content(uploaded_html)
-                processed_docs.append({
-                    "filename": file.filename,
-                    "type": "html",
-                    "size": len(content)
-                })
-            else:
-                # Process as support document
-                text_content = doc_processor.process_file(
-                    content, 
-                    file.filename
-                )
+            # Extract all support documents in parallel, results in upload order, without storing them yet
+            docs = await rag_engine.run_in_worker(workspace.doc_processor.process_paths, spooled, None, False)
+            new_documents.extend(docs)
+            for doc, sha256 in zip(docs, hashes):
+                doc['sha256'] = sha256
                 processed_docs.append({
-                    "filename": file.filename,
+                    "filename": doc['filename'],
                     "type": "support_doc",
-                    "chunks": len(text_content) // 500
+                    "chunks": doc['size'] // 500,
+                    "extract_seconds": doc['extract_seconds']
                 })
+            
+            # Publish to the shared state, merging with uploads other workers took meanwhile;
+            # the workspace adopts the merged state only once it is stored
+            replaced = []
+            if new_documents:
+                replaced = await rag_engine.run_in_worker(workspace.record_upload, new_documents, html, html_sha256)
+        except BaseException:
+            # Including a client disconnect: drop this request's files, the workspace is unchanged
+            for path, _ in spooled:
+                workspace.doc_processor.discard_upload(path)
+            raise
+        UPLOADED_FILES.inc(len(replaced), outcome="replaced")
+        UPLOADED_FILES.inc(len(new_documents) - len(replaced), outcome="new")
         
+        unchanged = sum(1 for doc in processed_docs if doc.get('unchanged'))
         return {
             "status": "success",
             "processed_documents": processed_docs,
-            "message": f"Uploaded {len(files)} document(s)"
+            "replaced": replaced,
+            "message": f"Uploaded {len(files)} document(s), {unchanged} unchanged, {len(replaced)} replaced"
         }
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _run_build(job: BuildJob, workspace: Workspace, documents: List[dict]) -> dict:
+    """Build a workspace's knowledge base inside a background job"""
+    engine = workspace.build_knowledge_base(documents, progress=job.report)
+    
+    return KnowledgeBaseStatus(
+        status="success",
+        num_documents=len(documents),
+        num_chunks=engine.manifest.num_chunks(),
+        message="Knowledge base built successfully",
+        chunks_added=engine.last_build_stats.get('chunks_added', 0),
+        chunks_removed=engine.last_build_stats.get('chunks_removed', 0)
+    ).model_dump()
+
+def _submit_build(workspace: Workspace) -> BuildJob:
+    if not workspace.doc_processor.documents:
+        raise HTTPException(
+            status_code=400, 
+            detail="No documents uploaded. Please upload documents first."
+        )
+    
+    # The workspace stays in memory until the job finishes or is cancelled
+    workspaces.retain(workspace)
+    # Snapshot the document list so later uploads do not change a queued build
+    job = build_jobs.submit(
+        _run_build, workspace, list(workspace.doc_processor.documents), workspace_id=workspace.id
+    )
+    job.future.add_done_callback(lambda _: workspaces.release(workspace))
+    return job
+
 @app.post("/build_knowledge_base")
-async def build_knowledge_base() -> KnowledgeBaseStatus:
-    """Build vector database from uploaded documents"""
+async def build_knowledge_base(workspace: Workspace = Depends(get_workspace)) -> KnowledgeBaseStatus:
+    """Build vector database from uploaded documents and wait for it to finish"""
     try:
-        if not doc_processor.documents:
-            raise HTTPException(
-                status_code=400, 
-                detail="No documents uploaded. Please upload documents first."
-            )
-        
-        # Build knowledge base
-        num_chunks = rag_engine.build_knowledge_base(doc_processor.documents)
+        job = _submit_build(workspace)
+        try:
+            await asyncio.wrap_future(job.future)
+        except asyncio.CancelledError:
+            # Cancelled while still queued; anything else (e.g. a client disconnect) propagates
+            if not job.future.cancelled():
+                raise
         
-        global knowledge_base_built
-        knowledge_base_built = True
+        # A queued job's future is cancelled just before its status is updated
+        if job.future.cancelled() or job.status == 'cancelled':
+            raise HTTPException(status_code=409, detail="Build cancelled")
+        if job.status != 'succeeded':
+            raise HTTPException(status_code=500, detail=job.error or f"Build {job.status}")
         
-        return KnowledgeBaseStatus(
-            status="success",
-            num_documents=len(doc_processor.documents),
-            num_chunks=num_chunks,
-            message="Knowledge base built successfully"
-        )
+        return KnowledgeBaseStatus(**job.result)
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/build_knowledge_base/jobs", status_code=202)
+async def start_build_job(workspace: Workspace = Depends(get_workspace)):
+    """Start a background knowledge base build and return its job id"""
+    job = _submit_build(workspace)
+    return job.to_dict()
+
+@app.get("/build_knowledge_base/jobs/{job_id}")
+async def get_build_job(job_id: str):
+    """Report phase, progress and throughput of a build job, whichever worker runs it"""
+    job = build_jobs.lookup(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown build job: {job_id}")
+    return job
+
+@app.delete("/build_knowledge_base/jobs/{job_id}")
+async def cancel_build_job(job_id: str):
+    """Cancel a queued or running build job, whichever worker runs it"""
+    cancelled = build_jobs.cancel(job_id)
+    if cancelled is None:
+        raise HTTPException(status_code=404, detail=f"Unknown build job: {job_id}")
+    job = build_jobs.lookup(job_id)
+    if not cancelled:
+        raise HTTPException(status_code=409, detail=f"Build job already {job['status']}")
+    return job
+
 @app.post("/generate_test_cases")
-async def generate_test_cases(request: TestCaseRequest):
+async def generate_test_cases(request: TestCaseRequest, workspace: Workspace = Depends(get_workspace)):
     """Generate test cases using RAG + LLM"""
     try:
-        if not knowledge_base_built:
+        if not workspace.knowledge_base_built:
             raise HTTPException(
                 status_code=400,
                 detail="Knowledge base not built. Please build it first."
             )
         
         # Generate test cases
-        test_cases = rag_engine.generate_test_cases(
+        test_cases = await workspace.engine.agenerate_test_cases(
             query=request.query,
-            num_cases=request.num_cases
+            num_cases=request.num_cases,
+            use_cache=not request.bypass_cache,
+            shard_size=request.shard_size
         )
         
         return {
@@ -135,20 +439,61 @@ async def generate_test_cases(request: TestCaseRequest):
             "count": len(test_cases)
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _sse_event(event: str, data) -> str:
+    """Format a server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/generate_test_cases/stream")
+async def generate_test_cases_stream(request: TestCaseRequest, workspace: Workspace = Depends(get_workspace)):
+    """Stream test cases as server-sent events as soon as each one is complete"""
+    if not workspace.knowledge_base_built:
+        raise HTTPException(
+            status_code=400,
+            detail="Knowledge base not built. Please build it first."
+        )
+    workspace_id = workspace.id
+    
+    async def event_stream():
+        # The stream can outlive the request's hold on the workspace, so it takes its own
+        streaming_workspace = await rag_engine.run_in_worker(workspaces.acquire, workspace_id)
+        count = 0
+        try:
+            async for test_case in streaming_workspace.engine.astream_test_cases(
+                query=request.query,
+                num_cases=request.num_cases,
+                use_cache=not request.bypass_cache,
+                shard_size=request.shard_size
+            ):
+                count += 1
+                yield _sse_event("test_case", test_case)
+            yield _sse_event("done", {"status": "success", "count": count})
+        except Exception as e:
+            yield _sse_event("error", {"detail": str(e)})
+        finally:
+            await rag_engine.run_in_worker(workspaces.release, streaming_workspace)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/generate_selenium_script")
-async def generate_selenium_script(request: ScriptGenerationRequest):
+async def generate_selenium_script(request: ScriptGenerationRequest, workspace: Workspace = Depends(get_workspace)):
     """Generate Selenium script for a specific test case"""
     try:
-        if not knowledge_base_built:
+        if not workspace.knowledge_base_built:
             raise HTTPException(
                 status_code=400,
                 detail="Knowledge base not built. Please build it first."
             )
         
-        if not uploaded_html:
+        if not workspace.uploaded_html:
             raise HTTPException(
                 status_code=400,
                 detail="No HTML file uploaded. Please upload checkout.html."
@@ -157,9 +502,10 @@ async def generate_selenium_script(request: ScriptGenerationRequest):
         print(f"Generating script for test case: {request.test_case_id}")
         
         # Generate Selenium script - pass html_content parameter
-        script = rag_engine.generate_selenium_script(
+        script = await workspace.engine.agenerate_selenium_script(
             test_case=request.test_case_content,
-            html_content=uploaded_html
+            html_content=workspace.uploaded_html,
+            use_cache=not request.bypass_cache
         )
         
         return {
@@ -168,16 +514,124 @@ async def generate_selenium_script(request: ScriptGenerationRequest):
             "script": script
         }
     
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/generate_selenium_scripts")
+async def generate_selenium_scripts(request: BatchScriptGenerationRequest,
+                                    workspace: Workspace = Depends(get_workspace)):
+    """Generate Selenium scripts for a batch of test cases concurrently"""
+    try:
+        if not workspace.knowledge_base_built:
+            raise HTTPException(
+                status_code=400,
+                detail="Knowledge base not built. Please build it first."
+            )
+        
+        if not workspace.uploaded_html:
+            raise HTTPException(
+                status_code=400,
+                detail="No HTML file uploaded. Please upload checkout.html."
+            )
+        
+        if not request.test_cases:
+            raise HTTPException(status_code=400, detail="No test cases provided.")
+        
+        results = await workspace.engine.agenerate_selenium_scripts(
+            test_cases=request.test_cases,
+            html_content=workspace.uploaded_html,
+            max_concurrency=request.max_concurrency or rag_engine.llm_client.max_concurrency,
+            use_cache=not request.bypass_cache
+        )
+        
+        failed = sum(1 for result in results if result['status'] != 'success')
+        return {
+            "status": "success" if not failed else "partial",
+            "results": results,
+            "count": len(results),
+            "failed": failed
+        }
+    
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/cache_stats")
+async def cache_stats(workspace: Workspace = Depends(get_workspace)):
+    """Report hit/miss counters of the backend caches and prompt context savings"""
+    return {
+        "embeddings": rag_engine.embeddings.stats() if rag_engine.is_ready else None,
+        "retrieval": workspace.engine.retrieval_cache.stats(),
+        "llm_responses": rag_engine.response_cache.stats(),
+        "context_packing": rag_engine.context_packer.stats(),
+        "vector_store": workspace.engine.vector_store.stats() if workspace.engine.vector_store else None,
+        "corpus": workspace.engine.corpus.stats(),
+        "workspaces": workspaces.stats()
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """Stage latencies, LLM, cache and ingestion counters of all workers in the Prometheus text format"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.get("/health")
-async def health_check():
+async def health_check(x_workspace_id: str = Header(DEFAULT_WORKSPACE)):
+    """Process health and the workspace's stored state; nothing is loaded, created or evicted"""
+    try:
+        workspace_id = workspaces.validate_id(x_workspace_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # A read of the shared store, not acquire(), which would load the knowledge base
+    _, state = workspaces.store.get_workspace(workspace_id)
     return {
         "status": "healthy",
-        "knowledge_base_built": knowledge_base_built,
-        "html_uploaded": bool(uploaded_html),
-        "num_documents": len(doc_processor.documents)
+        "ready": rag_engine.is_ready,
+        "workspace": workspace_id,
+        "workspace_loaded": any(workspace.id == workspace_id for workspace in workspaces.loaded()),
+        "knowledge_base_built": state['knowledge_base_built'],
+        "html_uploaded": bool(state['html']),
+        "num_documents": len(state['documents']),
+        "build_in_progress": build_jobs.build_in_progress(),
+        "worker_pid": os.getpid(),
+        "startup_seconds": startup_timings
+    }
+
+@app.get("/workspaces")
+async def list_workspaces():
+    """Workspaces in memory and on disk, with the memory budget and eviction counters"""
+    return {"workspaces": workspaces.list(), **workspaces.stats()}
+
+@app.delete("/workspaces/{workspace_id}")
+async def delete_workspace(workspace_id: str):
+    """Delete a workspace's documents and knowledge base"""
+    try:
+        deleted = await rag_engine.run_in_worker(workspaces.delete, workspace_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not deleted:
+        raise HTTPException(status_code=409, detail=f"Workspace {workspace_id} is in use or being built")
+    return {"status": "deleted", "workspace_id": workspace_id}
+
+@app.get("/health/live")
+async def liveness():
+    """The process is up and serving requests"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness():
+    """The embedding model is loaded; returns 503 until then"""
+    if not rag_engine.is_ready:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "failed" if startup_error else "loading", "error": startup_error}
+        )
+    return {
+        "status": "ready",
+        "startup_seconds": startup_timings,
+        "model_load_seconds": round(rag_engine.model_load_seconds, 3)
     }
 
 if __name__ == "__main__":
@@ -0,0 +1,381 @@
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+# Id of the API request being served, "-" outside of a request
+REQUEST_ID = contextvars.ContextVar("request_id", default="-")
+
+# Latency buckets in seconds, from cache hits (sub-millisecond) to slow LLM calls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Prompt size buckets in (estimated) tokens
+TOKEN_BUCKETS = (250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000, 16000)
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(str(labels.get(name, "")) for name in self.labelnames), 0)
+
+    def snapshot(self) -> Dict[Tuple[str, ...], float]:
+        with self._lock:
+            return dict(self._values)
+
+    @staticmethod
+    def merge(into: Dict[Tuple[str, ...], float], values: Dict[Tuple[str, ...], float]):
+        for key, value in values.items():
+            into[key] = into.get(key, 0) + value
+
+    def samples(self, values: Dict[Tuple[str, ...], float] = None) -> List[str]:
+        values = self.snapshot() if values is None else values
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in values.items()
+        ]
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense, optionally split by labels"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [per-bucket counts (last one is +Inf), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels) -> int:
+        series = self._series.get(tuple(str(labels.get(name, "")) for name in self.labelnames))
+        return series[2] if series else 0
+
+    def snapshot(self) -> Dict[Tuple[str, ...], list]:
+        with self._lock:
+            return {key: [list(counts), total, count] for key, (counts, total, count) in self._series.items()}
+
+    @staticmethod
+    def merge(into: Dict[Tuple[str, ...], list], series: Dict[Tuple[str, ...], list]):
+        for key, (counts, total, count) in series.items():
+            merged = into.setdefault(key, [[0] * len(counts), 0.0, 0])
+            merged[0] = [a + b for a, b in zip(merged[0], counts)]
+            merged[1] += total
+            merged[2] += count
+
+    def samples(self, series: Dict[Tuple[str, ...], list] = None) -> List[str]:
+        series = self.snapshot() if series is None else series
+
+        lines = []
+        for key, (counts, total, count) in series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collects metrics and renders them in the Prometheus text exposition format.
+
+    Besides metric objects, callbacks can be registered for values that are
+    already counted elsewhere (such as cache hit counters); they are read at
+    scrape time, so the hot path pays nothing for them.
+
+    With enable_multiprocess(directory), every process periodically writes
+    a snapshot of its values to <directory>/<pid>.json, and render() adds
+    up the snapshots of all processes, so any worker serves the totals.
+    Counters and histograms keep the counts of processes that have exited
+    until a new process starts and clears out stale snapshots (as after a
+    restart); gauges only include processes whose snapshot is recent.
+    """
+
+    # Seconds between snapshots, and the age after which a process counts as gone
+    SNAPSHOT_INTERVAL = 2.0
+    STALE_AFTER = 3 * SNAPSHOT_INTERVAL
+
+    def __init__(self):
+        self._metrics: List[Any] = []
+        self._callbacks: List[Tuple[str, str, str, Tuple[str, ...], Callable, str]] = []
+        self.directory = None
+        self._stop = threading.Event()
+        self._writer = None
+
+    def counter(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_callback(self, name: str, kind: str, help: str, labelnames: Tuple[str, ...],
+                          collect: Callable[[], List[Tuple[Tuple[str, ...], float]]], aggregate: str = "sum"):
+        """collect() returns (label values, value) pairs; a name registered again is replaced.
+
+        aggregate says how values of several processes combine: "sum", or
+        "max" for gauges every process reports on its own (e.g. the size of
+        a knowledge base they all have loaded).
+        """
+        if aggregate not in ("sum", "max"):
+            raise ValueError(f"Unknown aggregate '{aggregate}', expected 'sum' or 'max'")
+        self._callbacks = [callback for callback in self._callbacks if callback[0] != name]
+        self._callbacks.append((name, kind, help, tuple(labelnames), collect, aggregate))
+
+    def _collect_callbacks(self) -> Dict[str, Dict[Tuple[str, ...], float]]:
+        values = {}
+        for name, _, _, _, collect, _ in self._callbacks:
+            try:
+                pairs = collect()
+            except Exception as e:
+                print(f"Metrics callback {name} failed: {e}")
+                continue
+            values[name] = {tuple(key): value for key, value in pairs if value is not None}
+        return values
+
+    def enable_multiprocess(self, directory: str):
+        """Share values with the other processes writing snapshots to directory"""
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        # Snapshots of earlier runs and long-gone processes would otherwise be counted forever
+        for snapshot in self._read_snapshots():
+            if time.time() - snapshot['time'] > self.STALE_AFTER:
+                try:
+                    os.remove(snapshot['path'])
+                except OSError:
+                    pass
+        self.write_snapshot()
+        self._stop.clear()
+        self._writer = threading.Thread(target=self._write_periodically, name="metrics-snapshot", daemon=True)
+        self._writer.start()
+
+    def _write_periodically(self):
+        while not self._stop.wait(self.SNAPSHOT_INTERVAL):
+            self.write_snapshot()
+
+    def write_snapshot(self):
+        """Write this process's values for the other processes to read"""
+        if self.directory is None:
+            return
+        snapshot = {
+            'time': time.time(),
+            'metrics': {
+                metric.name: [[list(key), value] for key, value in metric.snapshot().items()]
+                for metric in self._metrics
+            },
+            'callbacks': {
+                name: [[list(key), value] for key, value in values.items()]
+                for name, values in self._collect_callbacks().items()
+            }
+        }
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        try:
+            with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f)
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            print(f"Could not write metrics snapshot: {e}")
+
+    def _read_snapshots(self) -> List[Dict[str, Any]]:
+        snapshots = []
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, filename)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                # Removed or replaced meanwhile
+                continue
+            snapshot['path'] = path
+            snapshots.append(snapshot)
+        return snapshots
+
+    def _aggregate(self) -> Tuple[Dict[str, Dict], Dict[str, Dict[Tuple[str, ...], float]]]:
+        """Values of all processes, combined"""
+        self.write_snapshot()
+        metrics = {metric.name: {} for metric in self._metrics}
+        callbacks = {name: {} for name, *_ in self._callbacks}
+        merge = {metric.name: metric.merge for metric in self._metrics}
+        kinds = {name: (kind, aggregate) for name, kind, _, _, _, aggregate in self._callbacks}
+        now = time.time()
+        for snapshot in self._read_snapshots():
+            for name, values in snapshot['metrics'].items():
+                if name in metrics:
+                    merge[name](metrics[name], {tuple(key): value for key, value in values})
+            live = now - snapshot['time'] <= self.STALE_AFTER
+            for name, values in snapshot['callbacks'].items():
+                if name not in callbacks:
+                    continue
+                kind, aggregate = kinds[name]
+                if kind == "gauge" and not live:
+                    continue
+                combined = callbacks[name]
+                for key, value in values:
+                    key = tuple(key)
+                    if key not in combined:
+                        combined[key] = value
+                    elif aggregate == "max":
+                        combined[key] = max(combined[key], value)
+                    else:
+                        combined[key] += value
+        return metrics, callbacks
+
+    def render(self) -> str:
+        if self.directory is not None:
+            metric_values, callback_values = self._aggregate()
+        else:
+            metric_values, callback_values = {}, self._collect_callbacks()
+
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples(metric_values.get(metric.name)))
+
+        for name, kind, help, labelnames, _, _ in self._callbacks:
+            if name not in callback_values:
+                continue
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, value in callback_values[name].items():
+                lines.append(f"{name}{_format_labels(labelnames, key)} {_format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+    def close(self):
+        """Stop writing snapshots, leaving a final one behind"""
+        if self._writer is not None:
+            self._stop.set()
+            self._writer.join()
+            self._writer = None
+        self.write_snapshot()
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "qa_stage_duration_seconds", "Duration of pipeline stages", ("stage",)
+)
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "qa_http_request_duration_seconds", "API request latency", ("method", "route", "status")
+)
+LLM_CALLS = REGISTRY.counter(
+    "qa_llm_calls_total", "LLM generations by outcome (success, cache_hit, error)", ("outcome",)
+)
+LLM_FALLBACKS = REGISTRY.counter(
+    "qa_llm_fallbacks_total", "Mock responses or test cases used in place of LLM output", ("reason",)
+)
+TEST_CASE_PARSES = REGISTRY.counter(
+    "qa_test_case_parses_total", "LLM test case responses by parse outcome (complete, partial, empty)", ("outcome",)
+)
+TEST_CASES_REJECTED = REGISTRY.counter(
+    "qa_test_cases_rejected_total", "Parsed test cases dropped for failing schema validation"
+)
+LLM_REMAINDER_REQUESTS = REGISTRY.counter(
+    "qa_llm_remainder_requests_total", "Follow-up generations asking only for the missing test cases"
+)
+PROMPT_TOKENS = REGISTRY.histogram(
+    "qa_prompt_tokens", "Estimated prompt size in tokens", ("kind",), buckets=TOKEN_BUCKETS
+)
+CHUNKS_EMBEDDED = REGISTRY.counter(
+    "qa_chunks_embedded_total", "Chunks embedded and stored in the knowledge base"
+)
+CHUNKS_REMOVED = REGISTRY.counter(
+    "qa_chunks_removed_total", "Stale chunks removed from the knowledge base"
+)
+UPLOADED_FILES = REGISTRY.counter(
+    "qa_uploaded_files_total", "Uploaded files by outcome (new, replaced, unchanged)", ("outcome",)
+)
+DOCUMENTS_EXTRACTED = REGISTRY.counter(
+    "qa_documents_extracted_total", "Uploaded documents extracted to text", ("type",)
+)
+
+
+@contextmanager
+def span(stage: str, **fields) -> Iterator[Dict[str, Any]]:
+    """Time a pipeline stage into qa_stage_duration_seconds.
+
+    Inside an API request the span is also logged with the request id, so
+    all stages of one request can be found together. The yielded dict can
+    be filled with extra fields to log.
+    """
+    start = time.perf_counter()
+    try:
+        yield fields
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        request_id = REQUEST_ID.get()
+        if request_id != "-":
+            details = "".join(f" {key}={value}" for key, value in fields.items())
+            print(f"[request {request_id}] span={stage} ms={1000 * elapsed:.1f}{details}")
+
+
+def observe_stage(stage: str, seconds: float):
+    """Record a stage duration measured elsewhere (e.g. in a worker process)"""
+    STAGE_SECONDS.observe(seconds, stage=stage)
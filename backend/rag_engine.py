@@ -1,131 +1,948 @@
 import os
 import json
-from typing import List, Dict, Any
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import Chroma
-from langchain_core.documents import Document
-import requests
+import asyncio
+import contextvars
+import copy
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, AsyncIterator, Callable, Iterator, Tuple
 import re
 
+# LangChain, Chroma and sentence-transformers are imported on first use so the
+# API process can start serving before the embedding model is loaded
+from backend.chunk_manifest import ChunkManifest, stream_hash, chunk_hash
+from backend.document_processor import iter_document_text
+from backend.llm_client import OllamaClient, LLMError
+from backend.json_stream import TestCaseStreamParser, salvage_test_cases
+from backend.test_case_schema import normalize_test_case
+from backend.dom_index import get_dom_index
+from backend.retrieval_cache import RetrievalCache
+from backend.lexical_index import BM25Index
+from backend.corpus_store import CorpusStore
+from backend.response_cache import ResponseCache
+from backend.context_packer import ContextPacker, estimate_tokens
+from backend.sharding import TestSuiteMerger, extract_features, plan_shards
+from backend.vector_store import VectorStore, ChromaVectorStore, FlatVectorStore
+from backend.embedding_backends import create_embeddings, DEFAULT_ONNX_FILE, EMBEDDING_BACKENDS
+from backend.metrics import (
+    span, observe_stage, LLM_CALLS, LLM_FALLBACKS, PROMPT_TOKENS, CHUNKS_EMBEDDED, CHUNKS_REMOVED,
+    TEST_CASE_PARSES, TEST_CASES_REJECTED, LLM_REMAINDER_REQUESTS
+)
+
 class RAGEngine:
-    def __init__(self, ollama_url: str = "http://localhost:11434"):
+    COLLECTION_NAME = "qa_knowledge_base"
+    EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+    EMBED_BATCH_SIZE = 64
+    VECTOR_BACKENDS = ("chroma", "flat")
+    SPLIT_SEGMENT_SIZE = 256 * 1024
+    
+    # Hybrid retrieval: candidates taken from each ranking, and the RRF constant
+    HYBRID_CANDIDATES = 20
+    RRF_K = 60
+    # Query identifiers (e.g. SAVE15) found in at most this many chunks rank those chunks a third time
+    EXACT_MATCH_MAX_CHUNKS = 3
+    
+    # Candidate chunks retrieved per prompt (see the context token budgets in __init__)
+    TEST_CASE_CONTEXT_K = 8
+    SCRIPT_CONTEXT_K = 5
+    
+    # Chunks retrieved to plan a sharded test suite into feature slices
+    SHARD_PLAN_K = 16
+
+    def __init__(self, ollama_url: str = "http://localhost:11434", persist_directory: str = "./vector_db",
+                 embedding_cache_path: str = "./embedding_cache/embeddings.sqlite3",
+                 embedding_cache_size: int = 100000,
+                 llm_concurrency: int = 4, worker_threads: int = 4,
+                 vector_backend: str = "chroma", flat_index_mmap: bool = False, vector_quantize: bool = False,
+                 embedding_backend: str = "huggingface", embedding_batch_size: int = 64,
+                 embedding_threads: int = None, embedding_onnx_file: str = DEFAULT_ONNX_FILE,
+                 embedding_local_only: bool = False,
+                 llm_cache_path: str = "./llm_cache/responses.sqlite3",
+                 llm_cache_ttl: float = 24 * 3600, llm_cache_size: int = 5000,
+                 test_case_shard_size: int = 10,
+                 test_case_context_tokens: int = 1000, script_context_tokens: int = 800):
         """Initialize RAG engine with embeddings and vector store"""
+        if vector_backend not in self.VECTOR_BACKENDS:
+            raise ValueError(f"Unknown vector backend '{vector_backend}', expected one of {self.VECTOR_BACKENDS}")
+        if embedding_backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"Unknown embedding backend '{embedding_backend}', expected one of {EMBEDDING_BACKENDS}")
+        
         self.ollama_url = ollama_url
+        self.persist_directory = persist_directory
+        self.vector_backend = vector_backend
+        self.flat_index_mmap = flat_index_mmap
+        # int8 storage needs our own index; Chroma always stores float32
+        self.vector_quantize = vector_quantize and vector_backend == "flat"
+        if vector_quantize and not self.vector_quantize:
+            print("Vector quantization requires the flat vector backend; storing float32 vectors")
+        
+        # Pooled keep-alive client shared by all LLM calls
+        self.llm_client = OllamaClient(ollama_url, max_concurrency=llm_concurrency)
+        
+        # Embedding, Chroma and HTML parsing work runs here, off the event loop
+        self.executor = ThreadPoolExecutor(max_workers=worker_threads, thread_name_prefix="rag-worker")
+        
+        # Embeddings and text splitter are created lazily (see the properties below)
+        self.embedding_cache_path = embedding_cache_path
+        self.embedding_cache_size = embedding_cache_size
+        self.embedding_backend = embedding_backend
+        self.embedding_batch_size = embedding_batch_size
+        self.embedding_threads = embedding_threads
+        self.embedding_onnx_file = embedding_onnx_file
+        self.embedding_local_only = embedding_local_only
+        self._embeddings = None
+        self._text_splitter = None
+        self._model_lock = threading.Lock()
+        self.model_load_seconds = None
+        # Engine whose models, pools and shared caches this one uses (see for_workspace)
+        self._base = None
+        
+        self.vector_store: VectorStore = None
+        self.documents = []
+        
+        # Manifest, corpus and lexical index are read from disk on first use (see the
+        # properties below), so an engine that only serves as the base of workspace
+        # engines never loads a knowledge base of its own
+        self._manifest = None
+        self._corpus = None
+        self._lexical_index = None
+        self._state_lock = threading.Lock()
+        self.last_build_stats = {}
+        
+        # Retrieval results, invalidated whenever the knowledge base revision changes
+        self.retrieval_cache = RetrievalCache()
+        
+        # LLM responses, so repeating an identical generation skips Ollama
+        self.response_cache = ResponseCache(llm_cache_path, ttl_seconds=llm_cache_ttl, max_entries=llm_cache_size)
+        
+        # Deduplicates and budgets retrieved chunks before they go into prompts
+        self.context_packer = ContextPacker()
+        # Token budgets of the packed context; three full chunks (3 x 1000 characters) fit in 800
+        self.test_case_context_tokens = test_case_context_tokens
+        self.script_context_tokens = script_context_tokens
+        
+        # Larger test suites are generated in shards of this many cases (0 = never shard)
+        self.test_case_shard_size = test_case_shard_size
+    
+    def for_workspace(self, persist_directory: str) -> "RAGEngine":
+        """Engine over a separate knowledge base stored in persist_directory.
+        
+        The embedding model, LLM client, worker pool, embedding and LLM
+        response caches and context packer are shared with this engine; the
+        vector store, manifest, corpus, lexical index and retrieval cache are its own.
+        """
+        engine = copy.copy(self)
+        engine._base = self._base or self
+        engine._embeddings = None
+        engine.persist_directory = persist_directory
+        engine.vector_store = None
+        engine.documents = []
+        engine._manifest = None
+        engine._corpus = None
+        engine._lexical_index = None
+        engine._state_lock = threading.Lock()
+        engine.last_build_stats = {}
+        engine.retrieval_cache = RetrievalCache()
+        return engine
+    
+    @property
+    def manifest(self) -> ChunkManifest:
+        """Manifest of embedded chunks, used for incremental rebuilds"""
+        if self._manifest is None:
+            with self._state_lock:
+                if self._manifest is None:
+                    self._manifest = ChunkManifest(os.path.join(self.persist_directory, "manifest.json"))
+        return self._manifest
+    
+    @property
+    def corpus(self) -> CorpusStore:
+        """Chunk text, stored once and memory-mapped; the indexes only keep chunk ids"""
+        if self._corpus is None:
+            with self._state_lock:
+                if self._corpus is None:
+                    self._corpus = CorpusStore(self.persist_directory)
+        return self._corpus
+    
+    @property
+    def lexical_index(self) -> BM25Index:
+        """BM25 index over the same chunks, for exact tokens like SAVE15 or element ids"""
+        if self._lexical_index is None:
+            with self._state_lock:
+                if self._lexical_index is None:
+                    self._lexical_index = BM25Index(os.path.join(self.persist_directory, "lexical_index.json"))
+        return self._lexical_index
+    
+    @property
+    def embeddings(self):
+        """Cached sentence-transformers embeddings, loaded on first use"""
+        if self._base is not None:
+            return self._base.embeddings
+        if self._embeddings is None:
+            with self._model_lock:
+                if self._embeddings is None:
+                    self._embeddings = self._load_embeddings()
+        return self._embeddings
+    
+    def _load_embeddings(self):
+        from backend.embedding_cache import CachedEmbeddings
         
         # Initialize embeddings (using sentence-transformers)
-        print("Loading embeddings model...")
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2",
-            model_kwargs={'device': 'cpu'}
+        print(f"Loading embeddings model ({self.embedding_backend})...")
+        start = time.perf_counter()
+        base_embeddings = create_embeddings(
+            self.embedding_backend,
+            self.EMBEDDING_MODEL,
+            batch_size=self.embedding_batch_size,
+            num_threads=self.embedding_threads,
+            onnx_file=self.embedding_onnx_file,
+            local_files_only=self.embedding_local_only
         )
         
-        # Text splitter for chunking
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len,
-            separators=["\n\n", "\n", ". ", " ", ""]
+        # Quantized runtimes give slightly different vectors, so they get their own cache entries
+        cache_model_name = self.EMBEDDING_MODEL
+        if self.embedding_backend == "onnx":
+            cache_model_name = f"{self.EMBEDDING_MODEL}@onnx:{self.embedding_onnx_file}"
+        
+        # Shared by ingestion and retrieval so repeated chunks and queries skip the model
+        embeddings = CachedEmbeddings(
+            base_embeddings,
+            model_name=cache_model_name,
+            cache_path=self.embedding_cache_path,
+            max_entries=self.embedding_cache_size
         )
+        self.model_load_seconds = time.perf_counter() - start
+        print(f"Embeddings model loaded in {self.model_load_seconds:.2f}s")
+        return embeddings
+    
+    @property
+    def text_splitter(self):
+        """Text splitter for chunking"""
+        if self._text_splitter is None:
+            from langchain_text_splitters import RecursiveCharacterTextSplitter
+            
+            self._text_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=1000,
+                chunk_overlap=200,
+                length_function=len,
+                separators=["\n\n", "\n", ". ", " ", ""]
+            )
+        return self._text_splitter
+    
+    @property
+    def is_ready(self) -> bool:
+        """True once the embedding model is loaded"""
+        return (self._base or self)._embeddings is not None
+    
+    def warm_up(self):
+        """Load the embedding model and heavy libraries ahead of the first request"""
+        self.embeddings.embed_query("warm up")
+        _ = self.text_splitter
+    
+    def _create_vector_store(self) -> VectorStore:
+        """Instantiate the configured vector store backend"""
+        if self.vector_backend == "flat":
+            return FlatVectorStore(
+                self.embeddings, self.persist_directory,
+                mmap=self.flat_index_mmap, quantize=self.vector_quantize, corpus=self.corpus
+            )
+        return ChromaVectorStore(self.embeddings, self.persist_directory, self.COLLECTION_NAME)
+    
+    def _open_vector_store(self) -> VectorStore:
+        """Open the persistent vector store, resetting it if it does not match the manifest"""
+        if self.vector_store is not None:
+            return self.vector_store
         
-        self.vector_store = None
-        self.documents = []
+        self.vector_store = self._create_vector_store()
+        
+        existing = self.vector_store.ids()
+        manifest_ids = {chunk_id for source in self.manifest.sources for chunk_id in self.manifest.chunk_ids(source)}
+        if not self.manifest.loaded or set(existing) != manifest_ids:
+            # Without a matching manifest (e.g. after switching backends) we
+            # cannot tell which stored chunks are current, so start over
+            if existing:
+                print(f"Chunk manifest does not match the vector store, clearing {len(existing)} stale chunks")
+                self.vector_store.delete(existing)
+                self.vector_store.save()
+            if self.manifest.sources:
+                self.manifest.clear()
+                self.manifest.revision += 1
+                self.manifest.save()
+            self.manifest.loaded = True
+            self.lexical_index.clear()
+            self.corpus.clear()
+            self.corpus.save()
+        else:
+            missing = manifest_ids.difference(self.corpus.ids())
+            if missing or (not self.lexical_index.loaded and self.manifest.num_chunks()):
+                # Knowledge base built before the corpus store or lexical index existed
+                ids, texts, metadatas = self.vector_store.get_all()
+                print(f"Indexing {len(ids)} stored chunks")
+                for chunk_id, text, metadata in zip(ids, texts, metadatas):
+                    if chunk_id in missing:
+                        self.corpus.add(chunk_id, metadata.get('source', 'unknown'), text)
+                    if not self.lexical_index.loaded:
+                        self.lexical_index.add(chunk_id, text, metadata)
+                self.corpus.save()
+                self.lexical_index.save()
+        self.lexical_index.loaded = True
+        
+        return self.vector_store
+    
+    def _iter_chunks(self, doc: Dict[str, str]) -> Iterator[str]:
+        """Split a document into chunks, reading its text in bounded segments"""
+        buffer = ""
+        for block in iter_document_text(doc):
+            buffer += block
+            if len(buffer) < self.SPLIT_SEGMENT_SIZE:
+                continue
+            
+            # Cut at a paragraph (or line) break so chunks rarely straddle segments
+            cut = buffer.rfind("\n\n")
+            if cut <= 0:
+                cut = buffer.rfind("\n")
+            if cut <= 0:
+                cut = len(buffer)
+            
+            yield from self.text_splitter.split_text(buffer[:cut])
+            buffer = buffer[cut:]
+        
+        if buffer:
+            yield from self.text_splitter.split_text(buffer)
     
-    def build_knowledge_base(self, documents: List[Dict[str, str]]) -> int:
-        """Build vector database from documents"""
-        self.documents = documents
+    def build_knowledge_base(self, documents: List[Dict[str, str]],
+                             progress: Callable[[str, int, int], None] = None) -> int:
+        """Incrementally sync the vector database with the given documents.
+        
+        Only chunks of new or changed sources are embedded; chunks of removed
+        or edited sources are deleted. Returns the total number of chunks in
+        the knowledge base.
+        
+        Documents are read as a stream (see iter_document_text) in two passes:
+        one to plan which chunks changed and one to embed them, so only a
+        batch of chunk texts is held in memory at a time.
         
-        # Create LangChain documents with metadata
-        docs = []
+        progress(phase, done, total) is called as the build advances and may
+        raise to abort it; the manifest always reflects what was stored.
+        """
+        with span("build_knowledge_base", documents=len(documents)) as fields:
+            num_chunks = self._sync_knowledge_base(documents, progress)
+            fields.update(self.last_build_stats)
+        return num_chunks
+    
+    def _sync_knowledge_base(self, documents: List[Dict[str, str]],
+                             progress: Callable[[str, int, int], None] = None) -> int:
+        """Build the knowledge base; the body of build_knowledge_base, timed as one span"""
+        report = progress or (lambda phase, done, total: None)
+        
+        # Later uploads of the same file replace earlier ones
+        current = {}
         for doc in documents:
-            chunks = self.text_splitter.split_text(doc['content'])
-            for i, chunk in enumerate(chunks):
-                docs.append(Document(
-                    page_content=chunk,
-                    metadata={
-                        'source': doc['filename'],
+            current[doc['filename']] = doc
+        
+        vector_store = self._open_vector_store()
+        
+        # Plan the sync without touching the store or manifest
+        removed_sources = [source for source in self.manifest.sources if source not in current]
+        plans = []
+        pending = {}
+        num_pending = 0
+        ids_to_update = []
+        metadatas_to_update = []
+        unchanged_sources = 0
+        
+        split_start = time.perf_counter()
+        report('splitting', 0, len(current))
+        for n, (source, doc) in enumerate(current.items()):
+            source_hash = stream_hash(iter_document_text(doc))
+            if self.manifest.source_hash(source) == source_hash:
+                unchanged_sources += 1
+                report('splitting', n + 1, len(current))
+                continue
+            
+            old_ids = set(self.manifest.chunk_ids(source))
+            
+            new_ids = []
+            seen = set()
+            updated = []
+            to_embed = {}
+            total_chunks = 0
+            for i, chunk in enumerate(self._iter_chunks(doc)):
+                total_chunks += 1
+                chunk_id = chunk_hash(source, chunk)
+                if chunk_id in seen:
+                    continue
+                seen.add(chunk_id)
+                new_ids.append(chunk_id)
+                
+                if chunk_id in old_ids:
+                    # Same text, possibly at a new position: refresh metadata only
+                    updated.append((chunk_id, i))
+                else:
+                    to_embed[chunk_id] = i
+            
+            for chunk_id, i in updated:
+                ids_to_update.append(chunk_id)
+                metadatas_to_update.append({
+                    'source': source,
+                    'chunk_id': i,
+                    'total_chunks': total_chunks
+                })
+            
+            if to_embed:
+                pending[source] = (to_embed, total_chunks)
+                num_pending += len(to_embed)
+            
+            stale_ids = [chunk_id for chunk_id in old_ids if chunk_id not in seen]
+            plans.append((source, source_hash, new_ids, stale_ids))
+            report('splitting', n + 1, len(current))
+        observe_stage("build_plan", time.perf_counter() - split_start)
+        
+        # Apply deletions and metadata refreshes
+        report('indexing', 0, num_pending)
+        ids_to_delete = []
+        for source in removed_sources:
+            ids_to_delete.extend(self.manifest.remove_source(source))
+        
+        remaining = {}
+        final_ids = {}
+        for source, source_hash, new_ids, stale_ids in plans:
+            ids_to_delete.extend(stale_ids)
+            remaining[source] = len(pending[source][0]) if source in pending else 0
+            final_ids[source] = (source_hash, new_ids)
+            # Until its new chunks are stored, a source keeps no hash so the next build retries it
+            stale = set(stale_ids)
+            self.manifest.set_source(
+                source, None,
+                [chunk_id for chunk_id in self.manifest.chunk_ids(source) if chunk_id not in stale]
+            )
+        
+        embedded = 0
+        
+        def flush(batch):
+            nonlocal embedded
+            # Stored first so a search never finds a chunk without its text
+            for source, chunk_id, chunk, metadata, location in batch:
+                if location is None:
+                    self.corpus.add(chunk_id, source, chunk)
+                else:
+                    self.corpus.put(chunk_id, source, *location)
+            try:
+                with span("embed_batch", chunks=len(batch)):
+                    vector_store.add(
+                        ids=[chunk_id for _, chunk_id, _, _, _ in batch],
+                        texts=[chunk for _, _, chunk, _, _ in batch],
+                        metadatas=[metadata for _, _, _, metadata, _ in batch]
+                    )
+            except BaseException:
+                for _, chunk_id, _, _, _ in batch:
+                    self.corpus.remove(chunk_id)
+                raise
+            CHUNKS_EMBEDDED.inc(len(batch))
+            
+            for source, chunk_id, chunk, metadata, _ in batch:
+                self.lexical_index.add(chunk_id, chunk, metadata)
+                self.manifest.add_chunk(source, chunk_id)
+                remaining[source] -= 1
+                if remaining[source] == 0:
+                    self.manifest.set_source(source, *final_ids[source])
+            
+            embedded += len(batch)
+            report('embedding', embedded, num_pending)
+        
+        if ids_to_delete or ids_to_update or num_pending:
+            self.manifest.revision += 1
+        
+        try:
+            if ids_to_delete:
+                print(f"Removing {len(ids_to_delete)} stale chunks...")
+                vector_store.delete(ids_to_delete)
+                for chunk_id in ids_to_delete:
+                    self.lexical_index.remove(chunk_id)
+                    self.corpus.remove(chunk_id)
+                CHUNKS_REMOVED.inc(len(ids_to_delete))
+            
+            if ids_to_update:
+                vector_store.update_metadata(ids_to_update, metadatas_to_update)
+                for chunk_id, metadata in zip(ids_to_update, metadatas_to_update):
+                    self.lexical_index.update_metadata(chunk_id, metadata)
+            
+            for source, count in remaining.items():
+                if count == 0:
+                    self.manifest.set_source(source, *final_ids[source])
+            
+            # Re-read changed sources and embed their new chunks in batches, so
+            # memory stays bounded and progress and cancellation stay responsive
+            if num_pending:
+                print(f"Embedding {num_pending} new chunks...")
+            report('embedding', 0, num_pending)
+            
+            batch = []
+            for source, (to_embed, total_chunks) in pending.items():
+                # The source's text goes into the corpus once; its chunks point into it
+                start, length = self.corpus.append_text(iter_document_text(current[source]))
+                cursor, end = start, start + length
+                for i, chunk in enumerate(self._iter_chunks(current[source])):
+                    chunk_id = chunk_hash(source, chunk)
+                    location = self.corpus.find(chunk, cursor, end)
+                    if location is not None:
+                        # Chunks come in text order, overlapping their predecessor
+                        cursor = location[0] + 1
+                    if to_embed.get(chunk_id) != i:
+                        if location is not None and chunk_id in self.corpus:
+                            # Kept chunk: move it to the new copy so the old one can be compacted away
+                            self.corpus.put(chunk_id, source, *location)
+                        continue
+                    
+                    batch.append((source, chunk_id, chunk, {
+                        'source': source,
                         'chunk_id': i,
-                        'total_chunks': len(chunks)
-                    }
-                ))
-        
-        # Create vector store
-        print(f"Creating vector store with {len(docs)} chunks...")
-        self.vector_store = Chroma.from_documents(
-            documents=docs,
-            embedding=self.embeddings,
-            persist_directory="./vector_db"
-        )
+                        'total_chunks': total_chunks
+                    }, location))
+                    if len(batch) >= self.EMBED_BATCH_SIZE:
+                        flush(batch)
+                        batch = []
+            
+            if batch:
+                flush(batch)
+        
+        finally:
+            vector_store.save()
+            self.corpus.save()
+            self.manifest.save()
+            self.lexical_index.save()
+        
+        self.documents = list(current.values())
+        self.last_build_stats = {
+            'chunks_added': num_pending,
+            'chunks_removed': len(ids_to_delete),
+            'unchanged_sources': unchanged_sources
+        }
+        print(f"Knowledge base synced: {self.last_build_stats}")
         
-        return len(docs)
+        return self.manifest.num_chunks()
     
-    def retrieve_context(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
+    def load_knowledge_base(self) -> int:
+        """Open a previously built knowledge base from disk; returns its number of chunks"""
+        self._open_vector_store()
+        return self.manifest.num_chunks()
+    
+    def close_knowledge_base(self):
+        """Release the vector store; the knowledge base stays on disk and can be loaded again"""
+        if self.vector_store is not None:
+            self.vector_store.close()
+            self.vector_store = None
+        if self._corpus is not None:
+            self._corpus.close()
+    
+    @property
+    def kb_version(self) -> int:
+        """Revision of the knowledge base; changes whenever its chunks change"""
+        return self.manifest.revision
+    
+    def retrieve_context(self, query: str, k: int = 5,
+                         filters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
         """Retrieve relevant context from vector store"""
         if not self.vector_store:
             return []
         
-        results = self.vector_store.similarity_search_with_score(query, k=k)
+        with span("retrieve", k=k) as fields:
+            revision = self.kb_version
+            key = self.retrieval_cache.key(query, k, filters)
+            cached = self.retrieval_cache.get(revision, key)
+            fields['cached'] = cached is not None
+            if cached is not None:
+                return cached
+            
+            start = time.perf_counter()
+            results = self.vector_store.search(query, max(k, self.HYBRID_CANDIDATES), filters)
+            context = self._fuse(self._format_results(results), *self._lexical_search(query, filters), k=k)
+            
+            self.retrieval_cache.put(revision, key, context, time.perf_counter() - start)
+            return context
+    
+    def retrieve_context_batch(self, queries: List[str], k: int = 5,
+                               filters: Dict[str, Any] = None) -> List[List[Dict[str, Any]]]:
+        """Retrieve context for many queries, embedding all cache misses in one batch"""
+        if not self.vector_store or not queries:
+            return [[] for _ in queries]
         
+        revision = self.kb_version
+        keys = [self.retrieval_cache.key(query, k, filters) for query in queries]
+        contexts = [self.retrieval_cache.get(revision, key) for key in keys]
+        
+        # Distinct queries that still need a search
+        missing = {}
+        for query, key, context in zip(queries, keys, contexts):
+            if context is None and key not in missing:
+                missing[key] = query
+        
+        if missing:
+            start = time.perf_counter()
+            with span("embed_queries", queries=len(missing)):
+                vectors = self.embeddings.embed_documents(list(missing.values()))
+            embed_seconds = (time.perf_counter() - start) / len(missing)
+            
+            computed = {}
+            for key, vector in zip(missing, vectors):
+                start = time.perf_counter()
+                with span("retrieve", k=k, cached=False):
+                    results = self.vector_store.search_by_vector(vector, max(k, self.HYBRID_CANDIDATES), filters)
+                    computed[key] = self._fuse(
+                        self._format_results(results), *self._lexical_search(missing[key], filters), k=k
+                    )
+                self.retrieval_cache.put(
+                    revision, key, computed[key], embed_seconds + time.perf_counter() - start
+                )
+            
+            contexts = [
+                context if context is not None else [dict(result) for result in computed[key]]
+                for key, context in zip(keys, contexts)
+            ]
+        
+        return contexts
+    
+    def _format_results(self, results) -> List[Dict[str, Any]]:
+        """Convert (document, score) pairs into context dicts"""
         context = []
         for doc, score in results:
             context.append({
                 'content': doc.page_content,
                 'source': doc.metadata.get('source', 'unknown'),
+                'chunk_id': doc.metadata.get('chunk_id'),
                 'score': float(score)
             })
         
         return context
     
-    def call_llm(self, prompt: str, model: str = "llama3.2") -> str:
+    def _lexical_search(self, query: str,
+                        filters: Dict[str, Any] = None) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """BM25 candidates in the same shape as _format_results, and the ones among them with a rare query identifier.
+        
+        Embeddings barely tell SAVE15 from SAVE20, so chunks containing an
+        identifier of the query that few chunks have are fused as a ranking
+        of their own.
+        """
+        if filters and any(key.startswith('$') or isinstance(value, dict) for key, value in filters.items()):
+            # Only plain equality filters are supported; fall back to vector results alone
+            return [], []
+        
+        exact_ids = self.lexical_index.exact_matches(query, self.EXACT_MATCH_MAX_CHUNKS)
+        context = []
+        exact = []
+        for chunk_id, score in self.lexical_index.search(query, k=self.HYBRID_CANDIDATES, filters=filters):
+            doc = self.lexical_index.get(chunk_id)
+            text = self.corpus.text(chunk_id)
+            if doc is None or text is None:
+                continue
+            context.append({
+                'content': text,
+                'source': doc['metadata'].get('source', 'unknown'),
+                'chunk_id': doc['metadata'].get('chunk_id'),
+                'score': score
+            })
+            if chunk_id in exact_ids:
+                exact.append(context[-1])
+        
+        return context, exact
+    
+    def _fuse(self, *rankings: List[Dict[str, Any]], k: int = 5) -> List[Dict[str, Any]]:
+        """Merge ranked result lists with reciprocal rank fusion; 'score' becomes the fused score"""
+        fused = {}
+        best_rank = {}
+        for ranking in rankings:
+            for rank, result in enumerate(ranking):
+                key = (result['source'], result['chunk_id'], result['content'])
+                entry = fused.setdefault(key, dict(result, score=0.0))
+                entry['score'] += 1.0 / (self.RRF_K + rank + 1)
+                best_rank[key] = min(best_rank.get(key, rank), rank)
+        
+        # Ties go to the better rank in either list, then source and position, so the
+        # order does not depend on which list a result came from or the order of the lists
+        def order(key):
+            source, chunk_id, content = key
+            return (-fused[key]['score'], best_rank[key], str(source), -1 if chunk_id is None else chunk_id, content)
+        
+        return [fused[key] for key in sorted(fused, key=order)[:k]]
+    
+    LLM_OPTIONS = {
+        "temperature": 0.7,
+        "max_tokens": 2000
+    }
+    
+    async def run_in_worker(self, func, *args):
+        """Run blocking work on the engine's worker pool"""
+        loop = asyncio.get_running_loop()
+        # Carry the request id along so spans in the worker are logged under it
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self.executor, functools.partial(context.run, func, *args))
+    
+    def _cached_response(self, key: str, use_cache: bool) -> str:
+        """Look up a cached LLM response; a bypassed lookup still refreshes the entry afterwards"""
+        if not use_cache:
+            self.response_cache.bypasses += 1
+            return None
+        
+        cached = self.response_cache.get(key)
+        if cached is not None:
+            LLM_CALLS.inc(outcome="cache_hit")
+            print("LLM response served from cache")
+        return cached
+    
+    def call_llm(self, prompt: str, model: str = "llama3.2", use_cache: bool = True) -> str:
         """Call Ollama LLM API"""
+        key = self.response_cache.key(model, self.LLM_OPTIONS, prompt)
+        cached = self._cached_response(key, use_cache)
+        if cached is not None:
+            return cached
+        
         try:
             print(f"Calling LLM with model: {model}...")
-            response = requests.post(
-                f"{self.ollama_url}/api/generate",
-                json={
-                    "model": model,
-                    "prompt": prompt,
-                    "stream": False,
-                    "temperature": 0.7,
-                    "max_tokens": 2000
-                },
-                timeout=120
-            )
-            
-            if response.status_code == 200:
-                result = response.json()['response']
-                print("LLM response received successfully")
-                return result
-            else:
-                print(f"LLM call failed with status {response.status_code}")
-                return self._mock_llm_response(prompt)
+            start = time.perf_counter()
+            with span("llm_call", model=model):
+                result = self.llm_client.generate(prompt, model, self.LLM_OPTIONS)
+            LLM_CALLS.inc(outcome="success")
+            print("LLM response received successfully")
+            self.response_cache.put(key, model, result, time.perf_counter() - start)
+            return result
         
-        except Exception as e:
+        except LLMError as e:
+            LLM_CALLS.inc(outcome="error")
+            LLM_FALLBACKS.inc(reason="llm_error")
             print(f"LLM call failed: {e}. Using mock response.")
             return self._mock_llm_response(prompt)
     
-    def generate_test_cases(self, query: str, num_cases: int = 5) -> List[Dict[str, Any]]:
+    async def acall_llm(self, prompt: str, model: str = "llama3.2", use_cache: bool = True) -> str:
+        """Call Ollama LLM API without blocking the event loop"""
+        key = self.response_cache.key(model, self.LLM_OPTIONS, prompt)
+        cached = await self.run_in_worker(self._cached_response, key, use_cache)
+        if cached is not None:
+            return cached
+        
+        try:
+            print(f"Calling LLM with model: {model}...")
+            start = time.perf_counter()
+            with span("llm_call", model=model):
+                result = await self.llm_client.agenerate(prompt, model, self.LLM_OPTIONS)
+            LLM_CALLS.inc(outcome="success")
+            print("LLM response received successfully")
+            await self.run_in_worker(self.response_cache.put, key, model, result, time.perf_counter() - start)
+            return result
+        
+        except LLMError as e:
+            LLM_CALLS.inc(outcome="error")
+            LLM_FALLBACKS.inc(reason="llm_error")
+            print(f"LLM call failed: {e}. Using mock response.")
+            return self._mock_llm_response(prompt)
+    
+    async def aclose(self):
+        """Release pooled connections and worker threads"""
+        await self.llm_client.aclose()
+        self.llm_client.close()
+        self.executor.shutdown(wait=False)
+    
+    def generate_test_cases(self, query: str, num_cases: int = 5,
+                            use_cache: bool = True) -> List[Dict[str, Any]]:
         """Generate test cases using RAG pipeline"""
         
         print(f"Generating {num_cases} test cases for query: {query}")
         
         # Retrieve relevant context
-        context_docs = self.retrieve_context(query, k=10)
+        context_docs = self.retrieve_context(query, k=self.TEST_CASE_CONTEXT_K)
+        prompt = self._build_test_case_prompt(query, num_cases, context_docs)
         
-        # Build context string
-        context_str = "\n\n".join([
-            f"[Source: {doc['source']}]\n{doc['content']}"
-            for doc in context_docs[:8]
-        ])
+        # Call LLM
+        response = self.call_llm(prompt, use_cache=use_cache)
+        
+        merger = TestSuiteMerger(num_cases)
+        merger.add(self._salvage_test_cases(response, num_cases))
+        if merger.missing:
+            # Ask only for what could not be recovered
+            LLM_REMAINDER_REQUESTS.inc()
+            response = self.call_llm(self._build_remainder_prompt(query, merger, context_docs), use_cache=use_cache)
+            merger.add(self._salvage_test_cases(response, merger.missing))
+        
+        self._add_mock_test_cases(merger, query, context_docs)
+        return merger.test_cases
+    
+    async def agenerate_test_cases(self, query: str, num_cases: int = 5, use_cache: bool = True,
+                                   shard_size: int = None) -> List[Dict[str, Any]]:
+        """Generate test cases without blocking the event loop.
+        
+        Suites larger than shard_size (default: test_case_shard_size) are
+        generated in concurrent shards, see agenerate_test_cases_sharded.
+        """
+        shard_size = self.test_case_shard_size if shard_size is None else shard_size
+        if 0 < shard_size < num_cases:
+            return await self.agenerate_test_cases_sharded(query, num_cases, shard_size, use_cache=use_cache)
+        
+        print(f"Generating {num_cases} test cases for query: {query}")
+        
+        context_docs = await self.run_in_worker(self.retrieve_context, query, self.TEST_CASE_CONTEXT_K)
+        
+        merger = TestSuiteMerger(num_cases)
+        merger.add(await self._acollect_test_cases(query, num_cases, context_docs, use_cache))
+        
+        self._add_mock_test_cases(merger, query, context_docs)
+        return merger.test_cases
+    
+    async def astream_test_cases(self, query: str, num_cases: int = 5, model: str = "llama3.2",
+                                 use_cache: bool = True, shard_size: int = None) -> AsyncIterator[Dict[str, Any]]:
+        """Yield test cases one by one as the LLM finishes writing each of them.
+        
+        Suites larger than shard_size are generated in concurrent shards
+        instead, each shard's test cases yielded as soon as it completes.
+        """
+        shard_size = self.test_case_shard_size if shard_size is None else shard_size
+        if 0 < shard_size < num_cases:
+            async for test_case in self._astream_sharded(query, num_cases, shard_size, use_cache):
+                yield test_case
+            return
+        
+        print(f"Streaming {num_cases} test cases for query: {query}")
+        
+        context_docs = await self.run_in_worker(self.retrieve_context, query, self.TEST_CASE_CONTEXT_K)
+        prompt = self._build_test_case_prompt(query, num_cases, context_docs)
+        
+        parser = TestCaseStreamParser()
+        # Validates, deduplicates and numbers the streamed test cases
+        merger = TestSuiteMerger(num_cases)
+        stream_failed = False
+        
+        # Streams stop reading once enough test cases arrived, so their (possibly
+        # truncated) text is cached apart from complete non-streaming responses
+        key = self.response_cache.key(model, dict(self.LLM_OPTIONS, stream=True), prompt)
+        cached = await self.run_in_worker(self._cached_response, key, use_cache)
+        if cached is not None:
+            for test_case in merger.add(self._validate_test_cases(parser.feed(cached))):
+                yield test_case
+        else:
+            received = []
+            start = time.perf_counter()
+            tokens = self.llm_client.astream_generate(prompt, model, self.LLM_OPTIONS)
+            try:
+                print(f"Streaming LLM with model: {model}...")
+                async for token in tokens:
+                    if not received:
+                        observe_stage("llm_stream_first_token", time.perf_counter() - start)
+                    received.append(token)
+                    for test_case in merger.add(self._validate_test_cases(parser.feed(token))):
+                        yield test_case
+                    if not merger.missing or parser.finished:
+                        break
+                
+                LLM_CALLS.inc(outcome="success")
+                if not merger.missing or parser.finished:
+                    await self.run_in_worker(
+                        self.response_cache.put, key, model, "".join(received), time.perf_counter() - start
+                    )
+            
+            except LLMError as e:
+                LLM_CALLS.inc(outcome="error")
+                stream_failed = True
+                print(f"LLM stream failed: {e}. Using mock response for the remainder.")
+            
+            finally:
+                # Release the pooled connection even if we stopped reading early
+                await tokens.aclose()
+                # Includes the time the consumer took to handle each streamed test case
+                observe_stage("llm_stream", time.perf_counter() - start)
+        
+        # Same fallbacks as the non-streaming path: ask for the remainder, then top up with mocks
+        if merger.missing and not stream_failed:
+            print(f"Only {len(merger.test_cases)} test cases streamed, requesting the remaining {merger.missing}")
+            LLM_REMAINDER_REQUESTS.inc()
+            response = await self.acall_llm(self._build_remainder_prompt(query, merger, context_docs), use_cache=use_cache)
+            for test_case in merger.add(self._salvage_test_cases(response, merger.missing)):
+                yield test_case
+        for test_case in self._add_mock_test_cases(merger, query, context_docs):
+            yield test_case
+    
+    async def agenerate_test_cases_sharded(self, query: str, num_cases: int, shard_size: int,
+                                           use_cache: bool = True) -> List[Dict[str, Any]]:
+        """Generate a large test suite as concurrent generations over feature slices.
+        
+        The suite is planned into shards of at most shard_size test cases,
+        each focused on features found in the retrieved context, and the
+        shards are generated concurrently (up to the LLM client's
+        concurrency). Results are merged in shard order, deduplicated and
+        renumbered, so wall-clock time follows the slowest shard rather than
+        the length of the whole suite.
+        """
+        merger = TestSuiteMerger(num_cases)
+        async for _ in self._astream_sharded(query, num_cases, shard_size, use_cache, ordered=True, merger=merger):
+            pass
+        return merger.test_cases
+    
+    async def _astream_sharded(self, query: str, num_cases: int, shard_size: int, use_cache: bool,
+                               ordered: bool = False, merger: TestSuiteMerger = None) -> AsyncIterator[Dict[str, Any]]:
+        """Generate shards concurrently and yield merged test cases, in completion order unless ordered"""
+        merger = merger or TestSuiteMerger(num_cases)
+        
+        with span("plan_shards", cases=num_cases) as fields:
+            plan_docs = await self.run_in_worker(self.retrieve_context, query, self.SHARD_PLAN_K)
+            shards = plan_shards(query, num_cases, shard_size, extract_features(plan_docs))
+            shard_queries = [f"{query} - {', '.join(shard['features'])}" for shard in shards]
+            # One embedding batch for all shards' retrieval
+            contexts = await self.run_in_worker(
+                self.retrieve_context_batch, shard_queries, self.TEST_CASE_CONTEXT_K
+            )
+            fields['shards'] = len(shards)
+        print(f"Generating {num_cases} test cases for query: {query} in {len(shards)} shards: "
+              f"{[(shard['features'], shard['num_cases']) for shard in shards]}")
+        
+        async def generate_shard(shard, context_docs):
+            focus = f"Only test {', '.join(shard['features'])}; other features are covered separately."
+            if shard['parts'] > 1:
+                focus += f" This is part {shard['part']} of {shard['parts']}: cover different scenarios than the other parts."
+            return await self._acollect_test_cases(query, shard['num_cases'], context_docs, use_cache, focus=focus)
+        
+        tasks = [
+            asyncio.ensure_future(generate_shard(shard, context_docs))
+            for shard, context_docs in zip(shards, contexts)
+        ]
+        try:
+            for next_shard in (tasks if ordered else asyncio.as_completed(tasks)):
+                for test_case in merger.add(await next_shard):
+                    yield test_case
+        finally:
+            for task in tasks:
+                task.cancel()
+        
+        # Shards may overlap; ask once more for what deduplication removed, then fall back to mocks
+        if merger.missing:
+            print(f"Sharded generation short by {merger.missing} test cases ({merger.duplicates} duplicates)")
+            context_docs = contexts[0] if contexts else []
+            LLM_REMAINDER_REQUESTS.inc()
+            response = await self.acall_llm(self._build_remainder_prompt(query, merger, context_docs), use_cache=use_cache)
+            for test_case in merger.add(self._salvage_test_cases(response, merger.missing)):
+                yield test_case
+        for test_case in self._add_mock_test_cases(merger, f"{query} (additional)", plan_docs, reason="duplicates"):
+            yield test_case
+    
+    def _build_test_case_prompt(self, query: str, num_cases: int, context_docs: List[Dict[str, Any]],
+                                focus: str = None) -> str:
+        """Build the test case generation prompt from retrieved context"""
         
-        # Create prompt
-        prompt = f"""You are an expert QA engineer. Generate EXACTLY {num_cases} comprehensive test cases based on the provided documentation.
+        with span("build_prompt", kind="test_cases") as fields:
+            # Build context string within the token budget
+            context_str, stats = self.context_packer.pack(
+                context_docs, self.test_case_context_tokens, header="[Source: {source}]\n", separator="\n\n"
+            )
+            print(f"Test case context: {stats}")
+            
+            # Shards of a large suite are each told which slice they cover
+            focus_line = f"\nFOCUS: {focus}\n" if focus else ""
+            
+            # Create prompt
+            prompt = f"""You are an expert QA engineer. Generate EXACTLY {num_cases} comprehensive test cases based on the provided documentation.
 
 DOCUMENTATION CONTEXT:
 {context_str}
 
 USER REQUEST: {query}
-
+{focus_line}
 IMPORTANT: Generate EXACTLY {num_cases} test cases. Include both positive AND negative test scenarios.
 
 Generate the test cases in the following JSON format (return ONLY valid JSON, no markdown, no extra text):
@@ -171,66 +988,193 @@ CRITICAL REQUIREMENTS:
 - Be specific and detailed in test steps
 - Use actual values from documentation (like discount codes SAVE15, SAVE20)
 - Return ONLY valid JSON, no markdown code blocks, no explanations"""
-
-        # Call LLM
-        response = self.call_llm(prompt)
+            fields['tokens'] = estimate_tokens(prompt)
         
-        # Parse JSON response
-        try:
-            # Clean response - remove markdown code blocks if present
-            cleaned_response = self._clean_json_response(response)
-            
-            result = json.loads(cleaned_response)
-            test_cases = result.get('test_cases', [])
-            
-            # Ensure we have the requested number of test cases
-            if len(test_cases) < num_cases:
-                print(f"Warning: Only {len(test_cases)} test cases generated, expected {num_cases}")
-                # Add mock test cases to meet the requirement
-                while len(test_cases) < num_cases:
-                    test_cases.extend(self._generate_mock_test_cases(query, num_cases - len(test_cases), context_docs))
-                    test_cases = test_cases[:num_cases]  # Trim to exact number
-            
-            print(f"Successfully generated {len(test_cases)} test cases")
-            return test_cases[:num_cases]  # Return exactly num_cases
+        PROMPT_TOKENS.observe(fields['tokens'], kind="test_cases")
+        return prompt
+    
+    def _validate_test_cases(self, objects: List[Any]) -> List[Dict[str, Any]]:
+        """Coerce parsed objects into the test case schema, skipping those that are not test cases"""
+        test_cases = []
+        for obj in objects:
+            try:
+                test_cases.append(normalize_test_case(obj))
+            except ValueError as e:
+                TEST_CASES_REJECTED.inc()
+                print(f"Skipping invalid test case: {e}")
+        return test_cases
+    
+    def _salvage_test_cases(self, response: str, num_cases: int) -> List[Dict[str, Any]]:
+        """Recover up to num_cases valid test cases from a possibly malformed or truncated response"""
         
-        except json.JSONDecodeError as e:
-            print(f"JSON parsing error: {e}")
-            print(f"Response was: {response[:500]}")
-            # Fallback: return mock test cases
-            return self._generate_mock_test_cases(query, num_cases, context_docs)
+        with span("parse_response", chars=len(response)) as fields:
+            test_cases = self._validate_test_cases(salvage_test_cases(response))
+            if len(test_cases) >= num_cases:
+                outcome = "complete"
+            else:
+                outcome = "partial" if test_cases else "empty"
+            fields.update(test_cases=len(test_cases), outcome=outcome)
+        TEST_CASE_PARSES.inc(outcome=outcome)
+        
+        if outcome == "empty":
+            print(f"No test cases could be parsed. Response was: {response[:500]}")
+        else:
+            print(f"Parsed {min(len(test_cases), num_cases)} of {num_cases} test cases")
+        return test_cases[:num_cases]
     
-    def _clean_json_response(self, response: str) -> str:
-        """Clean LLM response to extract valid JSON"""
-        # Remove markdown code blocks
-        response = re.sub(r'```json\s*', '', response)
-        response = re.sub(r'```\s*', '', response)
+    def _build_remainder_prompt(self, query: str, merger: TestSuiteMerger, context_docs: List[Dict[str, Any]],
+                                focus: str = None) -> str:
+        """Prompt asking only for the test cases a suite is still missing"""
+        remainder = (f"{len(merger.test_cases)} test cases were already written. Write only the "
+                     f"{merger.missing} remaining ones, covering different scenarios than: "
+                     f"{'; '.join(merger.scenarios())}")
+        return self._build_test_case_prompt(
+            query, merger.missing, context_docs, focus=f"{focus} {remainder}" if focus else remainder
+        )
+    
+    async def _acollect_test_cases(self, query: str, num_cases: int, context_docs: List[Dict[str, Any]],
+                                   use_cache: bool, focus: str = None) -> List[Dict[str, Any]]:
+        """Valid test cases from one generation, plus one follow-up for any the response lacked"""
         
-        # Find JSON object
-        json_start = response.find('{')
-        json_end = response.rfind('}') + 1
+        prompt = self._build_test_case_prompt(query, num_cases, context_docs, focus=focus)
+        response = await self.acall_llm(prompt, use_cache=use_cache)
         
-        if json_start != -1 and json_end > json_start:
-            return response[json_start:json_end]
+        merger = TestSuiteMerger(num_cases)
+        merger.add(self._salvage_test_cases(response, num_cases))
+        if merger.missing:
+            # Keep what was recovered and ask only for the rest
+            LLM_REMAINDER_REQUESTS.inc()
+            prompt = self._build_remainder_prompt(query, merger, context_docs, focus=focus)
+            response = await self.acall_llm(prompt, use_cache=use_cache)
+            merger.add(self._salvage_test_cases(response, merger.missing))
+        return merger.test_cases
+    
+    def _add_mock_test_cases(self, merger: TestSuiteMerger, query: str, context_docs: List[Dict[str, Any]],
+                             reason: str = "short_response") -> List[Dict[str, Any]]:
+        """Top a suite up to its size with mock test cases; returns the ones added"""
+        if not merger.missing:
+            return []
         
-        return response
+        LLM_FALLBACKS.inc(reason=reason)
+        print(f"Warning: Only {len(merger.test_cases)} test cases generated, expected {merger.limit}")
+        mocks = self._generate_mock_test_cases(query, merger.missing, context_docs)
+        # Mock test cases differ only in their scenario, so they are not deduplicated
+        return merger.add(mocks, dedupe=False)
+    
+    def _parse_test_cases(self, response: str, query: str, num_cases: int,
+                          context_docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Parse the LLM response into exactly num_cases test cases, mocking any it lacks"""
+        merger = TestSuiteMerger(num_cases)
+        merger.add(self._salvage_test_cases(response, num_cases))
+        self._add_mock_test_cases(merger, query, context_docs)
+        return merger.test_cases
     
-    def generate_selenium_script(self, test_case: Dict[str, Any], html_content: str) -> str:
+    def generate_selenium_script(self, test_case: Dict[str, Any], html_content: str,
+                                 use_cache: bool = True) -> str:
         """Generate Selenium script for a test case"""
         
         print(f"Generating Selenium script for test case: {test_case.get('test_id', 'Unknown')}")
         
-        # Extract HTML structure info
-        html_info = self._extract_html_elements(html_content)
+        prompt = self._build_script_prompt(test_case, html_content)
+        script = self.call_llm(prompt, use_cache=use_cache)
+        
+        # Clean up script
+        script = self._clean_python_response(script)
+        
+        print("Selenium script generated successfully")
+        return script
+    
+    async def agenerate_selenium_script(self, test_case: Dict[str, Any], html_content: str,
+                                        use_cache: bool = True) -> str:
+        """Generate Selenium script without blocking the event loop"""
+        
+        print(f"Generating Selenium script for test case: {test_case.get('test_id', 'Unknown')}")
+        
+        # HTML parsing and retrieval are CPU-bound
+        prompt = await self.run_in_worker(self._build_script_prompt, test_case, html_content)
+        script = await self.acall_llm(prompt, use_cache=use_cache)
+        
+        script = self._clean_python_response(script)
+        
+        print("Selenium script generated successfully")
+        return script
+    
+    async def agenerate_selenium_scripts(self, test_cases: List[Dict[str, Any]], html_content: str,
+                                         max_concurrency: int = 4,
+                                         use_cache: bool = True) -> List[Dict[str, Any]]:
+        """Generate Selenium scripts for many test cases concurrently.
         
-        # Retrieve relevant documentation
+        The HTML structure is extracted once and retrieval is batched across
+        all test cases; LLM calls are then fanned out under max_concurrency.
+        Returns one result per test case, in order, with per-case errors.
+        """
+        print(f"Generating Selenium scripts for {len(test_cases)} test cases")
+        
+        html_info = await self.run_in_worker(self._extract_html_elements, html_content)
+        
+        # Test cases of the same feature often share a query
+        queries = [self._script_query(test_case) for test_case in test_cases]
+        unique_queries = list(dict.fromkeys(queries))
+        contexts = await self.run_in_worker(
+            self.retrieve_context_batch, unique_queries, self.SCRIPT_CONTEXT_K
+        )
+        context_by_query = dict(zip(unique_queries, contexts))
+        
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        
+        async def generate_one(index: int, test_case: Dict[str, Any]) -> Dict[str, Any]:
+            test_case_id = test_case.get('test_id', f'TC-{str(index + 1).zfill(3)}')
+            try:
+                prompt = self._build_script_prompt(
+                    test_case, html_content,
+                    html_info=html_info,
+                    context_docs=context_by_query[queries[index]]
+                )
+                async with semaphore:
+                    script = await self.acall_llm(prompt, use_cache=use_cache)
+                return {
+                    'test_case_id': test_case_id,
+                    'status': 'success',
+                    'script': self._clean_python_response(script)
+                }
+            except Exception as e:
+                print(f"Script generation failed for {test_case_id}: {e}")
+                return {
+                    'test_case_id': test_case_id,
+                    'status': 'error',
+                    'error': str(e)
+                }
+        
+        results = await asyncio.gather(*[
+            generate_one(i, test_case) for i, test_case in enumerate(test_cases)
+        ])
+        
+        print(f"Generated {sum(r['status'] == 'success' for r in results)}/{len(results)} Selenium scripts")
+        return list(results)
+    
+    def _script_query(self, test_case: Dict[str, Any]) -> str:
+        """Retrieval query used to find documentation for a test case"""
         feature = test_case.get('feature', '')
         scenario = test_case.get('test_scenario', '')
-        context_docs = self.retrieve_context(f"{feature} {scenario}", k=5)
-        context_str = "\n".join([doc['content'] for doc in context_docs[:3]])
+        return f"{feature} {scenario}"
+    
+    def _build_script_prompt(self, test_case: Dict[str, Any], html_content: str,
+                             html_info: str = None, context_docs: List[Dict[str, Any]] = None) -> str:
+        """Build the Selenium generation prompt for a test case"""
         
-        # Create prompt
-        prompt = f"""You are a Selenium WebDriver expert in Python. Generate a complete, executable Selenium test script.
+        with span("build_prompt", kind="script") as fields:
+            # Extract HTML structure info
+            if html_info is None:
+                html_info = self._extract_html_elements(html_content)
+            
+            # Retrieve relevant documentation
+            if context_docs is None:
+                context_docs = self.retrieve_context(self._script_query(test_case), k=self.SCRIPT_CONTEXT_K)
+            context_str, stats = self.context_packer.pack(context_docs, self.script_context_tokens, separator="\n")
+            print(f"Script context: {stats}")
+            
+            # Create prompt
+            prompt = f"""You are a Selenium WebDriver expert in Python. Generate a complete, executable Selenium test script.
 
 TEST CASE TO AUTOMATE:
 {json.dumps(test_case, indent=2)}
@@ -262,14 +1206,10 @@ IMPORTANT:
 - Use WebDriverWait for dynamic elements
 
 Return ONLY the Python code, no explanations, no markdown formatting."""
-
-        script = self.call_llm(prompt)
+            fields['tokens'] = estimate_tokens(prompt)
         
-        # Clean up script
-        script = self._clean_python_response(script)
-        
-        print("Selenium script generated successfully")
-        return script
+        PROMPT_TOKENS.observe(fields['tokens'], kind="script")
+        return prompt
     
     def _clean_python_response(self, response: str) -> str:
         """Clean LLM response to extract Python code"""
@@ -284,41 +1224,9 @@ Return ONLY the Python code, no explanations, no markdown formatting."""
     def _extract_html_elements(self, html: str) -> str:
         """Extract key elements from HTML for script generation"""
         try:
-            from bs4 import BeautifulSoup
-            
-            soup = BeautifulSoup(html, 'html.parser')
-            
-            elements = []
-            
-            # Extract inputs
-            for input_tag in soup.find_all('input')[:30]:
-                elem_id = input_tag.get('id', '')
-                elem_name = input_tag.get('name', '')
-                elem_type = input_tag.get('type', 'text')
-                if elem_id or elem_name:
-                    elements.append(f"Input: id='{elem_id}', name='{elem_name}', type='{elem_type}'")
-            
-            # Extract buttons
-            for button in soup.find_all('button')[:15]:
-                elem_id = button.get('id', '')
-                text = button.get_text().strip()[:50]
-                if elem_id or text:
-                    elements.append(f"Button: id='{elem_id}', text='{text}'")
-            
-            # Extract selects
-            for select in soup.find_all('select')[:10]:
-                elem_id = select.get('id', '')
-                elem_name = select.get('name', '')
-                if elem_id or elem_name:
-                    elements.append(f"Select: id='{elem_id}', name='{elem_name}'")
-            
-            # Extract important divs with IDs
-            for div in soup.find_all('div', id=True)[:20]:
-                elem_id = div.get('id', '')
-                if elem_id and elem_id not in ['', 'root', 'app']:
-                    elements.append(f"Div: id='{elem_id}'")
-            
-            return "\n".join(elements) if elements else "No elements extracted"
+            # Parsed once per distinct HTML document and shared with ingestion
+            with span("html_extract"):
+                return get_dom_index(html).element_summary()
         
         except Exception as e:
             print(f"HTML extraction error: {e}")
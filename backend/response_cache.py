@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+class ResponseCache:
+    """Persistent cache of LLM responses, keyed by what determines the answer.
+
+    The key is a hash of (model, options, prompt); since the prompt embeds
+    the retrieved context, any knowledge base change that alters the
+    context also changes the key. Entries expire after `ttl_seconds` and
+    the least recently used ones are evicted beyond `max_entries`.
+    """
+
+    def __init__(self, cache_path: str = "./llm_cache/responses.sqlite3",
+                 ttl_seconds: float = 24 * 3600, max_entries: int = 5000):
+        self.cache_path = cache_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.bypasses = 0
+        self.saved_seconds = 0.0
+
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " response TEXT NOT NULL,"
+            " model TEXT NOT NULL,"
+            " seconds REAL NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)"
+        )
+        self._conn.commit()
+
+    def key(self, model: str, options: Optional[Dict[str, Any]], prompt: str) -> str:
+        payload = json.dumps({'model': model, 'options': options or {}, 'prompt': prompt}, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return a fresh cached response, or None"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, seconds, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            response, seconds, created_at = row
+            if now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            self.saved_seconds += seconds
+            return response
+
+    def put(self, key: str, model: str, response: str, seconds: float):
+        """Store a response along with how long the LLM took to produce it"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, model, seconds, created_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, response, model, seconds, now, now)
+            )
+            self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+            count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            overflow = count - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    " SELECT key FROM responses ORDER BY last_access ASC LIMIT ?)",
+                    (overflow,)
+                )
+                self.evictions += overflow
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            'entries': size,
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else None,
+            'bypasses': self.bypasses,
+            'expirations': self.expirations,
+            'evictions': self.evictions,
+            'saved_seconds': round(self.saved_seconds, 3)
+        }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
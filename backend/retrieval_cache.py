@@ -0,0 +1,75 @@
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def normalize_query(query: str) -> str:
+    """Collapse whitespace and case so trivially different queries share an entry"""
+    return " ".join(query.split()).casefold()
+
+
+class RetrievalCache:
+    """In-memory LRU cache of retrieval results for one knowledge base revision.
+
+    Entries are keyed by (normalized query, k, filters). The whole cache is
+    dropped as soon as it is consulted with a different knowledge base
+    revision, so results never outlive the index they were computed from.
+    """
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple, Tuple[List[Dict[str, Any]], float]]" = OrderedDict()
+        self._revision = None
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.saved_seconds = 0.0
+
+    def key(self, query: str, k: int, filters: Optional[Dict[str, Any]] = None) -> Tuple:
+        return (normalize_query(query), k, json.dumps(filters, sort_keys=True) if filters else None)
+
+    def _check_revision(self, revision: int):
+        if revision != self._revision:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._revision = revision
+
+    def get(self, revision: int, key: Tuple) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            self._check_revision(revision)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            results, seconds = entry
+            self.hits += 1
+            self.saved_seconds += seconds
+            return [dict(result) for result in results]
+
+    def put(self, revision: int, key: Tuple, results: List[Dict[str, Any]], seconds: float):
+        """Store results along with how long they took to compute"""
+        with self._lock:
+            self._check_revision(revision)
+            self._entries[key] = ([dict(result) for result in results], seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'revision': self._revision,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else None,
+            'invalidations': self.invalidations,
+            'saved_seconds': round(self.saved_seconds, 4)
+        }
@@ -0,0 +1,135 @@
+import math
+import re
+from typing import Any, Dict, List
+
+# Markdown headings and "SECTION 3: PAYMENT METHODS" style headings of plain text documents
+HEADING_PATTERN = re.compile(r'^\s{0,3}(?:#{2,4}\s+(.+?)\s*#*|SECTION\s+\d+\s*[:.-]\s*(.+?))\s*$', re.MULTILINE)
+HEADING_NUMBER = re.compile(r'^\s*(?:\d+(?:\.\d+)*[.)]?\s+)')
+# "Discount Code Tests" in a test plan names the feature "Discount Code"
+TEST_SUFFIX = re.compile(r'\s+(tests?|testing|test cases)(\s*\(.*\))?$', re.IGNORECASE)
+# Values such as discount codes get their own sub-headings but are not features
+VALUE_HEADING = re.compile(r'^[A-Z0-9_-]*\d[A-Z0-9_-]*$')
+# Document boilerplate and test plan sections rather than product features
+GENERIC_HEADING = re.compile(
+    r'^(version\b|change ?log|revision history|table of contents|overview|introduction|purpose|'
+    r'executive summary|summary|appendix|references)|'
+    r'\b(objectives?|scope|metrics|strategy|approach|schedule|risks?|deliverables?|roles?|'
+    r'responsibilities|glossary|contacts?|sign-?off|tests?|testing|environment|tools|priority|coverage|'
+    r'engineers?|analysts?|team)\b',
+    re.IGNORECASE
+)
+
+
+def extract_features(context_docs: List[Dict[str, Any]], limit: int = 12) -> List[str]:
+    """Feature names from the section headings in retrieved chunks, best ranked first.
+
+    Falls back to the chunks' source documents when they contain no headings.
+    """
+    features = {}
+    for doc in context_docs:
+        for match in HEADING_PATTERN.finditer(doc.get('content', '')):
+            heading = HEADING_NUMBER.sub('', match.group(1) or match.group(2)).strip(' :-')
+            heading = TEST_SUFFIX.sub('', heading)
+            if len(heading) < 3 or GENERIC_HEADING.search(heading) or VALUE_HEADING.match(heading):
+                continue
+            if heading.isupper() and ' ' in heading:
+                # "PAYMENT METHODS", but not acronyms like "UI/UX"
+                heading = heading.title()
+            features.setdefault(heading.lower(), heading)
+            if len(features) >= limit:
+                return list(features.values())
+
+    if not features:
+        for doc in context_docs:
+            source = doc.get('source')
+            if source:
+                features.setdefault(source.lower(), source)
+    return list(features.values())
+
+
+def plan_shards(query: str, num_cases: int, shard_size: int, features: List[str]) -> List[Dict[str, Any]]:
+    """Split a suite of num_cases into shards of at most shard_size cases, each focused on features.
+
+    With more features than shards, each shard covers several of them; with
+    fewer, a feature is spread over several shards, each asked for a
+    different part of it.
+    """
+    num_shards = max(1, math.ceil(num_cases / max(1, shard_size)))
+    features = features or [query]
+
+    groups = [[] for _ in range(num_shards)]
+    for i, feature in enumerate(features):
+        groups[i % num_shards].append(feature)
+    # Repeat features for the shards left empty
+    repeats = {}
+    for i, group in enumerate(groups):
+        if not group:
+            group.append(features[i % len(features)])
+        for feature in group:
+            repeats[feature] = repeats.get(feature, 0) + 1
+
+    shards = []
+    seen = {}
+    base, extra = divmod(num_cases, num_shards)
+    for i, group in enumerate(groups):
+        parts = max(repeats[feature] for feature in group)
+        part = seen[tuple(group)] = seen.get(tuple(group), 0) + 1
+        shards.append({
+            'features': group,
+            'num_cases': base + (1 if i < extra else 0),
+            'part': part,
+            'parts': parts
+        })
+    return [shard for shard in shards if shard['num_cases'] > 0]
+
+
+def _normalize(text: Any) -> str:
+    if isinstance(text, list):
+        text = " ".join(str(item) for item in text)
+    return re.sub(r'[^a-z0-9]+', ' ', str(text or '').lower()).strip()
+
+
+class TestSuiteMerger:
+    """Merges test cases from several generations into one suite.
+
+    Test cases with the same scenario, or the same steps and expected result,
+    as an earlier one are dropped; the rest are renumbered TC-001, TC-002, ...
+    in the order they were added, up to `limit` test cases.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.test_cases: List[Dict[str, Any]] = []
+        self.duplicates = 0
+        self._seen = set()
+
+    @property
+    def missing(self) -> int:
+        return max(0, self.limit - len(self.test_cases))
+
+    def add(self, test_cases: List[Dict[str, Any]], dedupe: bool = True) -> List[Dict[str, Any]]:
+        """Add test cases; returns the ones that were kept, renumbered"""
+        added = []
+        for test_case in test_cases:
+            if not self.missing:
+                break
+            if not isinstance(test_case, dict):
+                continue
+            keys = {
+                ('scenario', _normalize(test_case.get('test_scenario'))),
+                ('steps', _normalize(test_case.get('test_steps')), _normalize(test_case.get('expected_result')))
+            }
+            keys = {key for key in keys if any(key[1:])}
+            if dedupe and keys & self._seen:
+                self.duplicates += 1
+                continue
+            self._seen.update(keys)
+
+            test_case = dict(test_case, test_id=f"TC-{len(self.test_cases) + 1:03d}")
+            self.test_cases.append(test_case)
+            added.append(test_case)
+        return added
+
+    def scenarios(self, limit: int = 20) -> List[str]:
+        """Scenarios already covered, for asking a follow-up generation not to repeat them"""
+        return [str(test_case.get('test_scenario', '')) for test_case in self.test_cases[-limit:]]
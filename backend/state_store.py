@@ -0,0 +1,257 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def empty_workspace_state() -> Dict[str, Any]:
+    return {
+        'documents': [], 'html': "", 'html_sha256': "", 'knowledge_base_built': False, 'kb_revision': 0,
+        # Extracted text files of replaced uploads, deleted by the next build
+        'superseded': [],
+        # Bumped by every deletion, so workers can tell a re-created workspace from their old copy
+        'incarnation': 0, 'deleted': False
+    }
+
+
+def process_alive(pid: int) -> bool:
+    """Whether a process exists; assumed on platforms without a cheap check"""
+    if pid == os.getpid() or os.name != 'posix':
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class StateStore:
+    """Workspace and build job state shared by all worker processes.
+
+    Every uvicorn worker opens the same SQLite database (in WAL mode, so
+    reads never wait for a writer). Each workspace row carries a version
+    that is bumped on every change, so a worker can tell with one indexed
+    read whether its in-memory copy is stale. Updates run in an IMMEDIATE
+    transaction, so concurrent uploads to one workspace merge rather than
+    overwrite each other.
+    """
+
+    def __init__(self, path: str = "./workspaces/state.sqlite3", timeout: float = 30.0):
+        self.path = path
+        self.lock_dir = os.path.join(os.path.dirname(path) or '.', "locks")
+        os.makedirs(self.lock_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # Autocommit mode; update_workspace() opens its own transaction
+        self._conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS workspaces ("
+            " id TEXT PRIMARY KEY,"
+            " version INTEGER NOT NULL,"
+            " state TEXT NOT NULL,"
+            " html TEXT NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS build_jobs ("
+            " id TEXT PRIMARY KEY,"
+            " state TEXT NOT NULL,"
+            " cancel_requested INTEGER NOT NULL DEFAULT 0,"
+            " updated_at REAL NOT NULL)"
+        )
+        # Worker processes holding an incarnation of a workspace loaded
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS workspace_holders ("
+            " workspace_id TEXT NOT NULL,"
+            " incarnation INTEGER NOT NULL,"
+            " pid INTEGER NOT NULL,"
+            " PRIMARY KEY (workspace_id, incarnation, pid))"
+        )
+        # Files of deleted workspaces, removed once no worker holds that incarnation
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS workspace_trash ("
+            " path TEXT PRIMARY KEY,"
+            " workspace_id TEXT NOT NULL,"
+            " incarnation INTEGER NOT NULL,"
+            " created_at REAL NOT NULL)"
+        )
+
+    def workspace_version(self, workspace_id: str) -> int:
+        """Version of a workspace's state, 0 if it has none yet"""
+        with self._lock:
+            row = self._conn.execute("SELECT version FROM workspaces WHERE id = ?", (workspace_id,)).fetchone()
+        return row[0] if row else 0
+
+    def get_workspace(self, workspace_id: str) -> Tuple[int, Dict[str, Any]]:
+        """(version, state) of a workspace; an unknown workspace has version 0 and an empty state"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT version, state, html FROM workspaces WHERE id = ?", (workspace_id,)
+            ).fetchone()
+        return self._decode(row)
+
+    def _decode(self, row) -> Tuple[int, Dict[str, Any]]:
+        if row is None:
+            return 0, empty_workspace_state()
+        version, state, html = row
+        return version, dict(empty_workspace_state(), **json.loads(state), html=html)
+
+    def update_workspace(self, workspace_id: str,
+                         mutate: Callable[[Dict[str, Any]], None]) -> Tuple[int, Dict[str, Any]]:
+        """Apply mutate(state) to the latest state atomically and return the new (version, state)"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                version, state = self._decode(self._conn.execute(
+                    "SELECT version, state, html FROM workspaces WHERE id = ?", (workspace_id,)
+                ).fetchone())
+                # Any change other than a deletion re-creates a deleted workspace
+                state['deleted'] = False
+                mutate(state)
+                version += 1
+                html = state.pop('html')
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO workspaces (id, version, state, html, updated_at)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (workspace_id, version, json.dumps(state), html, time.time())
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        state['html'] = html
+        return version, state
+
+    def delete_workspace(self, workspace_id: str, trash_path: str = None) -> Tuple[int, Dict[str, Any]]:
+        """Replace a workspace's state with a tombstone of its next incarnation.
+
+        trash_path, where the deleted incarnation's files were moved, is
+        recorded in the same transaction (see purgeable_trash).
+        """
+        def mutate(state):
+            incarnation = state['incarnation']
+            if trash_path:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO workspace_trash (path, workspace_id, incarnation, created_at)"
+                    " VALUES (?, ?, ?, ?)",
+                    (trash_path, workspace_id, incarnation, time.time())
+                )
+            state.clear()
+            state.update(empty_workspace_state(), incarnation=incarnation + 1, deleted=True)
+
+        return self.update_workspace(workspace_id, mutate)
+
+    def workspace_ids(self) -> List[str]:
+        """Ids of the workspaces that exist, i.e. are not deleted"""
+        with self._lock:
+            rows = self._conn.execute("SELECT id, state FROM workspaces ORDER BY id").fetchall()
+        return [workspace_id for workspace_id, state in rows if not json.loads(state).get('deleted')]
+
+    def add_holder(self, workspace_id: str, incarnation: int):
+        """Record that this process has an incarnation of a workspace loaded"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO workspace_holders (workspace_id, incarnation, pid) VALUES (?, ?, ?)",
+                (workspace_id, incarnation, os.getpid())
+            )
+
+    def remove_holder(self, workspace_id: str, incarnation: int):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM workspace_holders WHERE workspace_id = ? AND incarnation = ? AND pid = ?",
+                (workspace_id, incarnation, os.getpid())
+            )
+
+    def purgeable_trash(self) -> List[str]:
+        """Trash paths whose incarnation no live process holds any more"""
+        with self._lock:
+            holders = self._conn.execute("SELECT workspace_id, incarnation, pid FROM workspace_holders").fetchall()
+            trash = self._conn.execute("SELECT path, workspace_id, incarnation FROM workspace_trash").fetchall()
+            # Holders left behind by workers that exited without closing their workspaces
+            for workspace_id, incarnation, pid in holders:
+                if not process_alive(pid):
+                    self._conn.execute(
+                        "DELETE FROM workspace_holders WHERE workspace_id = ? AND incarnation = ? AND pid = ?",
+                        (workspace_id, incarnation, pid)
+                    )
+        held = {(workspace_id, incarnation) for workspace_id, incarnation, pid in holders if process_alive(pid)}
+        return [path for path, workspace_id, incarnation in trash if (workspace_id, incarnation) not in held]
+
+    def forget_trash(self, path: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM workspace_trash WHERE path = ?", (path,))
+
+    @contextmanager
+    def lock(self, name: str) -> Iterator[None]:
+        """Exclusive lock across processes (and threads), held for the duration of the block"""
+        with open(os.path.join(self.lock_dir, f"{name}.lock"), 'a+b') as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        # LK_LOCK gives up after about 10 seconds
+                        continue
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def save_job(self, job_id: str, state: Dict[str, Any]) -> bool:
+        """Record a build job's status; returns True if another worker asked to cancel it"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO build_jobs (id, state, updated_at) VALUES (?, ?, ?)"
+                " ON CONFLICT(id) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+                (job_id, json.dumps(state), now)
+            )
+            row = self._conn.execute("SELECT cancel_requested FROM build_jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT state FROM build_jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def request_cancel(self, job_id: str):
+        """Ask the worker running a job to cancel it at its next progress report"""
+        with self._lock:
+            self._conn.execute("UPDATE build_jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+
+    def active_jobs(self, max_age_seconds: float) -> List[Dict[str, Any]]:
+        """Unfinished jobs reported on within max_age_seconds (older ones belong to dead workers)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT state FROM build_jobs WHERE updated_at >= ?", (time.time() - max_age_seconds,)
+            ).fetchall()
+        jobs = [json.loads(row[0]) for row in rows]
+        return [job for job in jobs if job['status'] in ('queued', 'running')]
+
+    def prune_jobs(self, max_age_seconds: float):
+        with self._lock:
+            self._conn.execute("DELETE FROM build_jobs WHERE updated_at < ?", (time.time() - max_age_seconds,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,72 @@
+from typing import Any, Dict
+
+# Field order of a test case as the frontend and exports show it
+TEST_CASE_FIELDS = (
+    'test_id', 'feature', 'test_scenario', 'test_type', 'preconditions',
+    'test_steps', 'expected_result', 'grounded_in'
+)
+REQUIRED_FIELDS = ('test_scenario', 'test_steps', 'expected_result')
+
+# Names models commonly use instead of the ones the prompt asks for
+FIELD_ALIASES = {
+    'id': 'test_id',
+    'testid': 'test_id',
+    'scenario': 'test_scenario',
+    'title': 'test_scenario',
+    'description': 'test_scenario',
+    'type': 'test_type',
+    'steps': 'test_steps',
+    'expected': 'expected_result',
+    'expected_results': 'expected_result',
+    'expected_outcome': 'expected_result',
+    'precondition': 'preconditions',
+    'source': 'grounded_in'
+}
+
+
+def _text(value: Any) -> str:
+    if isinstance(value, list):
+        return "; ".join(str(item).strip() for item in value if str(item).strip())
+    return "" if value is None else str(value).strip()
+
+
+def normalize_test_case(data: Any) -> Dict[str, Any]:
+    """Validate a parsed test case against the schema and coerce it into shape.
+
+    Field name aliases are mapped, test_steps given as one string are split
+    into lines and optional fields get defaults. Raises ValueError if the
+    object is not a test case (e.g. a required field is missing or empty).
+    """
+    if not isinstance(data, dict):
+        raise ValueError(f"expected an object, got {type(data).__name__}")
+
+    names = {key: str(key).strip().lower().replace(' ', '_') for key in data}
+    fields = {names[key]: value for key, value in data.items() if names[key] in TEST_CASE_FIELDS}
+    # Aliases only fill fields the object does not have under their proper name
+    for key, value in data.items():
+        alias = FIELD_ALIASES.get(names[key])
+        if alias and alias not in fields:
+            fields[alias] = value
+
+    steps = fields.get('test_steps')
+    if isinstance(steps, str):
+        steps = steps.splitlines()
+    if not isinstance(steps, list):
+        steps = []
+    steps = [_text(step) for step in steps if _text(step)]
+
+    test_case = {
+        'test_id': _text(fields.get('test_id')),
+        'feature': _text(fields.get('feature')) or "General",
+        'test_scenario': _text(fields.get('test_scenario')),
+        'test_type': _text(fields.get('test_type')).lower() or "positive",
+        'preconditions': _text(fields.get('preconditions')),
+        'test_steps': steps,
+        'expected_result': _text(fields.get('expected_result')),
+        'grounded_in': _text(fields.get('grounded_in'))
+    }
+
+    missing = [name for name in REQUIRED_FIELDS if not test_case[name]]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+    return test_case
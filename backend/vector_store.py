@@ -0,0 +1,421 @@
+import json
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+SearchResult = Tuple[Any, float]
+
+
+class VectorStore(ABC):
+    """Interface the RAG engine uses to store and search chunk embeddings.
+
+    Chunks are addressed by the ids recorded in the chunk manifest. Search
+    methods return (Document, relevance) pairs, higher relevance first.
+    """
+
+    @abstractmethod
+    def ids(self) -> List[str]:
+        ...
+
+    @abstractmethod
+    def get_all(self) -> Tuple[List[str], List[str], List[Dict[str, Any]]]:
+        """Return (ids, texts, metadatas) of every stored chunk"""
+
+    @abstractmethod
+    def add(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]]):
+        ...
+
+    @abstractmethod
+    def delete(self, ids: List[str]):
+        ...
+
+    @abstractmethod
+    def update_metadata(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        ...
+
+    @abstractmethod
+    def search(self, query: str, k: int, filters: Optional[Dict[str, Any]] = None) -> List[SearchResult]:
+        ...
+
+    @abstractmethod
+    def search_by_vector(self, vector: List[float], k: int,
+                         filters: Optional[Dict[str, Any]] = None) -> List[SearchResult]:
+        ...
+
+    def save(self):
+        """Persist pending changes; a no-op for stores that write through"""
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+    def close(self):
+        """Release in-process resources; the persisted data stays on disk"""
+
+
+class ChromaVectorStore(VectorStore):
+    """Chroma collection persisted with its own SQLite database"""
+
+    def __init__(self, embeddings, persist_directory: str, collection_name: str):
+        from langchain_community.vectorstores import Chroma
+
+        self.store = Chroma(
+            collection_name=collection_name,
+            embedding_function=embeddings,
+            persist_directory=persist_directory
+        )
+
+    def ids(self) -> List[str]:
+        return self.store.get(include=[])['ids']
+
+    def get_all(self) -> Tuple[List[str], List[str], List[Dict[str, Any]]]:
+        stored = self.store.get(include=['documents', 'metadatas'])
+        return stored['ids'], stored['documents'], stored['metadatas']
+
+    def add(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]]):
+        self.store.add_texts(texts=texts, metadatas=metadatas, ids=ids)
+
+    def delete(self, ids: List[str]):
+        if ids:
+            self.store.delete(ids=ids)
+
+    def update_metadata(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        if ids:
+            self.store._collection.update(ids=ids, metadatas=metadatas)
+
+    def stats(self) -> Dict[str, Any]:
+        return {'backend': 'chroma', 'vectors': self.store._collection.count()}
+
+    def close(self):
+        # Chroma keeps one system (SQLite connection, HNSW index) per directory until its last client closes
+        client = getattr(self.store, '_client', None)
+        if client is not None and hasattr(client, 'close'):
+            client.close()
+
+    @staticmethod
+    def _to_relevance(results) -> List[SearchResult]:
+        # Squared L2 distance between unit vectors is 2 - 2 * cosine similarity
+        return [(doc, 1.0 - distance / 2.0) for doc, distance in results]
+
+    def search(self, query: str, k: int, filters: Optional[Dict[str, Any]] = None) -> List[SearchResult]:
+        return self._to_relevance(self.store.similarity_search_with_score(query, k=k, filter=filters))
+
+    def search_by_vector(self, vector: List[float], k: int,
+                         filters: Optional[Dict[str, Any]] = None) -> List[SearchResult]:
+        # Despite its name this returns raw distances
+        return self._to_relevance(
+            self.store.similarity_search_by_vector_with_relevance_scores(vector, k=k, filter=filters)
+        )
+
+
+class FlatVectorStore(VectorStore):
+    """Exact cosine search over a contiguous float32 matrix of normalized embeddings.
+
+    Top-k is a single matrix-vector product plus argpartition, which for a
+    few thousand chunks is faster and far lighter than a database-backed
+    store. The matrix is saved as a .npy file (optionally memory-mapped on
+    load) with ids, texts and metadata in a JSON file next to it. Given a
+    corpus store, chunk texts are read from it instead of being kept (and
+    saved) here.
+
+    With quantize=True the vectors are also kept as int8 codes with one
+    scale per row. Searches score the int8 codes, then rescore the top
+    `rescore_factor * k` candidates against the float32 matrix, which stays
+    memory-mapped so only those rows are ever paged in.
+    """
+
+    BLOCK_ROWS = 4096
+
+    def __init__(self, embeddings, persist_directory: str, name: str = "flat_index", mmap: bool = False,
+                 quantize: bool = False, rescore_factor: int = 4, corpus=None):
+        self.embeddings = embeddings
+        self.corpus = corpus
+        self.matrix_path = os.path.join(persist_directory, f"{name}.npy")
+        self.meta_path = os.path.join(persist_directory, f"{name}.json")
+        self.codes_path = os.path.join(persist_directory, f"{name}.int8.npy")
+        self.scales_path = os.path.join(persist_directory, f"{name}.scales.npy")
+        self.quantize = quantize
+        self.mmap = mmap or quantize
+        self.rescore_factor = rescore_factor
+
+        self._matrix: Optional[np.ndarray] = None
+        self._codes: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        self._size = 0
+        self._ids: List[str] = []
+        self._texts: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._rows: Dict[str, int] = {}
+        self._dirty = False
+        # Builds mutate the matrix while requests search it
+        self._lock = threading.RLock()
+        self._load()
+
+    def _load(self):
+        if not (os.path.exists(self.matrix_path) and os.path.exists(self.meta_path)):
+            return
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            matrix = np.load(self.matrix_path, mmap_mode='r' if self.mmap else None)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable flat vector index: {e}")
+            return
+
+        if matrix.ndim != 2 or len(matrix) != len(meta['ids']):
+            print("Ignoring flat vector index whose matrix and metadata disagree")
+            return
+
+        self._matrix = matrix
+        self._size = len(matrix)
+        self._ids = meta['ids']
+        self._metadatas = meta['metadatas']
+        self._rows = {chunk_id: row for row, chunk_id in enumerate(self._ids)}
+        if self.corpus is None:
+            self._texts = meta['texts']
+        elif 'texts' in meta:
+            # Saved with its own copy of the texts: move them to the corpus store
+            for chunk_id, text, metadata in zip(self._ids, meta['texts'], self._metadatas):
+                if chunk_id not in self.corpus:
+                    self.corpus.add(chunk_id, metadata.get('source', 'unknown'), text)
+            self.corpus.save()
+            self._dirty = True
+        if self.quantize:
+            self._load_codes()
+
+    def _load_codes(self):
+        """Load the int8 codes, quantizing the float32 matrix if they are missing or stale"""
+        try:
+            codes = np.load(self.codes_path)
+            scales = np.load(self.scales_path)
+            if codes.shape == self._matrix.shape and scales.shape == (self._size,):
+                self._codes, self._scales = codes, scales
+                return
+        except (OSError, ValueError):
+            pass
+
+        print(f"Quantizing {self._size} vectors to int8")
+        self._codes = np.empty(self._matrix.shape, dtype=np.int8)
+        self._scales = np.empty(self._size, dtype=np.float32)
+        for start in range(0, self._size, self.BLOCK_ROWS):
+            end = start + self.BLOCK_ROWS
+            self._codes[start:end], self._scales[start:end] = self._quantize(self._matrix[start:end])
+        self._dirty = True
+
+    @staticmethod
+    def _quantize(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Symmetric per-row int8 quantization: vector ~= codes * scale"""
+        scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+        codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            os.makedirs(os.path.dirname(self.matrix_path) or '.', exist_ok=True)
+            matrix = self._matrix[:self._size] if self._matrix is not None else np.zeros((0, 0), np.float32)
+
+            # np.save appends .npy to names without it, so keep the suffix on temp files
+            replacements = [(self.matrix_path, np.ascontiguousarray(matrix))]
+            if self.quantize and self._codes is not None:
+                replacements.append((self.codes_path, self._codes[:self._size]))
+                replacements.append((self.scales_path, self._scales[:self._size]))
+            for path, array in replacements:
+                np.save(f"{path[:-4]}.tmp.npy", array)
+            tmp_meta = f"{self.meta_path}.tmp"
+            meta = {'ids': self._ids, 'metadatas': self._metadatas}
+            if self.corpus is None:
+                meta['texts'] = self._texts
+            with open(tmp_meta, 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+
+            # Release a memory map of the old file before replacing it
+            if isinstance(self._matrix, np.memmap):
+                self._matrix = np.array(self._matrix[:self._size])
+            for path, _ in replacements:
+                os.replace(f"{path[:-4]}.tmp.npy", path)
+            os.replace(tmp_meta, self.meta_path)
+            self._dirty = False
+
+            if self.mmap and self._size:
+                # Drop the in-memory copy made while writing
+                self._matrix = np.load(self.matrix_path, mmap_mode='r')
+
+    def _writable(self, extra_rows: int, dim: int) -> np.ndarray:
+        """Make room for extra rows, copying a read-only memory map on first write"""
+        needed = self._size + extra_rows
+        if self._matrix is None:
+            capacity = max(needed, 64)
+            self._matrix = np.empty((capacity, dim), dtype=np.float32)
+            if self.quantize:
+                self._codes = np.empty((capacity, dim), dtype=np.int8)
+                self._scales = np.empty(capacity, dtype=np.float32)
+        elif needed > len(self._matrix) or not self._matrix.flags.writeable:
+            capacity = max(needed, 2 * len(self._matrix), 64) if needed > len(self._matrix) else len(self._matrix)
+            matrix = np.empty((capacity, self._matrix.shape[1]), dtype=np.float32)
+            matrix[:self._size] = self._matrix[:self._size]
+            self._matrix = matrix
+            if self.quantize and len(self._codes) < capacity:
+                codes = np.empty((capacity, self._codes.shape[1]), dtype=np.int8)
+                codes[:self._size] = self._codes[:self._size]
+                scales = np.empty(capacity, dtype=np.float32)
+                scales[:self._size] = self._scales[:self._size]
+                self._codes, self._scales = codes, scales
+        return self._matrix
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def ids(self) -> List[str]:
+        with self._lock:
+            return list(self._ids)
+
+    def _text(self, row: int) -> str:
+        if self.corpus is None:
+            return self._texts[row]
+        return self.corpus.text(self._ids[row]) or ""
+
+    def get_all(self) -> Tuple[List[str], List[str], List[Dict[str, Any]]]:
+        with self._lock:
+            texts = [self._text(row) for row in range(self._size)]
+            return list(self._ids), texts, [dict(m) for m in self._metadatas]
+
+    def add(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]]):
+        if not ids:
+            return
+        vectors = self._normalize(np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32))
+
+        with self._lock:
+            self.delete([chunk_id for chunk_id in ids if chunk_id in self._rows])
+            matrix = self._writable(len(ids), vectors.shape[1])
+            end = self._size + len(ids)
+            matrix[self._size:end] = vectors
+            if self.quantize:
+                self._codes[self._size:end], self._scales[self._size:end] = self._quantize(vectors)
+            for chunk_id, text, metadata in zip(ids, texts, metadatas):
+                self._rows[chunk_id] = len(self._ids)
+                self._ids.append(chunk_id)
+                if self.corpus is None:
+                    self._texts.append(text)
+                self._metadatas.append(dict(metadata))
+            self._size = end
+            self._dirty = True
+
+    def delete(self, ids: List[str]):
+        with self._lock:
+            rows = [self._rows[chunk_id] for chunk_id in ids if chunk_id in self._rows]
+            if not rows:
+                return
+            matrix = self._writable(0, 0)
+            # Fill each hole with the current last row, highest holes first
+            for row in sorted(rows, reverse=True):
+                last = self._size - 1
+                del self._rows[self._ids[row]]
+                if row != last:
+                    matrix[row] = matrix[last]
+                    if self.quantize:
+                        self._codes[row] = self._codes[last]
+                        self._scales[row] = self._scales[last]
+                    self._ids[row] = self._ids[last]
+                    if self.corpus is None:
+                        self._texts[row] = self._texts[last]
+                    self._metadatas[row] = self._metadatas[last]
+                    self._rows[self._ids[row]] = row
+                self._ids.pop()
+                if self.corpus is None:
+                    self._texts.pop()
+                self._metadatas.pop()
+                self._size -= 1
+            self._dirty = True
+
+    def update_metadata(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        with self._lock:
+            for chunk_id, metadata in zip(ids, metadatas):
+                row = self._rows.get(chunk_id)
+                if row is not None:
+                    self._metadatas[row] = dict(metadata)
+                    self._dirty = True
+
+    def _approximate_scores(self, query: np.ndarray) -> np.ndarray:
+        """Scores from the int8 codes, dequantized a block at a time to bound temporaries"""
+        scores = np.empty(self._size, dtype=np.float32)
+        for start in range(0, self._size, self.BLOCK_ROWS):
+            end = min(start + self.BLOCK_ROWS, self._size)
+            scores[start:end] = (self._codes[start:end].astype(np.float32) @ query) * self._scales[start:end]
+        return scores
+
+    @staticmethod
+    def _top(scores: np.ndarray, k: int) -> np.ndarray:
+        """Indices of the k highest scores, best first"""
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])]
+
+    def search(self, query: str, k: int, filters: Optional[Dict[str, Any]] = None) -> List[SearchResult]:
+        return self.search_by_vector(self.embeddings.embed_query(query), k, filters)
+
+    def search_by_vector(self, vector: List[float], k: int,
+                         filters: Optional[Dict[str, Any]] = None) -> List[SearchResult]:
+        from langchain_core.documents import Document
+
+        if filters and any(key.startswith('$') or isinstance(value, dict) for key, value in filters.items()):
+            raise ValueError("The flat vector index only supports equality filters")
+
+        query = self._normalize(np.asarray(vector, dtype=np.float32))
+        with self._lock:
+            if not self._size or k <= 0:
+                return []
+
+            if self.quantize:
+                scores = self._approximate_scores(query)
+            else:
+                scores = self._matrix[:self._size] @ query
+
+            available = self._size
+            if filters:
+                mask = np.fromiter(
+                    (all(metadata.get(key) == value for key, value in filters.items())
+                     for metadata in self._metadatas),
+                    dtype=bool, count=self._size
+                )
+                scores = np.where(mask, scores, -np.inf)
+                available = int(mask.sum())
+                if not available:
+                    return []
+
+            k = min(k, available)
+            if self.quantize:
+                # Rescore the best approximate candidates with the full-precision rows
+                candidates = self._top(scores, min(k * self.rescore_factor, available))
+                candidates.sort()
+                exact = self._matrix[candidates] @ query
+                order = self._top(exact, k)
+                top, top_scores = candidates[order], exact[order]
+            else:
+                top = self._top(scores, k)
+                top_scores = scores[top]
+
+            return [
+                (Document(page_content=self._text(row), metadata=dict(self._metadatas[row])), float(score))
+                for row, score in zip(top, top_scores)
+            ]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            resident = 0
+            if self._matrix is not None and not isinstance(self._matrix, np.memmap):
+                resident += self._matrix.nbytes
+            if self.quantize and self._codes is not None:
+                resident += self._codes.nbytes + self._scales.nbytes
+            return {
+                'backend': 'flat',
+                'vectors': self._size,
+                'dimension': self._matrix.shape[1] if self._matrix is not None else None,
+                'quantized': self.quantize,
+                'memory_mapped': isinstance(self._matrix, np.memmap),
+                'resident_bytes': resident
+            }
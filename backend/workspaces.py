@@ -0,0 +1,537 @@
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from backend.document_processor import DocumentProcessor
+from backend.jobs import STALE_JOB_SECONDS
+from backend.rag_engine import RAGEngine
+from backend.state_store import StateStore
+
+DEFAULT_WORKSPACE = "default"
+WORKSPACE_ID_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+
+# Rough in-memory cost of one chunk: BM25 postings, its corpus slot and a
+# 384-dimensional float32 vector (the text itself is memory-mapped)
+BYTES_PER_CHUNK = 4 * 1024
+
+
+class Workspace:
+    """One team member's documents, checkout HTML and knowledge base.
+
+    The knowledge base lives in the workspace's own vector store directory;
+    the list of uploaded documents, the HTML and the knowledge base revision
+    are kept in the state store shared by all worker processes. `version`
+    is the state version this copy reflects.
+    """
+
+    def __init__(self, workspace_id: str, directory: str, engine: RAGEngine, processor: DocumentProcessor,
+                 store: StateStore):
+        self.id = workspace_id
+        self.directory = directory
+        self.engine = engine
+        self.doc_processor = processor
+        self.store = store
+        self.uploaded_html = ""
+        self.html_sha256 = ""
+        self.knowledge_base_built = False
+        # Knowledge base revision last recorded by any worker
+        self.kb_revision = 0
+        self.version = 0
+        # Which life of the workspace id this copy belongs to; deleting a workspace starts a new one
+        self.incarnation = 0
+        # Set once another worker deleted the workspace; the copy is closed when its last user is done
+        self.deleted = False
+        self.last_used = time.time()
+        # Requests and build jobs using the workspace; it is never evicted while in use
+        self.users = 0
+        self._lock = threading.Lock()
+
+    @property
+    def legacy_state_path(self) -> str:
+        """Where workspaces were saved before the shared state store"""
+        return os.path.join(self.directory, "workspace.json")
+
+    @property
+    def stale(self) -> bool:
+        """True when another worker changed the knowledge base since this engine opened it"""
+        return self.kb_revision != self.engine.kb_version
+
+    def load(self):
+        """Restore documents, HTML and the knowledge base from the state store"""
+        version, state = self.store.get_workspace(self.id)
+        if version == 0 and os.path.exists(self.legacy_state_path):
+            version, state = self._import_legacy_state()
+        self.apply(version, state)
+        self.incarnation = state['incarnation']
+        # Keeps the files of this incarnation out of the trash purge until close()
+        self.store.add_holder(self.id, self.incarnation)
+        # Trust the knowledge base on disk, whatever revision it is at
+        self.kb_revision = self.engine.kb_version
+        if self.knowledge_base_built:
+            self.engine.load_knowledge_base()
+
+    def _import_legacy_state(self):
+        try:
+            with open(self.legacy_state_path, 'r', encoding='utf-8') as f:
+                legacy = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable state of workspace {self.id}: {e}")
+            return self.store.get_workspace(self.id)
+
+        html_path = os.path.join(self.directory, "uploaded.html")
+        html = ""
+        if os.path.exists(html_path):
+            with open(html_path, 'r', encoding='utf-8') as f:
+                html = f.read()
+
+        def mutate(state):
+            state.update(
+                documents=legacy.get('documents', []),
+                html=html,
+                knowledge_base_built=bool(legacy.get('knowledge_base_built')),
+                kb_revision=self.engine.kb_version
+            )
+        return self.store.update_workspace(self.id, mutate)
+
+    def apply(self, version: int, state: Dict[str, Any]):
+        """Adopt a state read from the store"""
+        # Spooled uploads may have been cleaned up in the meantime
+        self.doc_processor.documents = [
+            doc for doc in state['documents']
+            if 'content' in doc or os.path.exists(doc.get('path', ''))
+        ]
+        self.uploaded_html = state['html']
+        self.html_sha256 = state['html_sha256']
+        self.doc_processor.html_content = self.uploaded_html
+        self.knowledge_base_built = state['knowledge_base_built']
+        self.kb_revision = state['kb_revision']
+        self.version = version
+
+    def has_upload(self, filename: str, sha256: str) -> bool:
+        """True if a file with this name and content hash is already uploaded"""
+        if not sha256:
+            return False
+        if filename.endswith('.html'):
+            # There is one checkout HTML per workspace, whatever its file name
+            return sha256 == self.html_sha256
+        return any(
+            doc['filename'] == filename and doc.get('sha256') == sha256
+            for doc in self.doc_processor.documents
+        )
+
+    def record_upload(self, documents: List[Dict[str, Any]], html: str = None,
+                      html_sha256: str = None) -> List[str]:
+        """Add newly extracted documents (and HTML) to the shared state.
+
+        A document replaces any earlier upload with the same file name.
+        Returns the names of the documents that were replaced.
+        """
+        replaced = []
+
+        def mutate(state):
+            latest = {doc['filename']: doc for doc in documents}
+            replaced.clear()
+            merged = []
+            for doc in state['documents']:
+                new_doc = latest.pop(doc['filename'], None)
+                if new_doc is None:
+                    merged.append(doc)
+                    continue
+                replaced.append(doc['filename'])
+                if doc.get('path') and doc['path'] != new_doc.get('path'):
+                    # A queued build may still read it; the next build deletes it
+                    state['superseded'].append(doc['path'])
+                merged.append(new_doc)
+            state['documents'] = merged + list(latest.values())
+            if html is not None:
+                state['html'] = html
+                state['html_sha256'] = html_sha256 or ""
+
+        with self._lock:
+            self.apply(*self.store.update_workspace(self.id, mutate))
+        return replaced
+
+    def build_knowledge_base(self, documents: List[Dict[str, Any]], progress=None) -> RAGEngine:
+        """Build the knowledge base under a lock shared by all worker processes.
+
+        If this worker's engine is at the latest revision it is built in
+        place; otherwise a fresh engine over the same directory is built and
+        the serving engine is reloaded once idle (see WorkspaceManager).
+        Returns the engine that did the build.
+        """
+        with self.store.lock(f"build-{self.id}"):
+            _, state = self.store.get_workspace(self.id)
+            if state['incarnation'] != self.incarnation:
+                raise RuntimeError(f"Workspace {self.id} was deleted")
+            documents = _latest_versions(documents, state['documents'])
+            self._remove_superseded(state['superseded'])
+            engine = self.engine
+            if state['kb_revision'] != engine.kb_version:
+                engine = engine.for_workspace(engine.persist_directory)
+
+            built = False
+            try:
+                engine.build_knowledge_base(documents, progress=progress)
+                built = True
+            finally:
+                # Even an aborted build may have changed the stored chunks
+                def mutate(state):
+                    state['kb_revision'] = engine.kb_version
+                    state['knowledge_base_built'] = state['knowledge_base_built'] or built
+
+                with self._lock:
+                    self.apply(*self.store.update_workspace(self.id, mutate))
+                if engine is not self.engine:
+                    engine.close_knowledge_base()
+        return engine
+
+    def _remove_superseded(self, paths: List[str]):
+        """Delete the text of replaced uploads; only builds read it, and they hold the build lock"""
+        if not paths:
+            return
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+        def mutate(state):
+            state['superseded'] = [path for path in state['superseded'] if path not in paths]
+
+        with self._lock:
+            self.apply(*self.store.update_workspace(self.id, mutate))
+
+    def close(self):
+        self.engine.close_knowledge_base()
+        self.store.remove_holder(self.id, self.incarnation)
+
+    def memory_bytes(self) -> int:
+        """Estimated memory held by the workspace's documents and knowledge base"""
+        in_memory_text = sum(len(doc.get('content', '')) for doc in self.doc_processor.documents)
+        return self.engine.manifest.num_chunks() * BYTES_PER_CHUNK + len(self.uploaded_html) + in_memory_text
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'workspace_id': self.id,
+            'loaded': True,
+            'in_use': self.users > 0,
+            'knowledge_base_built': self.knowledge_base_built,
+            'html_uploaded': bool(self.uploaded_html),
+            'num_documents': len(self.doc_processor.documents),
+            'num_chunks': self.engine.manifest.num_chunks(),
+            'memory_bytes': self.memory_bytes(),
+            'idle_seconds': round(time.time() - self.last_used, 1),
+            'version': self.version
+        }
+
+
+def _latest_versions(documents: List[Dict[str, Any]], current: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Swap documents replaced since a build was queued for their current version"""
+    by_name = {doc['filename']: doc for doc in current}
+    paths = {doc.get('path') for doc in current}
+    return [
+        by_name.get(doc['filename'], doc) if doc.get('path') and doc['path'] not in paths else doc
+        for doc in documents
+    ]
+
+
+class WorkspaceManager:
+    """Keeps workspaces in memory under a memory budget, evicting idle ones.
+
+    acquire() returns a loaded workspace, loading it if needed, and marks it
+    in use until release(). When the estimated memory of all loaded
+    workspaces exceeds the budget, the least recently used workspaces that
+    are not in use are dropped; they are loaded again on their next request.
+    The default workspace keeps using the original vector_db and uploads
+    directories.
+
+    Several worker processes can serve the same workspaces: acquire() checks
+    the shared state version and picks up documents uploaded through another
+    worker, and a knowledge base rebuilt by another worker is reopened as
+    soon as no request in this process is using the old one.
+
+    Deleting a workspace leaves a tombstone in the state store. Its files are
+    moved to a trash directory and removed once no worker has that
+    incarnation loaded; other workers drop their copy on its next acquire().
+    """
+
+    def __init__(self, engine: RAGEngine, processor: DocumentProcessor, root: str = "./workspaces",
+                 memory_budget_bytes: int = 1024 * 1024 * 1024, store: StateStore = None):
+        self.engine = engine
+        self.processor = processor
+        self.root = root
+        self.memory_budget_bytes = memory_budget_bytes
+        self.store = store or StateStore(os.path.join(root, "state.sqlite3"))
+        self._loaded: "OrderedDict[str, Workspace]" = OrderedDict()
+        self._lock = threading.RLock()
+        # Per-workspace locks so one slow load does not block other workspaces
+        self._load_locks: Dict[str, threading.Lock] = {}
+
+        self.loads = 0
+        self.reloads = 0
+        self.evictions = 0
+        # Retrieval cache counters of evicted or reloaded engines, so the totals stay monotonic
+        self.evicted_retrieval_hits = 0
+        self.evicted_retrieval_misses = 0
+        # Workspaces deleted while this or an earlier worker still had them loaded
+        self._purge()
+
+    def validate_id(self, workspace_id: str) -> str:
+        if not WORKSPACE_ID_PATTERN.match(workspace_id or ""):
+            raise ValueError(
+                f"Invalid workspace id '{workspace_id}': use up to 64 letters, digits, '.', '_' or '-'"
+            )
+        return workspace_id
+
+    def _create(self, workspace_id: str) -> Workspace:
+        directory = os.path.join(self.root, workspace_id)
+        if workspace_id == DEFAULT_WORKSPACE:
+            persist_directory = self.engine.persist_directory
+            storage_dir = self.processor.storage_dir
+        else:
+            persist_directory = os.path.join(directory, "vector_db")
+            storage_dir = os.path.join(directory, "uploads")
+
+        return Workspace(
+            workspace_id, directory,
+            self.engine.for_workspace(persist_directory),
+            self.processor.for_storage(storage_dir),
+            self.store
+        )
+
+    def acquire(self, workspace_id: str) -> Workspace:
+        """Return the workspace, loading it if needed, and mark it in use"""
+        workspace_id = self.validate_id(workspace_id)
+
+        with self._lock:
+            workspace = self._loaded.get(workspace_id)
+            if workspace is not None:
+                self._loaded.move_to_end(workspace_id)
+                workspace.users += 1
+                workspace.last_used = time.time()
+        if workspace is not None:
+            if self._refresh(workspace):
+                return workspace
+            self._discard(workspace)
+
+        with self._lock:
+            load_lock = self._load_locks.setdefault(workspace_id, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                workspace = self._loaded.get(workspace_id)
+                if workspace is not None:
+                    workspace.users += 1
+                    workspace.last_used = time.time()
+                    return workspace
+
+            start = time.perf_counter()
+            workspace = self._create(workspace_id)
+            workspace.load()
+
+            with self._lock:
+                workspace.users += 1
+                self._loaded[workspace_id] = workspace
+                self.loads += 1
+            print(f"Loaded workspace {workspace_id} in {time.perf_counter() - start:.2f}s")
+
+        self.enforce_budget()
+        return workspace
+
+    def _refresh(self, workspace: Workspace) -> bool:
+        """Catch up with changes other workers made to an acquired workspace; False if one deleted it"""
+        if self.store.workspace_version(workspace.id) == workspace.version and not workspace.stale:
+            return True
+        with workspace._lock:
+            version, state = self.store.get_workspace(workspace.id)
+            if state['incarnation'] != workspace.incarnation:
+                return False
+            if version != workspace.version:
+                workspace.apply(version, state)
+            # Only the caller uses it, so the old knowledge base can be closed right away
+            if workspace.stale and workspace.users == 1:
+                self._reload(workspace)
+        return True
+
+    def _discard(self, workspace: Workspace):
+        """Drop an acquired copy of a workspace another worker deleted; it closes once idle"""
+        with self._lock:
+            if self._loaded.get(workspace.id) is workspace:
+                self._loaded.pop(workspace.id)
+            workspace.deleted = True
+        print(f"Dropped workspace {workspace.id}, deleted by another worker")
+        self.release(workspace)
+
+    def _reload(self, workspace: Workspace):
+        """Reopen a workspace's knowledge base from disk; the caller holds workspace._lock"""
+        with self._lock:
+            if self._loaded.get(workspace.id) is not workspace:
+                # Evicted meanwhile; it is loaded afresh on its next request
+                return
+        start = time.perf_counter()
+        old = workspace.engine
+        # Close first, so Chroma does not hand the new engine the old client's cached state
+        old.close_knowledge_base()
+        engine = old.for_workspace(old.persist_directory)
+        if workspace.knowledge_base_built:
+            engine.load_knowledge_base()
+        workspace.engine = engine
+        workspace.kb_revision = engine.kb_version
+        with self._lock:
+            self.reloads += 1
+            self.evicted_retrieval_hits += old.retrieval_cache.hits
+            self.evicted_retrieval_misses += old.retrieval_cache.misses
+        print(f"Reloaded knowledge base of workspace {workspace.id} at revision {engine.kb_version} "
+              f"in {time.perf_counter() - start:.2f}s")
+
+    def retain(self, workspace: Workspace):
+        """Mark an already acquired workspace in use once more (e.g. by a background build)"""
+        with self._lock:
+            workspace.users += 1
+
+    def release(self, workspace: Workspace):
+        with self._lock:
+            workspace.users = max(0, workspace.users - 1)
+            workspace.last_used = time.time()
+            idle = workspace.users == 0
+        if idle and workspace.deleted:
+            with workspace._lock:
+                workspace.close()
+            self._purge()
+            return
+        if idle and workspace.stale:
+            with workspace._lock:
+                if workspace.users == 0 and workspace.stale:
+                    self._reload(workspace)
+        self.enforce_budget()
+
+    def memory_bytes(self) -> int:
+        with self._lock:
+            return sum(workspace.memory_bytes() for workspace in self._loaded.values())
+
+    def enforce_budget(self):
+        """Evict least recently used idle workspaces until the loaded ones fit the budget"""
+        with self._lock:
+            total = sum(workspace.memory_bytes() for workspace in self._loaded.values())
+            if total <= self.memory_budget_bytes:
+                return
+            victims = []
+            # The most recently used workspace always stays, so a single large one does not thrash
+            for workspace in list(self._loaded.values())[:-1]:
+                if total <= self.memory_budget_bytes:
+                    break
+                if workspace.users > 0:
+                    continue
+                total -= workspace.memory_bytes()
+                victims.append(self._loaded.pop(workspace.id))
+
+        for workspace in victims:
+            self._evict(workspace)
+
+    def _evict(self, workspace: Workspace):
+        # Holding the load lock makes a concurrent acquire() wait until the vector store is closed
+        with self._lock:
+            load_lock = self._load_locks.setdefault(workspace.id, threading.Lock())
+        with load_lock, workspace._lock:
+            workspace.close()
+        with self._lock:
+            self.evictions += 1
+            self.evicted_retrieval_hits += workspace.engine.retrieval_cache.hits
+            self.evicted_retrieval_misses += workspace.engine.retrieval_cache.misses
+        print(f"Evicted idle workspace {workspace.id}")
+        self._purge()
+
+    def loaded(self) -> List[Workspace]:
+        with self._lock:
+            return list(self._loaded.values())
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Workspaces loaded in this worker and those known to the state store"""
+        workspaces = {workspace.id: workspace.to_dict() for workspace in self.loaded()}
+        for workspace_id in self.store.workspace_ids():
+            if workspace_id not in workspaces:
+                workspaces[workspace_id] = {'workspace_id': workspace_id, 'loaded': False}
+        return list(workspaces.values())
+
+    def delete(self, workspace_id: str) -> bool:
+        """Delete a workspace for every worker; returns False if it is in use here or being built"""
+        workspace_id = self.validate_id(workspace_id)
+        # Checked before waiting for the build lock, which a running build holds until it finishes
+        if self._building(workspace_id):
+            return False
+
+        with self._lock:
+            load_lock = self._load_locks.setdefault(workspace_id, threading.Lock())
+        # The build lock keeps builds in any worker out; the load lock keeps acquire() here from reloading it
+        with self.store.lock(f"build-{workspace_id}"), load_lock:
+            if self._building(workspace_id):
+                return False
+            with self._lock:
+                workspace = self._loaded.get(workspace_id)
+                if workspace is not None:
+                    if workspace.users > 0:
+                        return False
+                    self._loaded.pop(workspace_id)
+
+            if workspace is not None:
+                with workspace._lock:
+                    workspace.close()
+            _, state = self.store.get_workspace(workspace_id)
+            trash = self._move_to_trash(workspace_id, state)
+            self.store.delete_workspace(workspace_id, trash)
+        self._purge()
+        return True
+
+    def _building(self, workspace_id: str) -> bool:
+        """Whether a build of the workspace is queued or running in any live worker"""
+        return any(
+            job.get('workspace_id') == workspace_id
+            for job in self.store.active_jobs(STALE_JOB_SECONDS)
+        )
+
+    def _move_to_trash(self, workspace_id: str, state: Dict[str, Any]) -> Optional[str]:
+        """Move a workspace's files out of the way; other workers may still read the open ones"""
+        paths = [os.path.join(self.root, workspace_id)]
+        if workspace_id == DEFAULT_WORKSPACE:
+            # Its knowledge base and uploads live outside the workspace directory
+            paths.append(self.engine.persist_directory)
+            paths.extend(doc['path'] for doc in state['documents'] if doc.get('path'))
+            paths.extend(state['superseded'])
+        paths = [path for path in paths if os.path.exists(path)]
+        if not paths:
+            return None
+
+        trash = os.path.join(self.root, ".trash", f"{workspace_id}-{uuid.uuid4().hex}")
+        os.makedirs(trash)
+        for i, path in enumerate(paths):
+            shutil.move(path, os.path.join(trash, f"{i}-{os.path.basename(path)}"))
+        return trash
+
+    def _purge(self):
+        """Remove the files of deleted workspaces that no live worker has loaded any more"""
+        for path in self.store.purgeable_trash():
+            shutil.rmtree(path, ignore_errors=True)
+            self.store.forget_trash(path)
+
+    def stats(self) -> Dict[str, Any]:
+        loaded = self.loaded()
+        return {
+            'loaded': len(loaded),
+            'in_use': sum(1 for workspace in loaded if workspace.users > 0),
+            'memory_bytes': sum(workspace.memory_bytes() for workspace in loaded),
+            'memory_budget_bytes': self.memory_budget_bytes,
+            'loads': self.loads,
+            'reloads': self.reloads,
+            'evictions': self.evictions
+        }
+
+    def close(self):
+        """Close every loaded workspace, e.g. at shutdown; their state is already in the store"""
+        for workspace in self.loaded():
+            workspace.close()
+        self._purge()
+        self.store.close()
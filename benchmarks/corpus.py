@@ -0,0 +1,78 @@
+import os
+from typing import Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SUPPORT_DOCS_DIR = os.path.join(REPO_ROOT, "assests", "support_docs")
+CHECKOUT_HTML = os.path.join(REPO_ROOT, "assests", "checkout.html")
+
+# Typical QA requests against the sample documents
+QUERIES = [
+    "Generate test cases for discount code SAVE15",
+    "Shipping method express vs standard pricing",
+    "Validation rules for the email field",
+    "Payment form required fields and error messages",
+    "Cart quantity update and total calculation",
+    "What happens when an invalid discount code is applied",
+    "Button colors and UI style guide",
+    "API endpoint for applying coupons",
+]
+
+SAMPLE_TEST_CASE = {
+    "test_id": "TC-001",
+    "feature": "Discount Code",
+    "test_scenario": "Apply valid discount code SAVE15",
+    "test_type": "positive",
+    "preconditions": "Cart has items",
+    "test_steps": ["Enter SAVE15", "Click Apply", "Verify total"],
+    "expected_result": "15% discount applied",
+    "grounded_in": "product_specss.md"
+}
+
+
+def load_support_docs() -> List[Dict[str, str]]:
+    """The sample support documents as {'filename', 'content'} dicts"""
+    docs = []
+    for filename in sorted(os.listdir(SUPPORT_DOCS_DIR)):
+        with open(os.path.join(SUPPORT_DOCS_DIR, filename), 'r', encoding='utf-8') as f:
+            docs.append({'filename': filename, 'content': f.read()})
+    return docs
+
+
+def load_checkout_html() -> str:
+    with open(CHECKOUT_HTML, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def scaled_corpus(scale: int) -> List[Dict[str, str]]:
+    """The support documents repeated `scale` times as distinct files.
+
+    Every copy gets its own file name and a copy marker on each paragraph,
+    so chunks never collide in the manifest or the embedding cache and a
+    10x corpus really costs ten times the work.
+    """
+    base = load_support_docs()
+    if scale <= 1:
+        return base
+
+    docs = []
+    for copy in range(scale):
+        for doc in base:
+            stem, extension = os.path.splitext(doc['filename'])
+            marker = f"[copy {copy}] "
+            docs.append({
+                'filename': f"{stem}_{copy:03d}{extension}",
+                'content': marker + doc['content'].replace("\n\n", "\n\n" + marker)
+            })
+    return docs
+
+
+def write_corpus(docs: List[Dict[str, str]], directory: str) -> List[str]:
+    """Write documents to a directory and return their paths"""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for doc in docs:
+        path = os.path.join(directory, doc['filename'])
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(doc['content'])
+        paths.append(path)
+    return paths
@@ -0,0 +1,190 @@
+"""Local stand-in for the Ollama generate API, for load testing without a GPU box.
+
+Implements POST /api/generate (streaming NDJSON and non-streaming) with a
+configurable time to first token, token rate and error injection. Test case
+prompts get valid test case JSON back and everything else gets a Selenium
+script, so the backend goes down its normal (non-mock) code paths.
+
+    python -m benchmarks.fake_ollama --port 11500 --latency 0.5 --token-rate 40
+    OLLAMA_URL=http://localhost:11500 uvicorn backend.main:app
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+from typing import Any, Dict, List
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+SELENIUM_SCRIPT = """from selenium import webdriver
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+
+
+def test_checkout():
+    driver = webdriver.Chrome()
+    try:
+        driver.get("file:///path/to/checkout.html")
+        wait = WebDriverWait(driver, 10)
+
+        code_input = wait.until(EC.presence_of_element_located((By.ID, "discount-code")))
+        code_input.send_keys("SAVE15")
+        driver.find_element(By.ID, "apply-discount").click()
+
+        assert "15%" in driver.page_source
+        print("Test passed")
+    finally:
+        driver.quit()
+
+
+if __name__ == "__main__":
+    test_checkout()
+"""
+
+
+def fake_response(prompt: str) -> str:
+    """Plausible model output for the prompts the backend sends"""
+    match = re.search(r'EXACTLY (\d+)', prompt)
+    if match and '"test_cases"' in prompt:
+        num_cases = int(match.group(1))
+        # Shards of a sharded suite name the features they cover
+        focus = re.search(r'FOCUS: Only test (.+?);', prompt)
+        feature = focus.group(1) if focus else "Discount Code"
+        part = re.search(r'part (\d+) of', prompt)
+        offset = (int(part.group(1)) - 1) * num_cases if part else 0
+        test_cases = []
+        for i in range(num_cases):
+            negative = i % 3 == 2
+            test_cases.append({
+                "test_id": f"TC-{i + 1:03d}",
+                "feature": feature,
+                "test_scenario": f"{'Reject invalid' if negative else 'Apply valid'} {feature.lower()}, "
+                                 f"case {offset + i + 1}",
+                "test_type": "negative" if negative else "positive",
+                "preconditions": "User is on the checkout page with items in the cart",
+                "test_steps": [
+                    f"Step 1: Enter the {feature.lower()} input for case {offset + i + 1}",
+                    "Step 2: Click Apply",
+                    "Step 3: Verify the order total"
+                ],
+                "expected_result": "Error message is shown" if negative else "Discount is applied to the total",
+                "grounded_in": "product_specs.md"
+            })
+        return json.dumps({"test_cases": test_cases}, indent=2)
+    return SELENIUM_SCRIPT
+
+
+def split_tokens(text: str) -> List[str]:
+    """Roughly word-piece sized tokens (about four characters each)"""
+    return re.findall(r'\s*\S{1,4}|\s+', text)
+
+
+def create_app(latency: float = 0.2, token_rate: float = 50.0, jitter: float = 0.1,
+               error_rate: float = 0.0, stream_error_rate: float = 0.0, seed: int = None) -> FastAPI:
+    """Build the fake server.
+
+    latency is the time to first token in seconds and token_rate the tokens
+    per second afterwards (0 for instant). Each delay varies by +/- jitter
+    (a fraction). error_rate is the share of requests answered with HTTP 500,
+    stream_error_rate the share of streams that fail midway.
+    """
+    app = FastAPI(title="Fake Ollama")
+    rng = random.Random(seed)
+    stats = {'requests': 0, 'streams': 0, 'errors': 0, 'stream_errors': 0, 'tokens': 0}
+
+    def varied(seconds: float) -> float:
+        return max(0.0, seconds * (1 + rng.uniform(-jitter, jitter)))
+
+    def token_delay() -> float:
+        return varied(1.0 / token_rate) if token_rate > 0 else 0.0
+
+    def final_chunk(model: str, started: float, num_tokens: int, response: str = "") -> Dict[str, Any]:
+        return {
+            "model": model,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "response": response,
+            "done": True,
+            "total_duration": int((time.perf_counter() - started) * 1e9),
+            "eval_count": num_tokens
+        }
+
+    @app.get("/api/tags")
+    async def tags():
+        return {"models": [{"name": "llama3.2:latest"}]}
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        body = await request.json()
+        model = body.get("model", "llama3.2")
+        stream = body.get("stream", True)
+        started = time.perf_counter()
+        stats['requests'] += 1
+
+        if rng.random() < error_rate:
+            stats['errors'] += 1
+            await asyncio.sleep(varied(latency))
+            return JSONResponse({"error": "injected failure"}, status_code=500)
+
+        tokens = split_tokens(fake_response(body.get("prompt", "")))
+        stats['tokens'] += len(tokens)
+
+        if not stream:
+            await asyncio.sleep(varied(latency) + sum(token_delay() for _ in tokens))
+            return final_chunk(model, started, len(tokens), "".join(tokens))
+
+        stats['streams'] += 1
+        fail_at = rng.randrange(1, max(2, len(tokens))) if rng.random() < stream_error_rate else None
+
+        async def stream_tokens():
+            await asyncio.sleep(varied(latency))
+            for i, token in enumerate(tokens):
+                if i == fail_at:
+                    stats['stream_errors'] += 1
+                    yield json.dumps({"error": "injected stream failure"}) + "\n"
+                    return
+                yield json.dumps({"model": model, "response": token, "done": False}) + "\n"
+                delay = token_delay()
+                if delay:
+                    await asyncio.sleep(delay)
+            yield json.dumps(final_chunk(model, started, len(tokens))) + "\n"
+
+        return StreamingResponse(stream_tokens(), media_type="application/x-ndjson")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds to first token")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="Tokens per second (0 = instant)")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Relative random variation of delays")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests failing with HTTP 500")
+    parser.add_argument("--stream-error-rate", type=float, default=0.0, help="Share of streams failing midway")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    app = create_app(
+        latency=args.latency,
+        token_rate=args.token_rate,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        stream_error_rate=args.stream_error_rate,
+        seed=args.seed
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""Drive a running backend with concurrent requests and report throughput and latency.
+
+Start the fake model server and the backend pointed at it, then run the load
+generator against the backend:
+
+    python -m benchmarks.fake_ollama --port 11500
+    OLLAMA_URL=http://localhost:11500 uvicorn backend.main:app --port 8000
+    python -m benchmarks.load_test --concurrency 8 --requests 64
+
+The sample documents and checkout.html are uploaded and the knowledge base
+is built once before the scenarios run. With --workspaces N, requests are
+spread round-robin over N separate workspaces, each prepared the same way.
+Generation requests bypass the LLM response cache unless --use-cache is
+given, so every request reaches the model server.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Tuple
+
+import httpx
+
+from benchmarks.corpus import (
+    CHECKOUT_HTML, QUERIES, REPO_ROOT, SAMPLE_TEST_CASE, load_support_docs
+)
+from benchmarks.stats import summarize
+
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+SCENARIOS = ("upload", "build", "test_cases", "script")
+
+
+def upload_files() -> List[Tuple[str, Tuple[str, bytes, str]]]:
+    """Multipart payload with the sample support documents and checkout.html"""
+    files = [
+        ("files", (doc['filename'], doc['content'].encode('utf-8'), "text/plain"))
+        for doc in load_support_docs()
+    ]
+    with open(CHECKOUT_HTML, 'rb') as f:
+        files.append(("files", (os.path.basename(CHECKOUT_HTML), f.read(), "text/html")))
+    return files
+
+
+def workspace_headers(index: int, args) -> Dict[str, str]:
+    """Headers addressing the workspace request number `index` goes to"""
+    if args.workspaces <= 1:
+        return {}
+    return {"X-Workspace-ID": f"load-{index % args.workspaces}"}
+
+
+def scenario_request(scenario: str, index: int, args) -> Callable[[httpx.AsyncClient], Any]:
+    """The coroutine function issuing request number `index` of a scenario"""
+    bypass_cache = not args.use_cache
+    headers = workspace_headers(index, args)
+
+    if scenario == "upload":
+        files = upload_files()
+        return lambda client: client.post("/upload_documents", files=files, headers=headers)
+    if scenario == "build":
+        return lambda client: client.post("/build_knowledge_base", headers=headers)
+    if scenario == "test_cases":
+        payload = {
+            "query": QUERIES[index % len(QUERIES)],
+            "num_cases": args.num_cases,
+            "bypass_cache": bypass_cache
+        }
+        return lambda client: client.post("/generate_test_cases", json=payload, headers=headers)
+    if scenario == "script":
+        test_case = dict(SAMPLE_TEST_CASE, test_id=f"TC-{index + 1:03d}")
+        payload = {
+            "test_case_id": test_case['test_id'],
+            "test_case_content": test_case,
+            "bypass_cache": bypass_cache
+        }
+        return lambda client: client.post("/generate_selenium_script", json=payload, headers=headers)
+    raise ValueError(f"Unknown scenario '{scenario}', expected one of {SCENARIOS}")
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: str, args) -> Dict[str, Any]:
+    """Issue args.requests requests with at most args.concurrency in flight"""
+    queue = asyncio.Queue()
+    for index in range(args.requests):
+        queue.put_nowait(index)
+
+    latencies = []
+    errors: Dict[str, int] = {}
+
+    async def worker():
+        while True:
+            try:
+                index = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            send = scenario_request(scenario, index, args)
+            start = time.perf_counter()
+            try:
+                response = await send(client)
+                error = None if response.status_code < 400 else f"HTTP {response.status_code}"
+            except httpx.HTTPError as e:
+                error = type(e).__name__
+            elapsed = time.perf_counter() - start
+            if error:
+                errors[error] = errors.get(error, 0) + 1
+            else:
+                latencies.append(elapsed)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(args.concurrency, args.requests))))
+    wall_seconds = time.perf_counter() - started
+
+    return {
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'succeeded': len(latencies),
+        'errors': sum(errors.values()),
+        'error_types': errors,
+        'wall_seconds': round(wall_seconds, 4),
+        'throughput_rps': round(len(latencies) / wall_seconds, 4) if wall_seconds else 0.0,
+        'latency': summarize(latencies)
+    }
+
+
+async def prepare(client: httpx.AsyncClient, args):
+    """Upload the sample documents and build the knowledge base once per workspace"""
+    for index in range(max(1, args.workspaces)):
+        headers = workspace_headers(index, args)
+        response = await client.post("/upload_documents", files=upload_files(), headers=headers)
+        response.raise_for_status()
+        response = await client.post("/build_knowledge_base", headers=headers)
+        response.raise_for_status()
+        print(f"prepared {headers.get('X-Workspace-ID', 'default')}: {response.json().get('num_chunks')} chunks")
+
+
+async def run(args) -> Dict[str, Any]:
+    results = {}
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout) as client:
+        if not args.skip_prepare:
+            await prepare(client, args)
+        for scenario in args.scenarios:
+            results[scenario] = await run_scenario(client, scenario, args)
+            summary = results[scenario]
+            print(f"{scenario}: {summary['succeeded']}/{summary['requests']} ok, "
+                  f"{summary['throughput_rps']} req/s, p50 {summary['latency'].get('p50_ms')} ms, "
+                  f"p95 {summary['latency'].get('p95_ms')} ms, p99 {summary['latency'].get('p99_ms')} ms")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000", help="Backend under test")
+    parser.add_argument("--concurrency", type=int, default=4, help="Requests in flight per scenario")
+    parser.add_argument("--requests", type=int, default=32, help="Requests per scenario")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"Comma separated scenarios to run, from {','.join(SCENARIOS)}")
+    parser.add_argument("--workspaces", type=int, default=1, help="Spread requests over this many workspaces")
+    parser.add_argument("--num-cases", type=int, default=5, help="Test cases requested per generation")
+    parser.add_argument("--use-cache", action="store_true", help="Allow LLM response cache hits")
+    parser.add_argument("--skip-prepare", action="store_true", help="Do not upload documents and build first")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Per request timeout in seconds")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/load-<timestamp>.json)")
+    args = parser.parse_args()
+    args.scenarios = [scenario.strip() for scenario in args.scenarios.split(",") if scenario.strip()]
+    for scenario in args.scenarios:
+        if scenario not in SCENARIOS:
+            parser.error(f"unknown scenario '{scenario}', expected one of {', '.join(SCENARIOS)}")
+
+    report = {
+        'environment': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'base_url': args.base_url,
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+            'workspaces': args.workspaces,
+            'use_cache': args.use_cache
+        },
+        'results': asyncio.run(run(args))
+    }
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"load-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.json"
+    )
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+"""Benchmark the ingestion, retrieval and generation pipeline, fully offline.
+
+Runs each stage against the sample support documents and synthetic 10x /
+100x copies of them, with a stubbed LLM and (by default) hash-based stub
+embeddings, and writes the results to a JSON file that later runs can be
+compared against.
+
+    python -m benchmarks.run_benchmarks --scales 1,10,100
+    python -m benchmarks.run_benchmarks --compare benchmarks/results/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Tuple
+
+from backend.document_processor import DocumentProcessor
+from backend.dom_index import DomIndex, get_dom_index
+from backend.embedding_backends import EMBEDDING_BACKENDS
+from backend.embedding_cache import CachedEmbeddings
+from backend.json_stream import TestCaseStreamParser
+from backend.rag_engine import RAGEngine
+from backend.retrieval_cache import RetrievalCache
+from benchmarks.corpus import (
+    QUERIES, REPO_ROOT, SAMPLE_TEST_CASE, load_checkout_html, scaled_corpus, write_corpus
+)
+from benchmarks.stats import summarize
+from benchmarks.stubs import HashEmbeddings, StubLLMClient
+
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+
+
+def measure(fn: Callable[[], Any], repeat: int, warmup: int = 1) -> Dict[str, float]:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def make_engine(workdir: str, args) -> RAGEngine:
+    """RAG engine isolated in workdir, with a stub LLM and the selected embeddings"""
+    engine = RAGEngine(
+        ollama_url="http://127.0.0.1:9",
+        persist_directory=os.path.join(workdir, "vector_db"),
+        embedding_cache_path=os.path.join(workdir, "embedding_cache", "embeddings.sqlite3"),
+        llm_cache_path=os.path.join(workdir, "llm_cache", "responses.sqlite3"),
+        vector_backend=args.vector_backend,
+        vector_quantize=args.quantize,
+        embedding_backend="huggingface" if args.embedding_backend == "hash" else args.embedding_backend,
+        embedding_local_only=True
+    )
+    if args.embedding_backend == "hash":
+        engine._embeddings = CachedEmbeddings(
+            HashEmbeddings(),
+            model_name="hash",
+            cache_path=os.path.join(workdir, "embedding_cache", "embeddings.sqlite3")
+        )
+    engine.llm_client = StubLLMClient(engine._mock_llm_response, latency=args.llm_latency)
+    return engine
+
+
+def bench_extraction(docs: List[Dict[str, str]], workdir: str) -> Tuple[Dict[str, Any], List[Dict[str, str]]]:
+    """Spool the corpus as uploads and extract it through the process pool"""
+    source_paths = write_corpus(docs, os.path.join(workdir, "corpus"))
+    processor = DocumentProcessor(storage_dir=os.path.join(workdir, "uploads"))
+    try:
+        uploads = []
+        for path in source_paths:
+            spool_path = processor.new_spool_path(os.path.basename(path))
+            shutil.copyfile(path, spool_path)
+            uploads.append((spool_path, os.path.basename(path)))
+
+        total_bytes = sum(os.path.getsize(path) for path, _ in uploads)
+        start = time.perf_counter()
+        extracted = processor.process_paths(uploads)
+        seconds = time.perf_counter() - start
+    finally:
+        processor.close()
+
+    return {
+        'documents': len(extracted),
+        'bytes': total_bytes,
+        'seconds': round(seconds, 4),
+        'mb_per_second': round(total_bytes / seconds / 1e6, 3),
+        'docs_per_second': round(len(extracted) / seconds, 2)
+    }, extracted
+
+
+def bench_chunking(engine: RAGEngine, docs: List[Dict[str, str]]) -> Tuple[Dict[str, Any], List[str]]:
+    total_bytes = 0
+    chunks = []
+    start = time.perf_counter()
+    for doc in docs:
+        for chunk in engine._iter_chunks(doc):
+            chunks.append(chunk)
+            total_bytes += len(chunk)
+    seconds = time.perf_counter() - start
+    return {
+        'chunks': len(chunks),
+        'seconds': round(seconds, 4),
+        'chunks_per_second': round(len(chunks) / seconds, 1),
+        'mb_per_second': round(total_bytes / seconds / 1e6, 3)
+    }, chunks
+
+
+def bench_embedding(engine: RAGEngine, chunks: List[str], sample: int) -> Dict[str, Any]:
+    """Raw model throughput, bypassing the embedding cache"""
+    model = engine.embeddings.embeddings
+    chunks = chunks[:sample]
+    start = time.perf_counter()
+    for batch_start in range(0, len(chunks), engine.EMBED_BATCH_SIZE):
+        model.embed_documents(chunks[batch_start:batch_start + engine.EMBED_BATCH_SIZE])
+    seconds = time.perf_counter() - start
+    return {
+        'chunks': len(chunks),
+        'seconds': round(seconds, 4),
+        'chunks_per_second': round(len(chunks) / seconds, 1)
+    }
+
+
+def bench_build(engine: RAGEngine, docs: List[Dict[str, str]]) -> Dict[str, Any]:
+    start = time.perf_counter()
+    num_chunks = engine.build_knowledge_base(docs)
+    cold = time.perf_counter() - start
+
+    start = time.perf_counter()
+    engine.build_knowledge_base(docs)
+    unchanged = time.perf_counter() - start
+
+    result = {
+        'chunks': num_chunks,
+        'cold_seconds': round(cold, 4),
+        'chunks_per_second': round(num_chunks / cold, 1),
+        'unchanged_rebuild_seconds': round(unchanged, 4)
+    }
+    if engine.vector_store is not None:
+        result['vector_store'] = engine.vector_store.stats()
+    result['corpus'] = engine.corpus.stats()
+    return result
+
+
+def bench_retrieval(engine: RAGEngine, repeat: int) -> Dict[str, Any]:
+    def run_queries():
+        for query in QUERIES:
+            engine.retrieve_context(query, k=engine.TEST_CASE_CONTEXT_K)
+
+    # A zero-sized cache never holds entries, so every call does the full search
+    engine.retrieval_cache = RetrievalCache(max_entries=0)
+    uncached = measure(run_queries, repeat)
+    engine.retrieval_cache = RetrievalCache()
+    cached = measure(run_queries, repeat)
+
+    per_query = len(QUERIES)
+    for stats in (uncached, cached):
+        for key in ('mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'min_ms', 'max_ms'):
+            stats[key] = round(stats[key] / per_query, 4)
+        stats['queries_per_run'] = per_query
+    return {'uncached': uncached, 'cached': cached}
+
+
+def bench_html(html: str, repeat: int) -> Dict[str, Any]:
+    def parse():
+        index = DomIndex(html)
+        index.element_summary()
+        index.feature_summary()
+
+    return {
+        'bytes': len(html.encode('utf-8')),
+        'parse_and_summarize': measure(parse, repeat),
+        'cached_lookup': measure(lambda: get_dom_index(html).element_summary(), repeat)
+    }
+
+
+def bench_parsing(engine: RAGEngine, repeat: int, num_cases: int = 20) -> Dict[str, Any]:
+    response = engine._mock_llm_response(f"Generate EXACTLY {num_cases} test cases")
+    tokens = [response[i:i + 8] for i in range(0, len(response), 8)]
+
+    def parse_stream():
+        parser = TestCaseStreamParser()
+        for token in tokens:
+            parser.feed(token)
+
+    return {
+        'response_bytes': len(response),
+        'test_cases': num_cases,
+        'parse_response': measure(lambda: engine._parse_test_cases(response, "query", num_cases, []), repeat),
+        'parse_stream': measure(parse_stream, repeat)
+    }
+
+
+def bench_generation(engine: RAGEngine, html: str, repeat: int) -> Dict[str, Any]:
+    """End-to-end generation latency with the stub LLM, response cache bypassed"""
+    async def run(fn):
+        samples = []
+        for _ in range(repeat):
+            for query in QUERIES:
+                start = time.perf_counter()
+                await fn(query)
+                samples.append(time.perf_counter() - start)
+        return summarize(samples)
+
+    async def test_cases(query):
+        await engine.agenerate_test_cases(query, num_cases=5, use_cache=False)
+
+    async def script(query):
+        await engine.agenerate_selenium_script(dict(SAMPLE_TEST_CASE, test_scenario=query), html, use_cache=False)
+
+    async def main():
+        return {
+            'test_cases': await run(test_cases),
+            'selenium_script': await run(script),
+            'llm_latency_seconds': engine.llm_client.latency
+        }
+
+    return asyncio.run(main())
+
+
+def run_scale(scale: int, args, html: str) -> Dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix=f"qa-bench-{scale}x-")
+    try:
+        docs = scaled_corpus(scale)
+        print(f"[{scale}x] {len(docs)} documents")
+        engine = make_engine(workdir, args)
+        results = {}
+
+        results['extraction'], extracted = bench_extraction(docs, workdir)
+        print(f"[{scale}x] extraction: {results['extraction']}")
+        results['chunking'], chunks = bench_chunking(engine, extracted)
+        print(f"[{scale}x] chunking: {results['chunking']}")
+        results['embedding'] = bench_embedding(engine, chunks, args.embed_sample)
+        print(f"[{scale}x] embedding: {results['embedding']}")
+        results['index_build'] = bench_build(engine, extracted)
+        print(f"[{scale}x] index build: {results['index_build']}")
+        results['retrieval'] = bench_retrieval(engine, args.repeat)
+        print(f"[{scale}x] retrieval: {results['retrieval']}")
+        results['generation'] = bench_generation(engine, html, max(1, args.repeat // 10))
+        print(f"[{scale}x] generation: {results['generation']}")
+
+        asyncio.run(engine.aclose())
+        return results
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def environment(args) -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+            capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'git_commit': commit,
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'embedding_backend': args.embedding_backend,
+        'vector_backend': args.vector_backend,
+        'quantize': args.quantize,
+        'scales': args.scales,
+        'repeat': args.repeat
+    }
+
+
+def flatten(results: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(current: Dict[str, Any], previous: Dict[str, Any]):
+    """Print every metric present in both runs with its relative change"""
+    old = flatten(previous.get('results', {}))
+    new = flatten(current.get('results', {}))
+    print(f"\nComparison with {previous.get('environment', {}).get('git_commit')} "
+          f"({previous.get('environment', {}).get('timestamp')}):")
+    for name in sorted(set(old) & set(new)):
+        if old[name]:
+            change = 100.0 * (new[name] - old[name]) / old[name]
+            print(f"  {name:70s} {old[name]:>12g} -> {new[name]:>12g} ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", default="1,10", help="Comma separated corpus scale factors (e.g. 1,10,100)")
+    parser.add_argument("--repeat", type=int, default=20, help="Repetitions for latency measurements")
+    parser.add_argument("--embedding-backend", default="hash", choices=("hash",) + EMBEDDING_BACKENDS,
+                        help="'hash' uses offline stub embeddings; others load the model from the local cache")
+    parser.add_argument("--vector-backend", default="chroma", choices=RAGEngine.VECTOR_BACKENDS)
+    parser.add_argument("--quantize", action="store_true", help="Store int8 vectors (flat backend only)")
+    parser.add_argument("--embed-sample", type=int, default=2000, help="Max chunks for the raw embedding benchmark")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Seconds the stub LLM waits per call")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/benchmark-<timestamp>.json)")
+    parser.add_argument("--compare", help="Previous result file to compare against")
+    args = parser.parse_args()
+    args.scales = [int(scale) for scale in args.scales.split(",") if scale.strip()]
+
+    if args.embedding_backend != "hash":
+        os.environ.setdefault("HF_HUB_OFFLINE", "1")
+
+    html = load_checkout_html()
+    report = {'environment': environment(args), 'results': {}}
+    report['results']['html_extraction'] = bench_html(html, args.repeat)
+    print(f"html extraction: {report['results']['html_extraction']}")
+
+    with tempfile.TemporaryDirectory(prefix="qa-bench-parse-") as workdir:
+        engine = make_engine(workdir, args)
+        report['results']['json_parsing'] = bench_parsing(engine, args.repeat)
+        asyncio.run(engine.aclose())
+    print(f"json parsing: {report['results']['json_parsing']}")
+
+    for scale in args.scales:
+        report['results'][f"scale_{scale}x"] = run_scale(scale, args, html)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"benchmark-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.json"
+    )
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+from typing import Dict, List
+
+
+def percentile(sorted_samples: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of already sorted samples"""
+    index = min(len(sorted_samples) - 1, max(0, round(fraction * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """Latency summary in milliseconds"""
+    ordered = sorted(samples)
+    if not ordered:
+        return {'runs': 0}
+    return {
+        'runs': len(ordered),
+        'mean_ms': round(1000 * sum(ordered) / len(ordered), 4),
+        'p50_ms': round(1000 * percentile(ordered, 0.50), 4),
+        'p95_ms': round(1000 * percentile(ordered, 0.95), 4),
+        'p99_ms': round(1000 * percentile(ordered, 0.99), 4),
+        'min_ms': round(1000 * ordered[0], 4),
+        'max_ms': round(1000 * ordered[-1], 4)
+    }
@@ -0,0 +1,78 @@
+import asyncio
+import hashlib
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+class HashEmbeddings(Embeddings):
+    """Deterministic offline stand-in for the embedding model.
+
+    Vectors are built from hashed word counts, so texts that share words
+    get similar vectors and retrieval still behaves sensibly, but no model
+    download or inference is involved.
+    """
+
+    def __init__(self, dimension: int = 384):
+        self.dimension = dimension
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for word in text.lower().split():
+            digest = hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], 'little') % self.dimension
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+class StubLLMClient:
+    """Drop-in replacement for OllamaClient that answers from a function, offline.
+
+    `respond(prompt)` produces the full response text; `latency` seconds are
+    waited before answering and streams are cut into `chunk_size` character
+    tokens, so pipeline overhead can be measured without a model server.
+    """
+
+    def __init__(self, respond: Callable[[str], str], latency: float = 0.0, chunk_size: int = 8,
+                 max_concurrency: int = 4):
+        self.respond = respond
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.max_concurrency = max_concurrency
+        self.calls = 0
+
+    def generate(self, prompt: str, model: str, options: Optional[Dict[str, Any]] = None) -> str:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self.respond(prompt)
+
+    async def agenerate(self, prompt: str, model: str, options: Optional[Dict[str, Any]] = None) -> str:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.respond(prompt)
+
+    async def astream_generate(self, prompt: str, model: str,
+                               options: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        text = self.respond(prompt)
+        for start in range(0, len(text), self.chunk_size):
+            yield text[start:start + self.chunk_size]
+
+    async def aclose(self):
+        pass
+
+    def close(self):
+        pass
@@ -1,6 +1,8 @@
 import streamlit as st
 import requests
+import hashlib
 import json
+import time
 from typing import List
 
 # Configuration
@@ -46,6 +48,21 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+def iter_sse_events(response):
+    """Yield (event, data) pairs from a server-sent events response"""
+    event, data_lines = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if line == "":
+            if data_lines:
+                yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
+
 # Initialize session state
 if 'knowledge_base_built' not in st.session_state:
     st.session_state.knowledge_base_built = False
@@ -54,6 +71,21 @@ if 'test_cases' not in st.session_state:
 if 'uploaded_files' not in st.session_state:
     st.session_state.uploaded_files = []
 
+# Workspace: each team member works on their own documents and knowledge base
+workspace_id = st.sidebar.text_input(
+    "Workspace",
+    value="default",
+    help="Documents, HTML and the knowledge base are kept separately per workspace"
+).strip() or "default"
+if st.session_state.get('workspace_id') != workspace_id:
+    st.session_state.workspace_id = workspace_id
+    st.session_state.knowledge_base_built = False
+    st.session_state.test_cases = []
+
+# All API calls go to the selected workspace
+api = requests.Session()
+api.headers["X-Workspace-ID"] = workspace_id
+
 # Header
 st.markdown('<h1 class="main-header">🤖 Autonomous QA Agent</h1>', unsafe_allow_html=True)
 st.markdown('<p style="text-align: center; font-size: 1.2rem; color: #666;">Intelligent Test Case & Selenium Script Generation</p>', unsafe_allow_html=True)
@@ -91,26 +123,59 @@ with tab1:
         if st.button("🔨 Build Knowledge Base", type="primary", disabled=not uploaded_files):
             with st.spinner("Processing documents and building knowledge base..."):
                 try:
-                    # Upload documents
+                    # Ask which files the backend already has, by content hash
+                    hashes = {file.name: hashlib.sha256(file.getvalue()).hexdigest() for file in uploaded_files}
+                    response = api.post(
+                        f"{API_URL}/upload_documents/check",
+                        json={"files": [{"filename": name, "sha256": sha256} for name, sha256 in hashes.items()]}
+                    )
+                    missing = set(response.json()['missing']) if response.status_code == 200 else set(hashes)
+                    
+                    # Upload only new and changed documents
                     files_data = []
                     for file in uploaded_files:
-                        files_data.append(
-                            ('files', (file.name, file.getvalue(), file.type))
-                        )
+                        if file.name in missing:
+                            files_data.append(
+                                ('files', (file.name, file.getvalue(), file.type))
+                            )
                     
-                    response = requests.post(
-                        f"{API_URL}/upload_documents",
-                        files=files_data
-                    )
+                    if files_data:
+                        response = api.post(
+                            f"{API_URL}/upload_documents",
+                            files=files_data
+                        )
                     
                     if response.status_code == 200:
-                        st.success("✅ Documents uploaded successfully!")
+                        if files_data:
+                            st.success(f"✅ Uploaded {len(files_data)} new or changed document(s), "
+                                       f"{len(uploaded_files) - len(files_data)} already on the server")
+                        else:
+                            st.success("✅ All documents are already uploaded")
+                        
+                        # Build knowledge base in the background and poll its progress
+                        build_response = api.post(f"{API_URL}/build_knowledge_base/jobs")
                         
-                        # Build knowledge base
-                        build_response = requests.post(f"{API_URL}/build_knowledge_base")
+                        if build_response.status_code == 202:
+                            job = build_response.json()
+                            progress_bar = st.progress(0.0, text="Queued...")
+                            while job['status'] in ('queued', 'running'):
+                                time.sleep(0.5)
+                                job = api.get(f"{API_URL}/build_knowledge_base/jobs/{job['job_id']}").json()
+                                total = job['chunks_total']
+                                fraction = job['chunks_embedded'] / total if total else 0.0
+                                rate = f" ({job['chunks_per_second']} chunks/s)" if job['chunks_per_second'] else ""
+                                progress_bar.progress(
+                                    min(fraction, 1.0),
+                                    text=f"{job['phase'].capitalize()}: {job['chunks_embedded']}/{total} chunks embedded{rate}"
+                                )
+                            progress_bar.empty()
                         
-                        if build_response.status_code == 200:
-                            result = build_response.json()
+                        if build_response.status_code != 202:
+                            st.error(f"Failed to build knowledge base: {build_response.text}")
+                        elif job['status'] != 'succeeded':
+                            st.error(f"Knowledge base build {job['status']}: {job.get('error') or ''}")
+                        else:
+                            result = job['result']
                             st.session_state.knowledge_base_built = True
                             
                             st.markdown(f"""
@@ -121,8 +186,6 @@ with tab1:
                                 <p>You can now generate test cases in the next tab.</p>
                             </div>
                             """, unsafe_allow_html=True)
-                        else:
-                            st.error(f"Failed to build knowledge base: {build_response.text}")
                     else:
                         st.error(f"Upload failed: {response.text}")
                 
@@ -134,7 +197,7 @@ with tab1:
         
         # Health check
         try:
-            health = requests.get(f"{API_URL}/health").json()
+            health = api.get(f"{API_URL}/health").json()
             
             st.metric("Knowledge Base", "✅ Built" if health['knowledge_base_built'] else "❌ Not Built")
             st.metric("HTML Uploaded", "✅ Yes" if health['html_uploaded'] else "❌ No")
@@ -172,25 +235,43 @@ with tab2:
                 help="Be specific about features, scenarios, or areas you want to test"
             )
             
-            num_cases = st.slider("Number of test cases", 1, 10, 5)
+            # Suites above the backend's shard size are generated in parallel shards
+            num_cases = st.slider("Number of test cases", 1, 50, 5)
             
             if st.button("🧪 Generate Test Cases", type="primary"):
+                # Render test cases as they stream in instead of waiting for the whole suite
+                live_results = st.empty()
                 with st.spinner("Generating test cases using RAG + LLM..."):
                     try:
-                        response = requests.post(
-                            f"{API_URL}/generate_test_cases",
+                        streamed_cases = []
+                        live_container = live_results.container()
+                        
+                        with api.post(
+                            f"{API_URL}/generate_test_cases/stream",
                             json={
                                 "query": query,
                                 "num_cases": num_cases
-                            }
-                        )
+                            },
+                            stream=True
+                        ) as response:
+                            if response.status_code == 200:
+                                for event, data in iter_sse_events(response):
+                                    if event == "test_case":
+                                        streamed_cases.append(data)
+                                        live_container.markdown(
+                                            f"✅ **{data.get('test_id', f'TC-{len(streamed_cases)}')}** - "
+                                            f"{data.get('feature', 'Test Case')}: {data.get('test_scenario', '')}"
+                                        )
+                                    elif event == "error":
+                                        st.error(f"Generation failed: {data.get('detail')}")
+                                        break
+                            else:
+                                st.error(f"Generation failed: {response.text}")
                         
-                        if response.status_code == 200:
-                            result = response.json()
-                            st.session_state.test_cases = result['test_cases']
+                        live_results.empty()
+                        if streamed_cases:
+                            st.session_state.test_cases = streamed_cases
                             st.success(f"✅ Generated {len(st.session_state.test_cases)} test case(s)!")
-                        else:
-                            st.error(f"Generation failed: {response.text}")
                     
                     except Exception as e:
                         st.error(f"Error: {str(e)}")
@@ -264,7 +345,7 @@ with tab3:
         if st.button("💻 Generate Selenium Script", type="primary"):
             with st.spinner("Generating Python Selenium script..."):
                 try:
-                    response = requests.post(
+                    response = api.post(
                         f"{API_URL}/generate_selenium_script",
                         json={
                             "test_case_id": selected_tc.get('test_id', 'TC-001'),
@@ -302,6 +383,41 @@ with tab3:
                 
                 except Exception as e:
                     st.error(f"Error: {str(e)}")
+        
+        # Batch generation for the whole suite
+        st.markdown("---")
+        st.subheader("Generate Scripts for All Test Cases")
+        
+        if st.button(f"⚡ Generate All {len(st.session_state.test_cases)} Selenium Scripts"):
+            with st.spinner("Generating Selenium scripts concurrently..."):
+                try:
+                    response = api.post(
+                        f"{API_URL}/generate_selenium_scripts",
+                        json={"test_cases": st.session_state.test_cases}
+                    )
+                    
+                    if response.status_code == 200:
+                        result = response.json()
+                        st.success(f"✅ Generated {result['count'] - result['failed']} of {result['count']} script(s)!")
+                        
+                        for item in result['results']:
+                            with st.expander(f"💻 {item['test_case_id']}", expanded=False):
+                                if item['status'] == 'success':
+                                    st.code(item['script'], language='python')
+                                    st.download_button(
+                                        label="📥 Download Script",
+                                        data=item['script'],
+                                        file_name=f"{item['test_case_id']}_selenium.py",
+                                        mime="text/x-python",
+                                        key=f"download_{item['test_case_id']}"
+                                    )
+                                else:
+                                    st.error(f"Generation failed: {item['error']}")
+                    else:
+                        st.error(f"Generation failed: {response.text}")
+                
+                except Exception as e:
+                    st.error(f"Error: {str(e)}")
 
 # Footer
 st.markdown("---")
@@ -0,0 +1,167 @@
+import os
+
+import pytest
+
+from backend import corpus_store
+from backend.corpus_store import CorpusStore
+from benchmarks.corpus import load_support_docs
+from tests.test_vector_backends import close_engine, make_engine
+
+FIRST = "Discount codes SAVE15 and SAVE20 apply to the cart total. "
+SECOND = "Express shipping arrives in two business days. "
+
+
+def open_store(directory) -> CorpusStore:
+    store = CorpusStore(str(directory))
+    # Compact small test corpora too
+    store.COMPACT_MIN_BYTES = 0
+    return store
+
+
+def texts(store: CorpusStore):
+    return {chunk_id: (store.source(chunk_id), store.text(chunk_id)) for chunk_id in store.ids()}
+
+
+def fill(store: CorpusStore):
+    """Two sources whose chunks point into their text, and one chunk stored on its own"""
+    offset, length = store.append_text([FIRST[:20], FIRST[20:]])
+    store.put("first-0", "first.md", offset, 15)
+    store.put("first-1", "first.md", offset + 10, length - 10)
+    offset, length = store.append_text([SECOND])
+    store.put("second-0", "second.md", offset, length)
+    store.add("loose", "second.md", "A chunk not found in its source")
+
+
+def test_append_put_remove_and_reopen(tmp_path):
+    store = open_store(tmp_path)
+    fill(store)
+    store.remove("first-1")
+    store.remove("unknown")
+    assert store.text("first-0") == FIRST[:15]
+    assert store.text("first-1") is None
+    assert "first-1" not in store and len(store) == 3
+
+    # A freed slot is reused
+    store.put("first-2", "first.md", *store.find("SAVE20", 0, len(FIRST)))
+    assert store.text("first-2") == "SAVE20"
+    expected = texts(store)
+    store.save()
+    store.close()
+
+    reopened = open_store(tmp_path)
+    try:
+        assert reopened.loaded
+        assert texts(reopened) == expected
+        assert len(reopened._chunk_ids) == 4
+    finally:
+        reopened.close()
+
+
+def test_unsaved_appends_are_dropped_on_reopen(tmp_path):
+    store = open_store(tmp_path)
+    fill(store)
+    store.save()
+    expected = texts(store)
+    size = store.stats()['data_bytes']
+    store.add("unsaved", "first.md", "Appended by a build that never saved")
+    store.close()
+
+    reopened = open_store(tmp_path)
+    try:
+        assert texts(reopened) == expected
+        # The next append overwrites the orphaned bytes
+        reopened.add("later", "first.md", "x")
+        assert reopened.stats()['data_bytes'] == size + 1
+    finally:
+        reopened.close()
+
+
+@pytest.mark.parametrize("removed, compacted", [
+    pytest.param(["first-0", "first-1", "loose"], True, id="below-half-live"),
+    pytest.param(["loose"], False, id="mostly-live"),
+])
+def test_compaction_at_half_live_bytes(tmp_path, removed, compacted):
+    store = open_store(tmp_path)
+    fill(store)
+    store.save()
+    old_path, old_size = store.data_path, store.stats()['data_bytes']
+    for chunk_id in removed:
+        store.remove(chunk_id)
+    expected = texts(store)
+
+    store.save()
+
+    stats = store.stats()
+    assert (stats['data_bytes'] < old_size) == compacted
+    assert os.path.exists(old_path) != compacted
+    if compacted:
+        assert stats['data_bytes'] == stats['live_bytes']
+    assert texts(store) == expected
+    store.close()
+
+    reopened = open_store(tmp_path)
+    try:
+        assert texts(reopened) == expected
+        assert reopened.stats()['data_bytes'] == stats['data_bytes']
+    finally:
+        reopened.close()
+
+
+@pytest.mark.parametrize("crash_at", ["slots", "metadata"])
+def test_reopen_after_an_interrupted_save(tmp_path, monkeypatch, crash_at):
+    store = open_store(tmp_path)
+    fill(store)
+    store.save()
+    saved = texts(store)
+    # Moves an existing chunk, so the slots change without changing in number
+    store.put("first-0", "first.md", *store.append_text(["Moved to a new copy"]))
+    store.add("new", "second.md", "Added after the last save")
+
+    def crash(*args, **kwargs):
+        raise KeyboardInterrupt("killed")
+
+    if crash_at == "slots":
+        monkeypatch.setattr(corpus_store.np, "save", crash)
+    else:
+        monkeypatch.setattr(corpus_store.os, "replace", crash)
+    with pytest.raises(KeyboardInterrupt):
+        store.save()
+    monkeypatch.undo()
+    store.close()
+
+    reopened = open_store(tmp_path)
+    try:
+        assert texts(reopened) == saved
+        # Saving again after the crash works and leaves one slot file behind besides the previous one
+        reopened.add("new", "second.md", "Added after the crash")
+        reopened.save()
+        assert len([name for name in os.listdir(tmp_path) if name.startswith("corpus.slots.")]) == 2
+    finally:
+        reopened.close()
+
+    reopened = open_store(tmp_path)
+    try:
+        assert texts(reopened) == dict(saved, new=("second.md", "Added after the crash"))
+    finally:
+        reopened.close()
+
+
+def test_failed_flush_removes_its_corpus_entries(tmp_path):
+    engine = make_engine(str(tmp_path), "flat", False)
+    docs = load_support_docs()
+    try:
+        engine.build_knowledge_base(docs[:-1])
+        before = set(engine.corpus.ids())
+
+        def fail(*args, **kwargs):
+            raise RuntimeError("embedding failed")
+
+        engine.vector_store.add = fail
+        with pytest.raises(RuntimeError):
+            engine.build_knowledge_base(docs)
+
+        # No chunk of the document that failed to embed is left without its vector
+        assert set(engine.corpus.ids()) == before == set(engine.vector_store.ids())
+        assert docs[-1]['filename'] not in {engine.corpus.source(chunk_id) for chunk_id in engine.corpus.ids()}
+    finally:
+        close_engine(engine)
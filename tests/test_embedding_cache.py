@@ -0,0 +1,33 @@
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+from backend.embedding_cache import CachedEmbeddings
+
+
+class PromptedEmbeddings(Embeddings):
+    """Embeds queries and documents differently, like models with a query prompt"""
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls.append(('documents', list(texts)))
+        return [[1.0, float(len(text))] for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        self.calls.append(('query', text))
+        return [0.0, float(len(text))]
+
+
+def test_queries_and_documents_have_separate_entries(tmp_path):
+    model = PromptedEmbeddings()
+    cache = CachedEmbeddings(model, "prompted", str(tmp_path / "embeddings.sqlite3"))
+
+    assert cache.embed_documents(["SAVE15", "SAVE20"]) == [[1.0, 6.0], [1.0, 6.0]]
+    assert cache.embed_query("SAVE15") == [0.0, 6.0]
+    assert cache.embed_query("SAVE15 ") == [0.0, 6.0]
+    assert cache.embed_documents(["SAVE15"]) == [[1.0, 6.0]]
+
+    assert model.calls == [('documents', ["SAVE15", "SAVE20"]), ('query', "SAVE15")]
+    assert (cache.hits, cache.misses) == (2, 3)
@@ -0,0 +1,83 @@
+import itertools
+
+import pytest
+
+from backend.lexical_index import BM25Index, identifier_tokens
+from benchmarks.corpus import load_support_docs
+from tests.test_vector_backends import BACKENDS, close_engine, make_engine
+
+RARE_DOC = {
+    'filename': "payment_errors.md",
+    'content': "## Payment Errors\n\nError code PX-4471Q means the card issuer declined the payment. "
+               "Ask the customer to use another card or to contact their bank.\n"
+}
+
+
+@pytest.fixture(params=BACKENDS)
+def engine(request, tmp_path):
+    vector_backend, vector_quantize = request.param
+    engine = make_engine(str(tmp_path), vector_backend, vector_quantize)
+    engine.build_knowledge_base(load_support_docs() + [RARE_DOC])
+    yield engine
+    close_engine(engine)
+
+
+@pytest.fixture
+def empty_engine(tmp_path):
+    engine = make_engine(str(tmp_path), "flat", False)
+    yield engine
+    close_engine(engine)
+
+
+def result(source: str, chunk_id: int) -> dict:
+    return {'source': source, 'chunk_id': chunk_id, 'content': f"{source} #{chunk_id}", 'score': 1.0}
+
+
+def ranked(results):
+    return [(r['source'], r['chunk_id']) for r in results]
+
+
+def test_identifier_tokens():
+    assert identifier_tokens("Apply SAVE15 at api/v1/cart, then check customer-email and total") == \
+        ["save15", "api/v1/cart", "customer-email"]
+
+
+def test_exact_matches_only_for_rare_identifiers():
+    index = BM25Index()
+    index.add("a", "Code SAVE15 gives 15% off", {})
+    index.add("b", "Code SAVE20 gives 20% off", {})
+    for chunk_id in "cde":
+        index.add(chunk_id, "Shipping to zone-1 is free", {})
+
+    assert index.exact_matches("Does SAVE15 work?", max_chunks=2) == {"a"}
+    # Plain words and identifiers common to many chunks are not exact matches
+    assert index.exact_matches("Does code work in zone-1?", max_chunks=2) == set()
+    assert index.exact_matches("Shipping to zone-1", max_chunks=3) == {"c", "d", "e"}
+
+
+def test_rare_exact_token_ranks_its_chunk_first(engine):
+    query = "what does PX-4471Q mean at checkout payment"
+    context = engine.retrieve_context(query, k=5)
+
+    assert (context[0]['source'], context[0]['chunk_id']) == (RARE_DOC['filename'], 0)
+    # Batched retrieval ranks the same way
+    assert ranked(engine.retrieve_context_batch([query], k=5)[0]) == ranked(context)
+
+
+def test_fuse_prefers_results_in_both_rankings(empty_engine):
+    dense = [result("a.md", 0), result("b.md", 0), result("c.md", 0)]
+    lexical = [result("c.md", 0), result("d.md", 0)]
+
+    assert ranked(empty_engine._fuse(dense, lexical, k=2)) == [("c.md", 0), ("a.md", 0)]
+
+
+def test_fuse_order_is_deterministic_on_ties(empty_engine):
+    # b.md leads the dense ranking and a.md the lexical one, each third in the other: their fused scores tie
+    dense = [result("b.md", 0), result("d.md", 0), result("a.md", 0)]
+    lexical = [result("a.md", 0), result("c.md", 0), result("b.md", 0)]
+    expected = [("a.md", 0), ("b.md", 0), ("c.md", 0), ("d.md", 0)]
+
+    fused = empty_engine._fuse(dense, lexical, k=4)
+    assert fused[0]['score'] == fused[1]['score'] and fused[2]['score'] == fused[3]['score']
+    for rankings in itertools.permutations([dense, lexical]):
+        assert ranked(empty_engine._fuse(*rankings, k=4)) == expected
@@ -0,0 +1,83 @@
+import asyncio
+import json
+import re
+
+import pytest
+
+from backend import sharding
+from backend.llm_client import LLMError
+from backend.sharding import extract_features, plan_shards
+from benchmarks.corpus import SAMPLE_TEST_CASE, load_support_docs
+from benchmarks.stubs import StubLLMClient
+from tests.test_vector_backends import close_engine, make_engine
+
+FOCUS = re.compile(r'FOCUS: Only test (.+?); other features')
+
+
+def make_test_case(scenario: str, **fields) -> dict:
+    return dict(SAMPLE_TEST_CASE, test_scenario=scenario, test_steps=[f"Check {scenario}"], **fields)
+
+
+def test_merging_shards_drops_duplicates_and_renumbers():
+    merger = sharding.TestSuiteMerger(limit=10)
+    first = merger.add([make_test_case("Apply SAVE15", test_id="TC-001"), make_test_case("Remove code", test_id="TC-002")])
+    # Each shard numbers its own test cases from TC-001; the second one repeats a scenario
+    second = merger.add([
+        make_test_case("Apply SAVE15", test_id="TC-001", expected_result="Discount shown"),
+        make_test_case("Expired code", test_id="TC-002"),
+        make_test_case("Stacked codes", test_id="TC-003"),
+    ])
+
+    assert [tc['test_id'] for tc in first + second] == ["TC-001", "TC-002", "TC-003", "TC-004"]
+    assert [tc['test_scenario'] for tc in merger.test_cases] == \
+        ["Apply SAVE15", "Remove code", "Expired code", "Stacked codes"]
+    assert merger.duplicates == 1
+    assert merger.missing == 6
+
+
+@pytest.mark.parametrize("num_cases, shard_size, features", [
+    (10, 10, ["Discount Code"]),
+    (50, 10, ["Discount Code", "Shipping", "Payment"]),
+    (23, 5, ["Discount Code", "Shipping"]),
+    (37, 8, [f"Feature {i}" for i in range(12)]),
+    (7, 3, []),
+])
+def test_plan_shards_splits_num_cases_exactly(num_cases, shard_size, features):
+    shards = plan_shards("checkout", num_cases, shard_size, features)
+
+    assert sum(shard['num_cases'] for shard in shards) == num_cases
+    assert all(0 < shard['num_cases'] <= shard_size for shard in shards)
+    covered = {feature for shard in shards for feature in shard['features']}
+    assert covered == set(features or ["checkout"])
+
+
+def test_failing_shard_still_yields_the_others(tmp_path):
+    engine = make_engine(str(tmp_path), "flat", False)
+    engine.build_knowledge_base(load_support_docs())
+    num_cases, shard_size = 12, 4
+    plan_docs = engine.retrieve_context("checkout", engine.SHARD_PLAN_K)
+    shards = plan_shards("checkout", num_cases, shard_size, extract_features(plan_docs))
+    failing = ", ".join(shards[1]['features'])
+
+    def respond(prompt: str) -> str:
+        focus = FOCUS.search(prompt).group(1)
+        if focus == failing:
+            raise LLMError("connection refused")
+        count = int(re.search(r'EXACTLY (\d+)', prompt).group(1))
+        return json.dumps({'test_cases': [make_test_case(f"{focus} {i}") for i in range(count)]})
+
+    engine.llm_client = StubLLMClient(respond)
+
+    async def collect():
+        return [tc async for tc in engine._astream_sharded("checkout", num_cases, shard_size, use_cache=False)]
+
+    try:
+        test_cases = asyncio.run(collect())
+    finally:
+        close_engine(engine)
+
+    assert [tc['test_id'] for tc in test_cases] == [f"TC-{i:03d}" for i in range(1, num_cases + 1)]
+    for i, shard in enumerate(shards):
+        focus = ", ".join(shard['features'])
+        generated = [tc for tc in test_cases if tc['test_scenario'].startswith(f"{focus} ")]
+        assert len(generated) == (0 if i == 1 else shard['num_cases'])
@@ -0,0 +1,126 @@
+import json
+
+import pytest
+
+from backend import json_stream
+from backend.json_stream import loads_lenient, salvage_test_cases
+from backend.test_case_schema import normalize_test_case
+from benchmarks.corpus import SAMPLE_TEST_CASE, load_support_docs
+from benchmarks.stubs import StubLLMClient
+from tests.test_vector_backends import close_engine, make_engine
+
+
+def case_json(scenario: str) -> str:
+    # Distinct steps too, so test cases are not deduplicated against each other
+    return json.dumps(dict(SAMPLE_TEST_CASE, test_scenario=scenario, test_steps=[f"Check {scenario}"]))
+
+
+A, B, C = case_json("A"), case_json("B"), case_json("C")
+
+
+@pytest.mark.parametrize("text, scenarios", [
+    pytest.param(f'{{"test_cases": [{A}, {B}]}}', ["A", "B"], id="complete"),
+    pytest.param(f'{{"test_cases": [{A}, {B}, {C[:40]}', ["A", "B"], id="truncated-array"),
+    pytest.param(f'{{"test_cases": [{A}, {B[:-1]}, }}, ]}}', ["A", "B"], id="trailing-commas"),
+    pytest.param(f'```json\n[{A}, {B}]\n```', ["A", "B"], id="fenced-array"),
+    pytest.param(f'```json\n{{"test_cases": [{A}]}}\n```', ["A"], id="fenced-object"),
+    pytest.param(f'{{"cases": [{A}, {B}]}}', ["A", "B"], id="other-array-key"),
+    pytest.param(f'Here are the test cases: [\n  {A},\n  {B}\n]', ["A", "B"], id="preamble"),
+    pytest.param(A, ["A"], id="single-test-case"),
+    pytest.param('{"test_cases": [{"test_scenario": "A", "test_ste', [], id="nothing-complete"),
+    pytest.param("Sorry, I cannot help with that.", [], id="no-json"),
+])
+def test_salvage_test_cases(text, scenarios):
+    assert [case['test_scenario'] for case in salvage_test_cases(text)] == scenarios
+
+
+@pytest.mark.parametrize("text", [
+    pytest.param(f'{{"test_cases": [{A}, {B}]}}', id="test-cases-key"),
+    pytest.param(f'```json\n[{A}, {B}]\n```', id="fenced-array"),
+    pytest.param(f'Here are the test cases: [ {A}, {B} ]\nLet me know if you need more.', id="preamble"),
+])
+def test_stream_parser_yields_each_test_case_as_it_completes(text):
+    parser = json_stream.TestCaseStreamParser()
+    completed = []
+    for start in range(0, len(text), 3):
+        for test_case in parser.feed(text[start:start + 3]):
+            completed.append(test_case['test_scenario'])
+            # Each one arrives as soon as its closing brace does
+            assert text[:start + 3].count('}') >= len(completed)
+    assert completed == ["A", "B"]
+    assert parser.finished
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ('{"a": 1}', {'a': 1}),
+    ('{"a": [1, 2,], "b": {"c": 3,},}', {'a': [1, 2], 'b': {'c': 3}}),
+    ('{"a": "x, }"}', {'a': "x, }"}),
+    ('{"a": "line one\nline two"}', {'a': "line one\nline two"}),
+])
+def test_loads_lenient(raw, expected):
+    assert loads_lenient(raw) == expected
+
+
+@pytest.mark.parametrize("data, expected", [
+    pytest.param(
+        {'scenario': "A", 'steps': ["Open cart", "Pay"], 'expected': "Paid"},
+        {'test_scenario': "A", 'test_steps': ["Open cart", "Pay"], 'expected_result': "Paid"},
+        id="aliases"
+    ),
+    pytest.param(
+        {'Test Scenario': "A", 'Test Steps': "Open cart\n\nPay", 'Expected Result': "Paid"},
+        {'test_scenario': "A", 'test_steps': ["Open cart", "Pay"], 'expected_result': "Paid"},
+        id="spaced-names-and-step-string"
+    ),
+    pytest.param(
+        {'test_scenario': "A", 'title': "B", 'test_steps': ["Pay"], 'expected_result': "Paid",
+         'expected': "Ignored"},
+        {'test_scenario': "A", 'test_steps': ["Pay"], 'expected_result': "Paid"},
+        id="proper-name-wins"
+    ),
+    pytest.param(
+        {'id': 7, 'title': "A", 'steps': ["Pay"], 'expected_results': ["Paid", "Receipt sent"], 'type': "Negative"},
+        {'test_id': "7", 'test_scenario': "A", 'test_steps': ["Pay"], 'expected_result': "Paid; Receipt sent",
+         'test_type': "negative"},
+        id="coerced-values"
+    ),
+])
+def test_normalize_test_case(data, expected):
+    test_case = normalize_test_case(data)
+    assert {key: test_case[key] for key in expected} == expected
+    # Optional fields get defaults
+    assert test_case['feature'] == "General"
+
+
+@pytest.mark.parametrize("data", [
+    pytest.param(["not", "an", "object"], id="not-an-object"),
+    pytest.param({'test_scenario': "A", 'expected_result': "Paid"}, id="no-steps"),
+    pytest.param({'test_scenario': " ", 'test_steps': ["Pay"], 'expected_result': "Paid"}, id="blank-scenario"),
+])
+def test_normalize_rejects_non_test_cases(data):
+    with pytest.raises(ValueError):
+        normalize_test_case(data)
+
+
+def test_remainder_prompt_asks_only_for_missing_test_cases(tmp_path):
+    engine = make_engine(str(tmp_path), "flat", False)
+    engine.build_knowledge_base(load_support_docs())
+    prompts = []
+
+    def respond(prompt: str) -> str:
+        prompts.append(prompt)
+        if len(prompts) == 1:
+            # Two complete test cases, then the response is cut off
+            return f'{{"test_cases": [{A}, {B}, {C[:40]}'
+        return json.dumps({'test_cases': [json.loads(case_json(f"R{i}")) for i in range(3)]})
+
+    engine.llm_client = StubLLMClient(respond)
+    try:
+        test_cases = engine.generate_test_cases("discount codes", num_cases=5, use_cache=False)
+    finally:
+        close_engine(engine)
+
+    assert len(prompts) == 2
+    assert "Generate EXACTLY 3 " in prompts[1]
+    assert "Write only the 3 remaining ones" in prompts[1]
+    assert [case['test_scenario'] for case in test_cases] == ["A", "B", "R0", "R1", "R2"]
@@ -0,0 +1,157 @@
+import os
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pytest
+
+from backend.rag_engine import RAGEngine
+from backend.vector_store import VectorStore
+from benchmarks.corpus import QUERIES, load_support_docs
+from benchmarks.stubs import HashEmbeddings
+
+K = 5
+
+BACKENDS = [
+    pytest.param(("chroma", False), id="chroma"),
+    pytest.param(("flat", False), id="flat"),
+    pytest.param(("flat", True), id="flat-int8"),
+]
+
+
+def make_engine(workdir: str, vector_backend: str, vector_quantize: bool) -> RAGEngine:
+    """RAG engine isolated in workdir, with offline hash embeddings"""
+    engine = RAGEngine(
+        ollama_url="http://127.0.0.1:9",
+        persist_directory=os.path.join(workdir, "vector_db"),
+        embedding_cache_path=os.path.join(workdir, "embedding_cache", "embeddings.sqlite3"),
+        llm_cache_path=os.path.join(workdir, "llm_cache", "responses.sqlite3"),
+        vector_backend=vector_backend,
+        vector_quantize=vector_quantize,
+        embedding_local_only=True
+    )
+    engine._embeddings = HashEmbeddings()
+    return engine
+
+
+def close_engine(engine: RAGEngine):
+    engine.close_knowledge_base()
+    engine.executor.shutdown()
+
+
+def top_k(engine: RAGEngine, query: str, k: int = K) -> List[Tuple[str, int]]:
+    """(source, chunk_id) of the k best chunks, best first"""
+    return [
+        (doc.metadata['source'], doc.metadata['chunk_id'])
+        for doc, _ in engine.vector_store.search(query, k)
+    ]
+
+
+def exact_top_k(engine: RAGEngine, query: str, k: int = K) -> List[Tuple[str, int]]:
+    """The same ranking computed by brute force over the stored chunks in float32"""
+    _, texts, metadatas = engine.vector_store.get_all()
+    embeddings = HashEmbeddings()
+    vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    scores = vectors @ np.asarray(embeddings.embed_query(query), dtype=np.float32)
+    order = np.argsort(-scores, kind='stable')[:k]
+    return [(metadatas[i]['source'], metadatas[i]['chunk_id']) for i in order]
+
+
+def sources(engine: RAGEngine) -> Dict[str, int]:
+    """Number of stored chunks per source"""
+    counts: Dict[str, int] = {}
+    for metadata in engine.vector_store.get_all()[2]:
+        counts[metadata['source']] = counts.get(metadata['source'], 0) + 1
+    return counts
+
+
+@pytest.fixture(params=BACKENDS)
+def engine(request, tmp_path):
+    vector_backend, vector_quantize = request.param
+    engine = make_engine(str(tmp_path), vector_backend, vector_quantize)
+    engine.build_knowledge_base(load_support_docs())
+    yield engine
+    close_engine(engine)
+
+
+def test_top_k_matches_exact_ranking(engine):
+    for query in QUERIES:
+        assert top_k(engine, query) == exact_top_k(engine, query), query
+
+
+def test_relevance_is_descending(engine):
+    for query in QUERIES:
+        scores = [score for _, score in engine.vector_store.search(query, K)]
+        assert scores == sorted(scores, reverse=True)
+
+
+def test_editing_one_document_re_embeds_only_it(engine):
+    docs = load_support_docs()
+    before = sources(engine)
+    edited = docs[0]['filename']
+    docs[0] = {
+        'filename': edited,
+        'content': docs[0]['content'] + "\n\nGift wrapping is offered as a zephyrine add-on.\n"
+    }
+
+    engine.build_knowledge_base(docs)
+
+    assert engine.last_build_stats['unchanged_sources'] == len(docs) - 1
+    assert engine.last_build_stats['chunks_added'] >= 1
+    after = sources(engine)
+    assert {source: count for source, count in after.items() if source != edited} == \
+        {source: count for source, count in before.items() if source != edited}
+    assert top_k(engine, "zephyrine gift wrapping", k=1)[0][0] == edited
+    for query in QUERIES:
+        assert top_k(engine, query) == exact_top_k(engine, query), query
+
+
+def test_removing_a_document(engine):
+    docs = load_support_docs()
+    removed = docs.pop()['filename']
+
+    total = engine.build_knowledge_base(docs)
+
+    assert removed not in sources(engine)
+    assert len(engine.vector_store.ids()) == total
+    for query in QUERIES:
+        results = top_k(engine, query)
+        assert removed not in {source for source, _ in results}
+        assert results == exact_top_k(engine, query), query
+
+
+def test_reopening_from_disk(engine, tmp_path):
+    expected = {query: top_k(engine, query) for query in QUERIES}
+    num_chunks = len(engine.vector_store.ids())
+    close_engine(engine)
+
+    reopened = make_engine(str(tmp_path), engine.vector_backend, engine.vector_quantize)
+    try:
+        assert reopened.load_knowledge_base() == num_chunks
+        for query in QUERIES:
+            assert top_k(reopened, query) == expected[query], query
+
+        # An unchanged rebuild after reopening embeds nothing
+        reopened.build_knowledge_base(load_support_docs())
+        assert reopened.last_build_stats['chunks_added'] == 0
+    finally:
+        close_engine(reopened)
+
+
+def test_int8_rescoring_matches_float32(engine, tmp_path):
+    quantized = make_engine(str(tmp_path / "int8"), "flat", True)
+    try:
+        quantized.build_knowledge_base(load_support_docs())
+        assert quantized.vector_store.quantize
+        for query in QUERIES:
+            assert top_k(quantized, query) == top_k(engine, query), query
+    finally:
+        close_engine(quantized)
+
+
+def test_incomplete_backend_fails_at_construction():
+    class SearchOnlyStore(VectorStore):
+        def search(self, query, k, filters=None):
+            return []
+
+    with pytest.raises(TypeError):
+        SearchOnlyStore()
@@ -0,0 +1,91 @@
+import os
+
+import pytest
+
+from backend.document_processor import DocumentProcessor
+from backend.jobs import BuildJob
+from backend.state_store import StateStore
+from backend.workspaces import WorkspaceManager
+from benchmarks.corpus import load_support_docs
+from tests.test_vector_backends import close_engine, make_engine
+
+
+@pytest.fixture
+def workers(tmp_path):
+    """Two workspace managers over one state store, standing in for two worker processes"""
+    engine = make_engine(str(tmp_path), "flat", False)
+    root = str(tmp_path / "workspaces")
+    managers = [
+        WorkspaceManager(
+            engine, DocumentProcessor(str(tmp_path / "uploads")), root,
+            store=StateStore(os.path.join(root, "state.sqlite3"))
+        )
+        for _ in range(2)
+    ]
+    yield managers
+    for manager in managers:
+        manager.close()
+    close_engine(engine)
+
+
+def build(manager: WorkspaceManager, workspace_id: str):
+    workspace = manager.acquire(workspace_id)
+    try:
+        workspace.record_upload(load_support_docs())
+        workspace.build_knowledge_base(workspace.doc_processor.documents)
+    finally:
+        manager.release(workspace)
+
+
+def trash(manager: WorkspaceManager):
+    directory = os.path.join(manager.root, ".trash")
+    return os.listdir(directory) if os.path.isdir(directory) else []
+
+
+def test_delete_is_seen_by_other_workers(workers):
+    first, second = workers
+    build(first, "team")
+    workspace = first.acquire("team")
+    first.release(workspace)
+
+    assert second.delete("team")
+
+    # The first worker still has the deleted incarnation loaded, so its files are kept
+    assert not os.path.exists(os.path.join(second.root, "team"))
+    assert len(trash(second)) == 1
+    assert "team" not in second.store.workspace_ids()
+
+    workspace = first.acquire("team")
+    try:
+        assert workspace.incarnation == 1
+        assert not workspace.knowledge_base_built
+        assert workspace.doc_processor.documents == []
+    finally:
+        first.release(workspace)
+    assert trash(first) == []
+
+
+def test_delete_refuses_while_a_build_is_queued(workers):
+    first, second = workers
+    build(first, "team")
+    job = BuildJob("team")
+    job.store = first.store
+    job.persist(force=True)
+
+    assert not second.delete("team")
+    assert os.path.exists(os.path.join(second.root, "team"))
+
+    job._finish('cancelled')
+    assert second.delete("team")
+
+
+def test_deleted_copy_cannot_build(workers):
+    first, second = workers
+    build(first, "team")
+    workspace = first.acquire("team")
+    try:
+        assert second.delete("team")
+        with pytest.raises(RuntimeError):
+            workspace.build_knowledge_base(load_support_docs())
+    finally:
+        first.release(workspace)